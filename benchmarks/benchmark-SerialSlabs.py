@@ -6,17 +6,23 @@ Created on Mon Jan 25 20:40:25 2021
 
 Line-of-sight benchmark
 
+Outside of asv, run it as a module from the repository root (relative
+imports) : ``python -m benchmarks.benchmark-SerialSlabs``
+
 """
 
 from numpy import zeros
 from radis import calc_spectrum, SerialSlabs
 from time import time
 
+from .los import serial_slabs_batched, serial_slabs_numba, stack_slabs
+
 class LineOfSight_Benchmark:
     """
     Small performance test for LOS functions with multiple spectra
 
-    Benchmarks :py:func:`radis.los.slabs.SerialSlabs`
+    Benchmarks :py:func:`radis.los.slabs.SerialSlabs`, and the batched
+    engine of :py:mod:`benchmarks.los` on the same spectra
     """
 
     def setup(self):
@@ -33,6 +39,10 @@ class LineOfSight_Benchmark:
                           )
         self.s_list =  [s.copy()]*100
 
+        # arrays stacked once, reused by the batched engine
+        self.R, self.T = stack_slabs(self.s_list)
+        serial_slabs_numba(self.R, self.T)  # compile outside of the timed region
+
     def time_SerialSlabs(self):
 
         SerialSlabs(*self.s_list, modify_inputs=False)  # modify_inputs=True
@@ -41,6 +51,22 @@ class LineOfSight_Benchmark:
 
         SerialSlabs(*self.s_list, modify_inputs=False)  # modify_inputs=True)
 
+    def time_SerialSlabs_batched(self):
+
+        serial_slabs_batched(self.R, self.T)
+
+    def peakmem_SerialSlabs_batched(self):
+
+        serial_slabs_batched(self.R, self.T)
+
+    def time_SerialSlabs_numba(self):
+
+        serial_slabs_numba(self.R, self.T)
+
+    def time_stack_slabs(self):
+
+        stack_slabs(self.s_list)
+
 
 
 #%% Test : Compare to simple LOS
@@ -56,7 +82,6 @@ if __name__ == '__main__':
     t0 = time()
     LOS.time_SerialSlabs()
     print(f'SerialSlabs in {time()-t0:.2f}s')
-    # print(s_los.get('radiance_noslit')[1])
 
 
     # %% Compare to naive version (without unit conversions / etc, so very efficient !)
@@ -69,7 +94,11 @@ if __name__ == '__main__':
         I = I * ti + ri
 
     print(f'Simple LOS in {time()-t0:.2f}s')
-    # print(I)
+
+    # %% Batched engine (arrays stacked once in setup)
+    t0 = time()
+    LOS.time_SerialSlabs_batched()
+    print(f'Batched LOS in {time()-t0:.2f}s')
 
     # %% Jit  (but actually slower than pure Python?):
 
@@ -2,22 +2,41 @@
 # See "Writing benchmarks" in the asv docs for more information.
 
 import os
-import re
-import sys
+from time import perf_counter
 
-from numpy import floor, log10, round
-from psutil import virtual_memory
+import pandas as pd
+from numpy import linspace
 
-from radis import SpectrumFactory, calc_spectrum, get_version
+from radis import calc_spectrum
 from radis.lbl.factory import _generate_broadening_range
 from radis.misc.printer import printm
 
 from packaging.version import parse
 
-
-def digits(x, n=1):
-    """ Round x to n digits """
-    return round(x * 10 ** (-floor(log10(x))), n - 1) * 10 ** (floor(log10(x)))
+from .cache import CacheManager, get_cache_folders
+from .compat import (
+    IfSupported,
+    build_factory,
+    radis_version,
+    require,
+    resolve_options,
+    translate_options,
+)
+from .chunks import (
+    estimate_broadening_memory,
+    get_memory_budget,
+    measure_broadening_memory,
+    plan_chunksize,
+)
+from .lines import drop_unassigned_lines, take_assigned_lines
+from .memprofile import MemoryTracer, save_memory_profile
+from .sweep import TemperatureSweep
+from .synthetic import (
+    get_synthetic_databank,
+    get_synthetic_lines_count,
+    use_synthetic_databank,
+    write_databank,
+)
 
 
 class CO2_HITRAN:
@@ -28,7 +47,7 @@ class CO2_HITRAN:
     """
 
     def setup(self):
-        self.test_options = opt = {
+        opt = {
             "wavelength_min": 4165,
             "wavelength_max": 4200,
             "databank": "hitran",  # not appropriate for these temperatures, but convenient for automatic testing
@@ -43,7 +62,7 @@ class CO2_HITRAN:
             "cutoff": 1e-25,
             "use_cached": True,
             "medium": "vacuum",
-            "optimization": "simple",
+            "optimization": IfSupported("simple"),  # legacy broadening before LDM
             "export_lines": False,
             "warnings": {
                 "MissingSelfBroadeningWarning": "ignore",
@@ -51,57 +70,30 @@ class CO2_HITRAN:
                 "HighTemperatureWarning": "ignore",
             },
         }
-
-        # Backward compatibility
-        # ----------------------
-
-        # Old version of RADIS do not necessary work with the latest parameters
-        # Fix it :
-        version = parse(get_version(add_git_number=False))
-        if version < parse("0.9.26"):
-            del self.test_options["optimization"]
+        # options of the installed RADIS version, see benchmarks.compat
+        self.test_options = resolve_options(calc_spectrum, translate_options(opt))
 
         # Also fix problems with cache files :
 
         # First run to check there are no problems with Line database cache-files
         # ... Note @dev : as of 0.9.26 encountering a cache file generated with a future version
-        # ... raises an error with no option to automatically regenerate the cache file
-        sf = SpectrumFactory(
-            **{
+        # ... raises an error with no option to automatically regenerate the cache file :
+        # ... files of other versions are set aside first, see benchmarks.cache
+        sf = build_factory(
+            {
                 k: v
                 for (k, v) in opt.items()
-                if k
-                in [
-                    "wavelength_min",
-                    "wavelength_max",
-                    "molecule",
-                    "isotope",
-                    "broadening_max_width",
-                    "medium",
-                ]
+                if k in ["wavelength_min", "wavelength_max", "molecule", "isotope", "medium"]
             }
         )
 
-        for attempt in range(15):  # max number of failed cache files
-            try:
-                sf.fetch_databank()
-            except ValueError as err:
-                if "generated with a future version" in str(err):
-                    # Get failing cache file :
-                    fcache = re.search(
-                        r"(?<=Cache file \().*(?=\) generated)", str(err)
-                    )
-                    if fcache is not None:
-                        fcache = fcache.group()
-                        printm(
-                            "Backward compatibility : regenerating cache file",
-                            fcache,
-                        )
-                        os.remove(fcache)
-                        continue
-                raise
-            else:
-                break
+        # held until teardown : the timed calc_spectrum reads the cache files
+        # (use_cached), that other versions must not move meanwhile
+        self.caches = CacheManager(get_cache_folders()).acquire()
+        sf.fetch_databank()
+
+    def teardown(self):
+        self.caches.release()
 
     def time_noneq_spectrum(self):
 
@@ -117,11 +109,20 @@ class CO2_HITEMP:
     Performance test with CO2 HITEMP (2000 - 2250 cm-1 :  ~ 1.5 Million lines )
 
     Based on the test in :py:func:`radis.test.lbl.test_factory.test_spec_generation`
+
+    Set ``RADIS_BENCHMARK_DATABANK=synthetic`` to run on a synthetic line list
+    of the same size instead (no download) : see :py:mod:`benchmarks.synthetic`
     """
     timeout = 3600
 
-    def setup(self):
-        self.test_options = opt = {
+    def setup_cache(self):
+        """Load the line database once per environment
+
+        Lines are checked, then written in a single binary HDF5 file that
+        ``setup`` reads back before each repeat (instead of fetching and
+        merging the original databank files every time).
+        """
+        opt = {
             "wavenum_min": 2000,
             "wavenum_max": 2250,
             "molecule": "CO2",
@@ -135,250 +136,405 @@ class CO2_HITEMP:
             "databank": "hitemp",
         }
 
-        # Backward compatibility
-        # ----------------------
+        # Options are those of the latest RADIS version : older versions get
+        # them translated by benchmarks.compat
 
-        # Old version of RADIS do not necessary work with the latest parameters
-        # Fix it :
-        version = parse(get_version(add_git_number=False))
+        if use_synthetic_databank():
+            # offline : seeded synthetic line list, generated once and reused
+            require("0.10.1", "hitemp-radisdb format")
+            n_lines = get_synthetic_lines_count()
+            opt.update({
+                "path": get_synthetic_databank(n_lines, opt["wavenum_min"], opt["wavenum_max"]),
+                "dbformat": "hitemp-radisdb",
+            })
+            del opt["databank"]
 
-        if version < parse("0.10.1"):
+        elif radis_version() < parse("0.10.1"):
             # no automatic download of CO2
+            n_lines = 1487262
             opt.update({
                 "path": [
                     r"D:\Dropbox\Data ECP\14_Databases\CDSD-HITEMP\cdsd_hitemp_07",
                     r"D:\Dropbox\Data ECP\14_Databases\CDSD-HITEMP\cdsd_hitemp_08",
                     r"D:\Dropbox\Data ECP\14_Databases\CDSD-HITEMP\cdsd_hitemp_09",
                 ],
-                "use_cached": True,
+                "db_use_cached": True,
                 "dbformat": "cdsd-hitemp",
             })
             del opt["databank"]
-            
-        if version < parse("0.10.1"):
-            # "broadening_max_width" changed to 'truncation' & neighbour_lines
-            opt["broadening_max_widith"] = opt["truncation"]
-            # del opt["truncation"]
-            del opt["neighbour_lines"]
-            
-        if version < parse("0.9.21"):
-            # format name changed
-            opt["dbformat"] = "cdsd"
-
-        # Chunksize : number of lines to proceed at the same time (doestn apply if LDM)
-        if opt["chunksize"] == "auto":
-            opt["chunksize"] = digits(
-                virtual_memory().available
-                / sys.getsizeof(
-                    _generate_broadening_range(
-                        opt["wstep"], opt["truncation"]
-                    )
-                ),
-                n=1,
-            )
-            printm("chunksize auto : ", opt["chunksize"])
+
+        else:
+            n_lines = 1464035
 
         # Also fix problems with cache files :
 
         # First run to check there are no problems with Line database cache-files
         # ... Note @dev : as of 0.9.26 encountering a cache file generated with a future version
-        # ... raises an error with no option to automatically regenerate the cache file
-        sf = SpectrumFactory(
-            **{
-                k: opt[k]
-                for k in [
-                    "wavenum_min",
-                    "wavenum_max",
-                    "molecule",
-                    "isotope",
-                    "wstep",
-                    "cutoff",
-                    "verbose",
-                ]
-            }
-        )
+        # ... raises an error with no option to automatically regenerate the cache file :
+        # ... files of other versions are set aside first, see benchmarks.cache
+        with CacheManager(get_cache_folders(opt.get("path", []))) as caches:
+            if opt.get("dbformat") == "cdsd-hitemp":
+                # local files : regenerate the missing cache files in parallel
+                caches.regenerate(opt["path"], "cdsd2df")
+            sf = _hitemp_factory(dict(opt, chunksize=None), n_lines=n_lines)
+
+        # Chunksize : number of lines * spectral points broadened at the same time,
+        # the largest that fits in the memory budget (RADIS_BENCHMARK_MEMORY_BUDGET)
+        if radis_version() < parse("0.10.1"):
+            # cannot measure the broadening step : estimate
+            broadening_max_width = translate_options(opt)["broadening_max_width"]
+            bytes_per_line, fixed_bytes = estimate_broadening_memory(
+                len(_generate_broadening_range(opt["wstep"], broadening_max_width))
+            )
+            n_wavenumber = int((opt["wavenum_max"] - opt["wavenum_min"]) / opt["wstep"]) + 1
+        else:
+            bytes_per_line, fixed_bytes = measure_broadening_memory(sf)
+            n_wavenumber = len(sf.wavenumber)
+        chunk_memory = {
+            "bytes_per_line": bytes_per_line,
+            "fixed_bytes": fixed_bytes,
+            "n_wavenumber": n_wavenumber,
+        }
+        if opt["chunksize"] == "auto":
+            budget = get_memory_budget()
+            opt["chunksize"] = plan_chunksize(budget, n_lines=len(sf.df0), **chunk_memory)
+            printm("chunksize for a memory budget of {0:.1e} B : ".format(budget), opt["chunksize"])
 
-        for attempt in range(15):  # max number of failed cache files
-            try:
-                if "databank" in opt:
-                    sf.fetch_databank(opt["databank"],  # hitemp
-                            parfuncfmt="hapi",
-                            levelsfmt="radis",) 
-                else:
-                    sf.load_databank(
-                        path=opt["path"],
-                        format=opt["dbformat"],
-                        parfuncfmt="hapi",
-                        levelsfmt="radis",
-                    )
-            except ValueError as err:
-                if "generated with a future version" in str(err):
-                    # Get failing cache file :
-                    fcache = re.search(
-                        r"(?<=Cache file \().*(?=\) generated)", str(err)
-                    )
-                    if fcache is not None:
-                        fcache = fcache.group()
-                        printm(
-                            "Backward compatibility : regenerating cache file",
-                            fcache,
-                        )
-                        os.remove(fcache)
-                        continue
-                raise
-            else:
-                break
-
-    def time_eq_spectrum(self):
-        # Note @ dev:  can't use calc_spectrum directly because it cannot
-        # read a custom database
-        opt = self.test_options
-
-        sf = SpectrumFactory(
-            **{
-                # Default parameters added in SpectrumFactory :
-                k: opt[k]
-                for k in [
-                    "wavenum_min",
-                    "wavenum_max",
-                    "molecule",
-                    "isotope",
-                    "wstep",
-                    "cutoff",
-                    "verbose",
-                    "chunksize",
-                ]
-            }
-        )
-        # Load databank:
-        if "databank" in opt:
-            sf.fetch_databank(opt["databank"],  # auto-downloaded hitemp
-                    parfuncfmt="hapi",
-                    levelsfmt="radis",) 
-            assert len(sf.df0) == 1464035  #small change with <0.10.1, doesnt change the benchmarks significantly
+        if radis_version() < parse("0.10.1"):
+            # hitemp-radisdb format not supported : reload from original files
+            path = path_noneq = None
         else:
-            sf.load_databank(
-                path=opt["path"],
-                format=opt["dbformat"],
-                parfuncfmt="hapi",
-                levelsfmt="radis",
+            path = write_databank(sf.df0, os.path.abspath("CO2_HITEMP.h5"))
+            # non-equilibrium : lines with a vibrational assignment only, filtered once here
+            path_noneq = write_databank(
+                take_assigned_lines(sf.df0), os.path.abspath("CO2_HITEMP_noneq.h5")
             )
-            assert len(sf.df0) == 1487262  # number of lines
-        sf.eq_spectrum(Tgas=1700)
-
-    def peakmem_eq_spectrum(self):
-        opt = self.test_options
-        sf = SpectrumFactory(
-            **{
-                k: opt[k]
-                for k in [
-                    "wavenum_min",
-                    "wavenum_max",
-                    "molecule",
-                    "isotope",
-                    "wstep",
-                    "cutoff",
-                    "verbose",
-                    "chunksize",
-                ]
-            }
-        )
-        # Load databank:
-        if "databank" in opt:
-            sf.fetch_databank(opt["databank"],  # auto-downloaded hitemp
-                    parfuncfmt="hapi",
-                    levelsfmt="radis",)
-            assert len(sf.df0) == 1464035  #small change with <0.10.1, doesnt change the benchmarks significantly
+
+        return {
+            "test_options": opt,
+            "path": path,
+            "path_noneq": path_noneq,
+            "n_lines": len(sf.df0),
+            "chunk_memory": chunk_memory,
+        }
+
+    def setup(self, cache):
+        opt = self.test_options = cache["test_options"]
+        if cache["path"] is None:
+            with CacheManager(get_cache_folders(opt.get("path", []))):
+                self.sf = _hitemp_factory(opt, n_lines=cache["n_lines"])
         else:
-            sf.load_databank(
-                path=opt["path"],
-                format=opt["dbformat"],
-                parfuncfmt="hapi",
-                levelsfmt="radis",
+            # lines already loaded and checked in setup_cache : read them back
+            opt = {k: v for (k, v) in opt.items() if k != "databank"}
+            self.sf = _hitemp_factory(
+                dict(opt, path=cache["path"], dbformat="hitemp-radisdb"), n_lines=cache["n_lines"]
             )
-            assert len(sf.df0) == 1487308  # number of lines
-        sf.eq_spectrum(Tgas=1700)
 
-    def time_noneq_spectrum(self):
-        # Note @ dev:  can't use calc_spectrum directly because it cannot
-        # read a custom database
-        opt = self.test_options
-        sf = SpectrumFactory(
-            **{
-                k: opt[k]
-                for k in [
-                    "wavenum_min",
-                    "wavenum_max",
-                    "molecule",
-                    "isotope",
-                    "wstep",
-                    "cutoff",
-                    "verbose",
-                    "chunksize",
-                ]
-            }
-        )
-        # Load databank:
-        if "databank" in opt:
-            sf.fetch_databank(opt["databank"],  # auto-downloaded hitemp
-                    parfuncfmt="hapi",
-                    levelsfmt="radis",) 
-            assert len(sf.df0) == 1464035  #small change with <0.10.1, doesnt change the benchmarks significantly
+    def time_eq_spectrum(self, cache):
+        self.sf.eq_spectrum(Tgas=1700)
+
+    def peakmem_eq_spectrum(self, cache):
+        self.sf.eq_spectrum(Tgas=1700)
+
+
+
+class CO2_HITEMP_NonEq:
+    """
+    Non-equilibrium spectrum of the :py:class:`CO2_HITEMP` case
+
+    Lines without vibrational assignment are removed once in ``setup_cache``
+    and the remaining lines are loaded directly : the timed region only
+    contains the spectrum calculation. See :py:class:`CO2_HITEMP_LineFiltering`
+    for the cost of filtering.
+    """
+    timeout = 3600
+
+    setup_cache = CO2_HITEMP.setup_cache
+
+    def setup(self, cache):
+        opt = self.test_options = cache["test_options"]
+        if cache["path_noneq"] is None:
+            self.sf = _hitemp_factory(opt)
+            drop_unassigned_lines(self.sf)
         else:
-            sf.load_databank(
-                path=opt["path"],
-                format=opt["dbformat"],
-                parfuncfmt="hapi",
-                levelsfmt="radis",
-            )
-            assert len(sf.df0) == 1487262  # number of lines
-        
-        sf.df0.drop(sf.df0.index[sf.df0['v1u']==-1], inplace=True)
-            
-        sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+            opt = {k: v for (k, v) in opt.items() if k != "databank"}
+            self.sf = _hitemp_factory(dict(opt, path=cache["path_noneq"], dbformat="hitemp-radisdb"))
 
-    def peakmem_noneq_spectrum(self):
-        opt = self.test_options
-        sf = SpectrumFactory(
-            **{
-                k: opt[k]
-                for k in [
-                    "wavenum_min",
-                    "wavenum_max",
-                    "molecule",
-                    "isotope",
-                    "wstep",
-                    "cutoff",
-                    "verbose",
-                    "chunksize",
-                ]
-            }
-        )
-        # Load databank:
-        if "databank" in opt:
-            sf.fetch_databank(opt["databank"],  # auto-downloaded hitemp
-                    parfuncfmt="hapi",
-                    levelsfmt="radis",) 
-            assert len(sf.df0) == 1464035  #small change with <0.10.1, doesnt change the benchmarks significantly
+    def time_noneq_spectrum(self, cache):
+        self.sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+
+    def peakmem_noneq_spectrum(self, cache):
+        self.sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+
+
+class CO2_HITEMP_LineFiltering:
+    """
+    Removal of the lines without vibrational assignment from the
+    :py:class:`CO2_HITEMP` line database, with :
+
+    - ``drop`` : ``df.drop(df.index[df.v1u == -1], inplace=True)`` (boolean
+      Series, then index, then copy of all columns)
+    - ``mask`` : boolean indexing ``df[df.v1u != -1]``
+    - ``take`` : :py:func:`~benchmarks.lines.take_assigned_lines`, one integer take per column
+    """
+    timeout = 3600
+    number = 1  # drop modifies the DataFrame : one call per setup
+    warmup_time = 0
+    params = ["drop", "mask", "take"]
+    param_names = ["method"]
+
+    setup_cache = CO2_HITEMP.setup_cache
+
+    def setup(self, cache, method):
+        if cache["path"] is None:
+            raise NotImplementedError("hitemp-radisdb format not supported")
+        self.df = pd.read_hdf(cache["path"], "df")
+
+    def _filter(self, method):
+        df = self.df
+        if method == "drop":
+            df.drop(df.index[df["v1u"] == -1], inplace=True)
+        elif method == "mask":
+            df = df[df["v1u"] != -1]
         else:
-            sf.load_databank(
-                path=opt["path"],
-                format=opt["dbformat"],
-                parfuncfmt="hapi",
-                levelsfmt="radis",
+            df = take_assigned_lines(df)
+        return df
+
+    def time_filter(self, cache, method):
+        self._filter(method)
+
+    def peakmem_filter(self, cache, method):
+        self._filter(method)
+
+
+def _hitemp_factory(opt, n_lines=None):
+    """ Build the :py:class:`~radis.lbl.factory.SpectrumFactory` of :py:class:`CO2_HITEMP` and load its lines """
+    load = {
+        "parfuncfmt": IfSupported("hapi"),  # removed in recent RADIS versions
+        "levelsfmt": "radis",
+        "load_columns": IfSupported("noneq"),  # vibrational levels, for CO2_HITEMP_NonEq
+        "load_energies": IfSupported(True),
+    }
+    return build_factory(dict(load, **opt), n_lines=n_lines)
+
+
+class _CO2_HITEMP_Stage:
+    """
+    Shared setup of the stage benchmarks of :py:meth:`~radis.lbl.factory.SpectrumFactory.eq_spectrum`,
+    on the same case as :py:class:`CO2_HITEMP` :
+
+    - :py:class:`CO2_HITEMP_Load` : databank loading (from cache files)
+    - :py:class:`CO2_HITEMP_Linestrength` : populations and linestrengths at Tgas
+    - :py:class:`CO2_HITEMP_Broadening` : line shift, HWHM and lineshape broadening (LDM or legacy)
+
+    A first ``eq_spectrum`` in ``setup`` initializes the factory (wavenumber
+    grid, diluents, profiler) ; then each stage starts from the state of the
+    previous stages, also computed in ``setup``.
+    Uses private methods of the factory : requires RADIS >= 0.10.1
+    """
+    timeout = 3600
+    number = 1  # stages modify the factory state : one call per setup
+    warmup_time = 0
+    Tgas = 1700
+
+    setup_cache = CO2_HITEMP.setup_cache
+
+    def setup(self, cache, optimization="default"):
+        require("0.10.1", "stage methods")
+        CO2_HITEMP.setup(self, cache)
+        if optimization != "default":
+            self.sf.params.optimization = optimization
+        self.sf.eq_spectrum(Tgas=self.Tgas)
+
+        # new profiler entries, as at the start of eq_spectrum
+        if hasattr(self.sf, "_reset_profiler"):
+            self.sf._reset_profiler(self.sf.verbose)
+            self.sf.profiler.start("spectrum_calculation", 1)
+            self.sf.profiler.start("spectrum_calc_before_obj", 2)
+
+    def _run_linestrength(self):
+        self.sf._reinitialize()
+        self.sf.calc_linestrength_eq(self.Tgas)
+        self.sf._cutoff_linestrength()
+
+    def _run_broadening(self):
+        self.sf._calc_broadening_HWHM()
+        self.sf.calc_lineshift()
+        return self.sf._calc_broadening()  # wavenumber, abscoeff (per molecule)
+
+
+class CO2_HITEMP_Load(_CO2_HITEMP_Stage):
+    """ Databank loading stage of :py:class:`CO2_HITEMP` (cache files already generated) """
+
+    def setup(self, cache):
+        require("0.10.1", "stage methods")
+        self.test_options = cache["test_options"]
+        # held until teardown : the timed loads read the cache files
+        self.caches = CacheManager(get_cache_folders(self.test_options.get("path", []))).acquire()
+
+    def teardown(self, cache):
+        self.caches.release()
+
+    def time_load_databank(self, cache):
+        _hitemp_factory(self.test_options)
+
+    def peakmem_load_databank(self, cache):
+        _hitemp_factory(self.test_options)
+
+
+class CO2_HITEMP_Linestrength(_CO2_HITEMP_Stage):
+    """ Population & linestrength stage of :py:class:`CO2_HITEMP` """
+
+    def time_linestrength(self, cache):
+        self._run_linestrength()
+
+
+class CO2_HITEMP_Broadening(_CO2_HITEMP_Stage):
+    """ Broadening stage of :py:class:`CO2_HITEMP`, with the LDM or the legacy method """
+    params = ["LDM", "legacy"]
+    param_names = ["method"]
+
+    def setup(self, cache, method):
+        _CO2_HITEMP_Stage.setup(self, cache, optimization={"LDM": "simple", "legacy": None}[method])
+        self._run_linestrength()
+
+    def time_broadening(self, cache, method):
+        self._run_broadening()
+
+    def peakmem_broadening(self, cache, method):
+        self._run_broadening()
+
+
+class CO2_HITEMP_TemperatureSweep:
+    """
+    Same case as :py:class:`CO2_HITEMP`, computed at ``n_temperatures`` gas
+    temperatures between 500 K and 2500 K (tabulation jobs).
+
+    Compares :py:class:`~benchmarks.sweep.TemperatureSweep`, that computes the
+    temperature-independent quantities once, to a loop of ``eq_spectrum``.
+    Uses private methods of the factory : requires RADIS >= 0.10.1
+    """
+    timeout = 3600
+    number = 1  # the sweep is prepared on the first call
+    warmup_time = 0
+    params = [1, 5, 20]
+    param_names = ["n_temperatures"]
+
+    setup_cache = CO2_HITEMP.setup_cache
+
+    def setup(self, cache, n_temperatures):
+        require("0.10.1", "stage methods")
+        CO2_HITEMP.setup(self, cache)
+        self.Tgas_list = linspace(500, 2500, n_temperatures)
+        self.sweep = TemperatureSweep(self.sf)
+
+    def time_sweep(self, cache, n_temperatures):
+        self.sweep.sweep(self.Tgas_list)
+
+    def peakmem_sweep(self, cache, n_temperatures):
+        self.sweep.sweep(self.Tgas_list)
+
+    def time_eq_spectrum_loop(self, cache, n_temperatures):
+        for Tgas in self.Tgas_list:
+            self.sf.eq_spectrum(Tgas=Tgas)
+
+    def track_time_per_spectrum(self, cache, n_temperatures):
+        """ Time per temperature, once the sweep is prepared """
+        self.sweep.prepare(self.Tgas_list[0])
+        t0 = perf_counter()
+        self.sweep.sweep(self.Tgas_list)
+        return (perf_counter() - t0) / n_temperatures
+
+    track_time_per_spectrum.unit = "seconds"
+
+    def track_spectra_per_second(self, cache, n_temperatures):
+        """ Throughput, including the preparation of the sweep """
+        t0 = perf_counter()
+        self.sweep.sweep(self.Tgas_list)
+        return n_temperatures / (perf_counter() - t0)
+
+    track_spectra_per_second.unit = "spectra/s"
+
+
+class CO2_HITEMP_MemoryProfile:
+    """
+    Memory breakdown of :py:class:`CO2_HITEMP`, per calculation stage
+
+    Each method traces the calculation of a ``peakmem_*`` benchmark of
+    :py:class:`CO2_HITEMP` or :py:class:`CO2_HITEMP_NonEq` with :py:class:`~benchmarks.memprofile.MemoryTracer`,
+    tracks the peak of traced memory, and stores the stage records and top
+    allocators next to the asv results (see :py:func:`~benchmarks.memprofile.save_memory_profile`).
+    """
+    timeout = 3600
+    number = 1
+    repeat = 1  # tracing is slow, and the breakdown does not need statistics
+    warmup_time = 0
+    unit = "bytes"
+
+    setup_cache = CO2_HITEMP.setup_cache
+
+    def setup(self, cache):
+        CO2_HITEMP.setup(self, cache)
+        # compile the broadening functions before tracing : tracemalloc would
+        # otherwise mostly see (and slow down) numba
+        self.sf.eq_spectrum(Tgas=1700)
+
+    def track_eq_spectrum_traced_peak(self, cache):
+        tracer = MemoryTracer()
+        with tracer:
+            self.sf.eq_spectrum(Tgas=1700)
+        save_memory_profile(tracer, "benchmarks.CO2_HITEMP.peakmem_eq_spectrum")
+        return tracer.total["traced_peak"]
+
+    def track_noneq_spectrum_traced_peak(self, cache):
+        drop_unassigned_lines(self.sf)  # as in CO2_HITEMP_NonEq : not traced
+        tracer = MemoryTracer()
+        with tracer:
+            self.sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+        save_memory_profile(tracer, "benchmarks.CO2_HITEMP_NonEq.peakmem_noneq_spectrum")
+        return tracer.total["traced_peak"]
+
+
+class CO2_HITEMP_ChunkBudget:
+    """
+    :py:class:`CO2_HITEMP` with the chunksize planned for several memory budgets
+    of the broadening step (see :py:mod:`benchmarks.chunks`) : throughput / memory trade-off
+    """
+    timeout = 3600
+    params = [1e9, 2e9, 4e9, 8e9]
+    param_names = ["memory_budget"]
+
+    setup_cache = CO2_HITEMP.setup_cache
+
+    def setup(self, cache, memory_budget):
+        try:
+            self.chunksize = plan_chunksize(
+                memory_budget, n_lines=cache["n_lines"], **cache["chunk_memory"]
             )
-            assert len(sf.df0) == 1487262  # number of lines
-            
-        sf.df0.drop(sf.df0.index[sf.df0['v1u']==-1], inplace=True)
-            
-        sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+        except ValueError as err:  # budget too small for this version
+            raise NotImplementedError(str(err)) from err
+        opt = dict(cache["test_options"], chunksize=self.chunksize)
+        CO2_HITEMP.setup(self, dict(cache, test_options=opt))
+
+    def time_eq_spectrum(self, cache, memory_budget):
+        self.sf.eq_spectrum(Tgas=1700)
+
+    def peakmem_eq_spectrum(self, cache, memory_budget):
+        self.sf.eq_spectrum(Tgas=1700)
+
+    def track_lines_per_chunk(self, cache, memory_budget):
+        if self.chunksize is None:
+            return cache["n_lines"]
+        return self.chunksize / cache["chunk_memory"]["n_wavenumber"]
 
+    track_lines_per_chunk.unit = "lines"
 
-if __name__ == '__main__':
 
+if __name__ == "__main__":
+    # run as a module for the relative imports : python -m benchmarks.benchmarks
     C = CO2_HITEMP()
-    C.setup()
-    from time import perf_counter
+    cache = C.setup_cache()
+    C.setup(cache)
     t0 = perf_counter()
-    C.peakmem_eq_spectrum()
-    print(perf_counter()-t0)
\ No newline at end of file
+    C.time_eq_spectrum(cache)
+    print(perf_counter() - t0)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Lineshape broadening engines on the same workload
+
+RADIS computes lineshapes either line by line (``optimization=None``,
+"legacy") or with the Lineshape Database Method (LDM, ``optimization="simple"``
+or ``"min-RMS"``), and the Voigt profile either analytically
+(``broadening_method="voigt"``), by convolution of the Lorentzian and
+Gaussian profiles (``"convolve"``) or in Fourier space (``"fft"``, LDM only,
+not truncated). Which engine is fastest for a given accuracy depends on the
+line widths relative to the wavenumber step : the suite runs all of them on
+the same synthetic line list, for several pressures (Doppler, Voigt and
+collisional regimes) and wavenumber steps.
+
+The accuracy is the max difference with a reference absorption coefficient :
+exact Voigt profiles (:py:func:`scipy.special.voigt_profile`), not truncated,
+of the same lines (same linestrengths, widths and shifted positions) at the
+same wavenumbers. It therefore includes the errors of truncation, of the LDM
+grids, and of lines not resolved by the wavenumber step.
+
+Examples
+--------
+::
+
+    sf = engine_factory("simple", "fft", wstep=0.01)
+    wavenumber, abscoeff, reference = abscoeff_and_reference(sf, 1500, pressure=1)
+    max_residual(abscoeff, reference)
+
+"""
+
+import numpy as np
+
+from .compat import require_synthetic
+from .sweep import TemperatureSweep
+from .synthetic import synthetic_factory
+
+N_LINES = 2_000
+WAVENUM_MIN, WAVENUM_MAX = 2200, 2250  # cm-1
+TRUNCATION = 5  # cm-1 ; fft lineshapes are never truncated
+T_GAS = 1500  # K
+MOLE_FRACTION = 0.1
+PRESSURES = [0.01, 1, 10]  # bar : Doppler, Voigt, collisional regimes at 1500 K
+CHUNKSIZE = 1e7  # lines x spectral points : bounds the memory of legacy broadening
+REFERENCE_POINTS = 5e6  # lines x spectral points of the reference per block
+
+
+def engine_factory(optimization, broadening_method, wstep, n_lines=N_LINES):
+    """Factory of the synthetic line list, with the broadening engine ``(optimization, broadening_method)``
+
+    ``"voigt"`` is translated to the name of the installed version (see
+    :py:mod:`benchmarks.compat`).
+
+    Raises
+    ------
+    NotImplementedError
+        if the installed RADIS does not support the engine
+    """
+    if optimization is None and broadening_method == "fft":
+        raise NotImplementedError("fft broadening requires LDM")
+    sf = synthetic_factory(
+        n_lines,
+        WAVENUM_MIN,
+        WAVENUM_MAX,
+        wstep=wstep,
+        truncation=None if broadening_method == "fft" else TRUNCATION,
+        neighbour_lines=0,
+        cutoff=0,
+        optimization=optimization,
+        broadening_method=broadening_method,
+        chunksize=CHUNKSIZE if optimization is None else None,
+    )
+    # lines narrower than the wavenumber step are part of the comparison
+    sf.warnings["AccuracyError"] = "ignore"
+    return sf
+
+
+def voigt_reference(lines, wavenumber, density):
+    """Absorption coefficient of ``lines`` with exact, untruncated Voigt profiles
+
+    Parameters
+    ----------
+    lines: pandas DataFrame
+        with the linestrengths ``S`` (cm-1/(molecule/cm-2)), shifted positions
+        ``shiftwav`` and Gaussian & Lorentzian HWHM ``hwhm_gauss``,
+        ``hwhm_lorentz`` (cm-1)
+    wavenumber: numpy array
+        cm-1
+    density: float
+        absorbing molecules (cm-3)
+
+    Returns
+    -------
+    abscoeff: numpy array
+        cm-1
+    """
+    from scipy.special import voigt_profile
+
+    S = lines["S"].to_numpy()
+    w0 = lines["shiftwav"].to_numpy()
+    sigma = lines["hwhm_gauss"].to_numpy() / np.sqrt(2 * np.log(2))
+    gamma = lines["hwhm_lorentz"].to_numpy()
+    abscoeff = np.zeros_like(wavenumber)
+    block = max(int(REFERENCE_POINTS // len(wavenumber)), 1)
+    for i in range(0, len(S), block):
+        sl = slice(i, i + block)
+        profiles = voigt_profile(
+            wavenumber[None, :] - w0[sl, None], sigma[sl, None], gamma[sl, None]
+        )
+        abscoeff += S[sl] @ profiles
+    return abscoeff * density
+
+
+def abscoeff_and_reference(sf, Tgas, pressure, mole_fraction=MOLE_FRACTION):
+    """Absorption coefficient of ``sf`` at ``Tgas``, and its exact Voigt reference
+
+    Returns
+    -------
+    wavenumber, abscoeff, reference: numpy arrays
+        in cm-1, cm-1, cm-1
+    """
+    sweep = TemperatureSweep(sf, mole_fraction=mole_fraction, pressure=pressure)
+    wavenumber, abscoeff = sweep.abscoeff(Tgas)
+    return wavenumber, abscoeff, voigt_reference(sf.df1, wavenumber, sweep.density(Tgas))
+
+
+def max_residual(abscoeff, reference):
+    """ Max absolute difference, relative to the max of the reference """
+    return float(np.max(np.abs(abscoeff - reference)) / np.max(reference))
+
+
+class CO2_Broadening:
+    """
+    Equilibrium spectrum of 2,000 synthetic CO2 lines (2200 - 2250 cm-1) with
+    each broadening engine. ``track_max_residual`` is the max difference with
+    exact Voigt profiles, relative to the max absorption coefficient.
+    """
+
+    params = (
+        [None, "simple", "min-RMS"],  # optimization
+        ["voigt", "convolve", "fft"],  # broadening_method
+        PRESSURES,
+        [0.01, 0.002],  # wstep (cm-1)
+    )
+    param_names = ["optimization", "broadening_method", "pressure", "wstep"]
+    timeout = 1200
+
+    def setup(self, optimization, broadening_method, pressure, wstep):
+        require_synthetic()
+        self.sf = engine_factory(optimization, broadening_method, wstep)
+        self.sf.eq_spectrum(T_GAS, mole_fraction=MOLE_FRACTION, pressure=pressure)  # compile
+
+    def time_eq_spectrum(self, optimization, broadening_method, pressure, wstep):
+        self.sf.eq_spectrum(T_GAS, mole_fraction=MOLE_FRACTION, pressure=pressure)
+
+    def peakmem_eq_spectrum(self, optimization, broadening_method, pressure, wstep):
+        self.sf.eq_spectrum(T_GAS, mole_fraction=MOLE_FRACTION, pressure=pressure)
+
+    def track_max_residual(self, optimization, broadening_method, pressure, wstep):
+        _, abscoeff, reference = abscoeff_and_reference(self.sf, T_GAS, pressure)
+        return max_residual(abscoeff, reference)
+
+    track_max_residual.unit = "relative"
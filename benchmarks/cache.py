@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Line database cache files across RADIS versions
+
+RADIS writes HDF5 cache files tagged with the version that generated them, and
+refuses files generated by a future version. When benchmarking several versions
+one after the other, each version used to fail on the files of the previous one
+(one ``ValueError`` per file, one full load attempt each).
+
+:py:class:`CacheManager` instead :
+
+- scans all cache files of the databank folders in one pass, reading only
+  their metadata,
+- moves the files the running version cannot use to a per-version folder
+  (``.radis-<version>/``), and restores the files previously moved there for
+  the running version : alternating versions never regenerate the same files,
+- regenerates the missing cache files of local line databases in parallel.
+
+Files without version metadata (ex: the synthetic line lists) are never moved.
+
+Folders are shared by the benchmark processes of all versions (see
+``tools/run_radis_versions.py``). Files are only moved or regenerated under an
+exclusive lock ; a benchmark that reads the folders holds a shared lock from
+its setup to its teardown, so that no other version moves the files it is
+timing. RADIS registers downloaded databanks in ``~/radis.json`` with their
+path : the download folder cannot differ between versions.
+
+Examples
+--------
+::
+
+    paths = ["cdsd_hitemp_07", "cdsd_hitemp_08"]
+    with CacheManager(get_cache_folders(paths)) as caches:
+        caches.regenerate(paths, "cdsd2df")
+        sf.fetch_databank("hitemp")
+
+or, for files read by the timed benchmark ::
+
+    def setup(self):
+        self.caches = CacheManager(get_cache_folders()).acquire()
+
+    def teardown(self):
+        self.caches.release()
+
+"""
+
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from os.path import dirname, exists, expanduser, isdir, join, relpath, splitext
+
+import pandas as pd
+from packaging.version import parse
+
+from radis import get_version
+from radis.misc.printer import printm
+
+STASH_PREFIX = ".radis-"
+LOCK_FILE = ".radis-benchmark.lock"
+
+CacheFile = namedtuple("CacheFile", ["path", "version", "status"])
+"""A cache file : ``status`` is ``"compatible"``, ``"future"`` (generated by
+a more recent version), ``"deprecated"`` (older than RADIS'
+``OLDEST_COMPATIBLE_VERSION``) or ``"unversioned"`` (no version metadata)"""
+
+
+def get_cache_folders(paths=()):
+    """Folders where RADIS downloads and caches line databases
+
+    Parameters
+    ----------
+    paths: str, or list of str
+        local line database files : their folders are added, if they exist
+    """
+    import radis
+
+    if isinstance(paths, str):
+        paths = [paths]
+    folders = [expanduser(radis.config.get("DEFAULT_DOWNLOAD_PATH", "~/.radisdb"))]
+    for path in paths:
+        folder = dirname(expanduser(path))
+        if isdir(folder) and folder not in folders:
+            folders.append(folder)
+    return folders
+
+
+def read_cache_version(fname):
+    """Version of RADIS that generated the cache file ``fname``, from its metadata only
+
+    Returns
+    -------
+    str, or ``None`` if the file has no version metadata
+    """
+    metadata = {}
+    try:
+        with pd.HDFStore(fname, mode="r") as store:
+            metadata = store.get_storer("df").attrs.metadata
+    except Exception:  # not a pytables file, or no metadata
+        try:
+            import h5py
+
+            with h5py.File(fname, "r") as f:
+                metadata = dict(f.attrs)
+        except Exception:
+            return None
+    version = metadata.get("version") if isinstance(metadata, dict) else None
+    if isinstance(version, bytes):
+        version = version.decode()
+    return version
+
+
+@contextmanager
+def _lock(folder, shared=False):
+    """ Exclusive or shared lock on a cache folder, for all benchmark processes (POSIX only) """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(folder, exist_ok=True)
+    with open(join(folder, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _regenerate_cache(parser, source):
+    """ Parse ``source`` with the RADIS line database ``parser``, writing its cache file """
+    try:
+        from radis.api import cdsdapi, hitranapi
+
+        parsers = {"hit2df": hitranapi.hit2df, "cdsd2df": cdsdapi.cdsd2df}
+    except ImportError:  # RADIS < 0.13
+        from radis.io import cdsd, hitran
+
+        parsers = {"hit2df": hitran.hit2df, "cdsd2df": cdsd.cdsd2df}
+    kwargs = {"version": "hitemp"} if parser == "cdsd2df" else {}
+    parsers[parser](source, cache="regen", verbose=False, **kwargs)
+    return source
+
+
+class CacheManager:
+    """Make the cache files of ``folders`` usable by the running RADIS version
+
+    Parameters
+    ----------
+    folders: list of str
+        databank folders, scanned recursively
+    version: str
+        RADIS version. Default : the installed one.
+    processes: int
+        maximum number of parallel regenerations. Default : number of CPUs.
+
+    Used as a context manager, or between :py:meth:`~benchmarks.cache.CacheManager.acquire`
+    and :py:meth:`~benchmarks.cache.CacheManager.release`, the folders are
+    prepared for this version and locked for reading : parallel benchmark
+    processes of other versions cannot move files in use. Load the databank,
+    and run benchmarks that read it, inside.
+    """
+
+    def __init__(self, folders, version=None, processes=None):
+        self.folders = [expanduser(f) for f in folders]
+        self.version = version or get_version(add_git_number=False)
+        self.processes = processes
+
+    def _lock_all(self, shared):
+        locks = ExitStack()
+        for folder in self.folders:  # always in the same order
+            locks.enter_context(_lock(folder, shared=shared))
+        return locks
+
+    def acquire(self):
+        """Prepare the folders for this version, and hold a shared lock on them
+
+        The shared lock is taken first : if files must be moved, it is
+        released, the files are moved under the exclusive lock (once no other
+        benchmark holds the shared one), and the check starts again. Never
+        waiting for the exclusive lock while holding the shared one avoids
+        deadlocks between versions.
+
+        Returns
+        -------
+        self
+        """
+        while True:
+            self._locks = self._lock_all(shared=True)
+            if not self.pending():
+                return self
+            self._locks.close()
+            with self._lock_all(shared=False):
+                self.prepare()
+
+    def release(self):
+        """ Release the shared lock : other versions may move the files again """
+        self._locks.close()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def _status(self, version):
+        import radis
+
+        if version is None:
+            return "unversioned"
+        if parse(version) > parse(self.version):
+            return "future"
+        if parse(version) < parse(radis.config.get("OLDEST_COMPATIBLE_VERSION", "0")):
+            return "deprecated"
+        return "compatible"
+
+    def scan(self):
+        """Metadata of all cache files of the folders, in one pass
+
+        Returns
+        -------
+        list of :py:data:`~benchmarks.cache.CacheFile`
+        """
+        files = []
+        for folder in self.folders:
+            for dirpath, dirnames, filenames in os.walk(folder):
+                dirnames[:] = [d for d in dirnames if not d.startswith(STASH_PREFIX)]
+                files += [join(dirpath, f) for f in filenames if f.endswith(".h5")]
+        files = list(dict.fromkeys(files))  # nested folders are walked twice
+        with ThreadPoolExecutor() as pool:
+            versions = list(pool.map(read_cache_version, files))
+        return [CacheFile(f, v, self._status(v)) for (f, v) in zip(files, versions)]
+
+    def _stash_path(self, folder, fname, version):
+        return join(folder, STASH_PREFIX + version, relpath(fname, folder))
+
+    def _restorable(self):
+        """ (stashed file, original path) of the files set aside for this version, not yet restored """
+        for folder in self.folders:
+            own = join(folder, STASH_PREFIX + self.version)
+            for dirpath, _, filenames in os.walk(own):
+                for fname in filenames:
+                    src = join(dirpath, fname)
+                    dest = join(folder, relpath(src, own))
+                    if not exists(dest):
+                        yield src, dest
+
+    def pending(self):
+        """ Whether :py:meth:`~benchmarks.cache.CacheManager.prepare` would move files """
+        if any(f.status in ("future", "deprecated") for f in self.scan()):
+            return True
+        return next(self._restorable(), None) is not None
+
+    def prepare(self):
+        """Move away the files this version cannot use, and restore its own
+
+        Returns
+        -------
+        stashed, restored: list of str
+            files moved to another version's folder, files restored for this one
+        """
+        stashed, restored = [], []
+        for f in self.scan():
+            if f.status in ("future", "deprecated"):
+                folder = next(d for d in self.folders if f.path.startswith(d))
+                dest = self._stash_path(folder, f.path, f.version)
+                os.makedirs(dirname(dest), exist_ok=True)
+                shutil.move(f.path, dest)
+                stashed.append(f.path)
+        for src, dest in list(self._restorable()):
+            os.makedirs(dirname(dest), exist_ok=True)
+            shutil.move(src, dest)
+            restored.append(dest)
+        if stashed or restored:
+            printm(
+                "RADIS {0} cache : {1} files set aside for other versions, {2} restored".format(
+                    self.version, len(stashed), len(restored)
+                )
+            )
+        return stashed, restored
+
+    def regenerate(self, sources, parser):
+        """Regenerate the missing cache files of local line databases, in parallel
+
+        Files are written under the exclusive lock : call it with the shared
+        lock held (inside the context), it is released meanwhile.
+
+        Parameters
+        ----------
+        sources: list of str
+            line database files, cached next to them (same name, ``.h5``)
+        parser: ``"hit2df"`` or ``"cdsd2df"``
+            RADIS function that parses them
+
+        Returns
+        -------
+        list of str: sources whose cache was regenerated
+        """
+        def get_missing():
+            return [s for s in sources if exists(s) and not exists(splitext(s)[0] + ".h5")]
+
+        if not get_missing():
+            return []
+        self.release()
+        try:
+            with self._lock_all(shared=False):
+                missing = get_missing()  # maybe regenerated by another process meanwhile
+                if not missing:
+                    return []
+                printm("Regenerating {0} cache files in parallel".format(len(missing)))
+                with ProcessPoolExecutor(self.processes) as pool:
+                    return list(pool.map(_regenerate_cache, [parser] * len(missing), missing))
+        finally:
+            self.acquire()
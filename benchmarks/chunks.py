@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-budgeted chunk size for lineshape broadening
+
+RADIS broadens lines by chunks of ``chunksize`` lines × spectral points (see
+:py:meth:`~radis.lbl.broadening.BroadenFactory._calc_broadening`). The memory
+of one chunk is measured rather than guessed : the broadening step is run on
+two samples of lines under :py:mod:`tracemalloc`, which gives a fixed cost
+(output arrays, LDM grids) and a cost per line (lineshapes, indices). The chunk
+size is then the largest one whose working set fits in an explicit budget,
+independently of what else is running on the machine.
+
+Environment variables :
+
+- ``RADIS_BENCHMARK_MEMORY_BUDGET`` : memory budget of the broadening step,
+  in bytes, or with a unit (``500MB``, ``4GB``). Default 2 GB.
+
+Examples
+--------
+::
+
+    bytes_per_line, fixed_bytes = measure_broadening_memory(sf)
+    sf.misc.chunksize = plan_chunksize(4e9, bytes_per_line, fixed_bytes, len(sf.wavenumber))
+
+"""
+
+import os
+import re
+import tracemalloc
+
+import numpy as np
+
+from .sweep import TemperatureSweep
+
+MEMORY_BUDGET = 2e9  # bytes
+SAMPLE_LINES = (1_000, 4_000)  # legacy broadening : ~ 100 kB per line
+SAMPLE_LINES_LDM = (20_000, 80_000)  # LDM : ~ 100 B per line, but large fixed cost
+UNITS = {"": 1, "B": 1, "KB": 1e3, "MB": 1e6, "GB": 1e9, "TB": 1e12}
+
+
+def parse_bytes(size):
+    """ ``2e9``, ``"2e9"``, ``"500MB"`` or ``"4 GB"`` to a number of bytes """
+    if not isinstance(size, str):
+        return float(size)
+    match = re.fullmatch(r"\s*([0-9.eE+-]+)\s*([a-zA-Z]*)\s*", size)
+    if match is None or match.group(2).upper() not in UNITS:
+        raise ValueError("Unexpected memory size: {0}".format(size))
+    return float(match.group(1)) * UNITS[match.group(2).upper()]
+
+
+def get_memory_budget():
+    """ Memory budget of the broadening step (bytes), see ``RADIS_BENCHMARK_MEMORY_BUDGET`` """
+    return parse_bytes(os.environ.get("RADIS_BENCHMARK_MEMORY_BUDGET", MEMORY_BUDGET))
+
+
+def estimate_broadening_memory(n_broadening_points, n_arrays=8):
+    """Estimate of the memory of the legacy broadening step, without calculation
+
+    ``n_arrays`` float64 arrays of the size of the lineshape range per line
+    (Lorentzian, Gaussian and Voigt profiles, and their temporaries). Used
+    when the factory cannot be measured (RADIS < 0.10.1).
+
+    Returns
+    -------
+    bytes_per_line, fixed_bytes: float
+    """
+    return 8.0 * n_arrays * n_broadening_points, 0.0
+
+
+def measure_broadening_memory(sf, n_lines=None, Tgas=1700, seed=0):
+    """Measure the memory of the broadening step of ``sf``
+
+    The factory is prepared as for a spectrum at ``Tgas`` (see
+    :py:class:`~benchmarks.sweep.TemperatureSweep`), then the broadening step
+    is run without chunks on two random samples of lines. Uses private methods
+    of the factory : requires RADIS >= 0.10.1
+
+    Parameters
+    ----------
+    sf: SpectrumFactory
+        factory with its line database loaded. Its wstep, truncation,
+        spectral range and optimization are those measured.
+    n_lines: tuple of 2 int
+        size of the samples. Default :py:data:`SAMPLE_LINES` (legacy) or
+        :py:data:`SAMPLE_LINES_LDM`.
+
+    Returns
+    -------
+    bytes_per_line, fixed_bytes: float
+        peak traced memory of a chunk of ``n`` lines is ``fixed_bytes + n * bytes_per_line``
+
+    Notes
+    -----
+    Memory allocated inside numba functions is not seen by tracemalloc ; the
+    arrays they return are.
+    """
+    sweep = TemperatureSweep(sf)
+    sweep.prepare(Tgas)
+    lines = sweep.lines
+    if n_lines is None:
+        n_lines = SAMPLE_LINES if sf.params.optimization is None else SAMPLE_LINES_LDM
+    n_lines = [min(n, len(lines)) for n in n_lines]
+
+    chunksize = sf.misc.chunksize
+    sf.misc.chunksize = None  # one chunk = all lines of the sample
+    rng = np.random.default_rng(seed)
+    peaks = []
+    try:
+        for n in n_lines:
+            sf.df1 = lines.iloc[np.sort(rng.choice(len(lines), n, replace=False))]
+            sf._calc_broadening()  # compiles numba functions before tracing
+            tracemalloc.start()
+            sf._calc_broadening()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peaks.append(peak)
+    finally:
+        sf.misc.chunksize = chunksize
+        sf.df1 = lines
+
+    if n_lines[0] == n_lines[1]:  # not enough lines for two samples
+        return peaks[0] / n_lines[0], 0.0
+    bytes_per_line = max((peaks[1] - peaks[0]) / (n_lines[1] - n_lines[0]), 1.0)
+    fixed_bytes = max(peaks[0] - bytes_per_line * n_lines[0], 0.0)
+    return bytes_per_line, fixed_bytes
+
+
+def plan_chunksize(budget, bytes_per_line, fixed_bytes, n_wavenumber, n_lines=None):
+    """Largest RADIS ``chunksize`` whose broadening fits in ``budget``
+
+    Parameters
+    ----------
+    budget: float
+        memory budget (bytes)
+    bytes_per_line, fixed_bytes: float
+        see :py:func:`~benchmarks.chunks.measure_broadening_memory`
+    n_wavenumber: int
+        number of spectral points ; RADIS counts chunks in lines × spectral points
+    n_lines: int
+        total number of lines. If they all fit in the budget, return ``None``
+        (no chunks, fastest)
+
+    Returns
+    -------
+    chunksize: float, or None
+        rounded down to 2 significant digits of lines per chunk, so that small
+        measurement differences do not change the chunks.
+    """
+    lines_per_chunk = (budget - fixed_bytes) / bytes_per_line
+    if lines_per_chunk < 1:
+        raise ValueError(
+            "Memory budget ({0:.2e} B) is smaller than the fixed cost of the broadening step ({1:.2e} B)".format(
+                budget, fixed_bytes
+            )
+        )
+    if n_lines is not None and lines_per_chunk >= n_lines:
+        return None
+    magnitude = 10 ** (np.floor(np.log10(lines_per_chunk)) - 1)
+    lines_per_chunk = max(np.floor(lines_per_chunk / magnitude) * magnitude, 1)
+    return float(lines_per_chunk * n_wavenumber)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Cold-start benchmarks
+
+Short-lived jobs pay ``import radis`` and the costs of the first calls (numba
+compilation, partition function tables, databank cache discovery) every time.
+asv ``setup`` hides them : here they are measured in a fresh Python process.
+
+- ``timeraw_*`` benchmarks : time of ``import radis`` (and of the import of
+  the calculation code, lazy in recent versions), of the first
+  :py:class:`~radis.lbl.factory.SpectrumFactory` and of the first
+  :py:func:`~radis.lbl.calc.calc_spectrum`, each in a new interpreter.
+- :py:class:`~benchmarks.coldstart.RADIS_ImportTime` : import time of the main
+  subpackages and dependencies, parsed from ``python -X importtime``.
+- :py:class:`~benchmarks.coldstart.RADIS_FirstSpectrum` : first spectrum of a
+  new process, split between warm-up (numba compilation, lazy loading) and
+  steady state.
+
+Run ``python -m benchmarks.coldstart`` for the list of the slowest modules
+to import.
+
+"""
+
+import json
+import re
+import subprocess
+import sys
+
+from .synthetic import get_synthetic_databank
+
+N_LINES = 10_000  # small : the first spectrum is dominated by warm-up costs
+
+# recent versions import subpackages lazily, on first access : ``import radis``
+# alone does not import the calculation code
+IMPORT_CODE = "from radis import SpectrumFactory, calc_spectrum"
+
+# Executed in a fresh process. Prints the duration of each step as JSON
+FIRST_SPECTRUM_SCRIPT = """
+import json
+from inspect import signature
+from time import perf_counter
+
+t0 = perf_counter()
+from radis import SpectrumFactory
+t_import = perf_counter()
+sf = SpectrumFactory(2000, 2250, molecule="CO2", isotope="1,2,3", wstep=0.01,
+                     cutoff=0, verbose=0)
+t_factory = perf_counter()
+load_kwargs = {{"parfuncfmt": "hapi", "load_columns": "equilibrium"}}
+accepted = signature(sf.load_databank).parameters
+sf.load_databank(path={path!r}, format="hitemp-radisdb",
+                 **{{k: v for (k, v) in load_kwargs.items() if k in accepted}})
+t_load = perf_counter()
+sf.eq_spectrum(1500, pressure=1, mole_fraction=0.1, path_length=1)
+t_first = perf_counter()
+sf.eq_spectrum(1500, pressure=1, mole_fraction=0.1, path_length=1)
+t_second = perf_counter()
+print(json.dumps({{
+    "import": t_import - t0,
+    "factory": t_factory - t_import,
+    "load_databank": t_load - t_factory,
+    "first_spectrum": t_first - t_load,
+    "steady_spectrum": t_second - t_first,
+}}))
+"""
+
+
+def run_python(code, *options):
+    """ Run ``code`` in a new interpreter ; returns its (stdout, stderr) """
+    out = subprocess.run(
+        [sys.executable, *options, "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return out.stdout, out.stderr
+
+
+def import_times(code=IMPORT_CODE):
+    """Import time of each module imported by ``code``, in a new process
+
+    Parsed from ``python -X importtime`` (Python >= 3.7).
+
+    Returns
+    -------
+    dict: {module name: (self, cumulative)}
+        times in seconds ; the cumulative time includes the modules it
+        imported first
+    """
+    _, stderr = run_python(code, "-X", "importtime")
+    times = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\S+)", line)
+        if match is not None:
+            times[match.group(3)] = (int(match.group(1)) * 1e-6, int(match.group(2)) * 1e-6)
+    return times
+
+
+def first_spectrum_times(n_lines=N_LINES):
+    """Duration of the steps of the first spectrum of a new process
+
+    Returns
+    -------
+    dict: {step: seconds}
+        ``import``, ``factory``, ``load_databank``, ``first_spectrum`` and
+        ``steady_spectrum`` (same spectrum, calculated again)
+    """
+    path = get_synthetic_databank(n_lines, 2000, 2250, verbose=False)
+    stdout, _ = run_python(FIRST_SPECTRUM_SCRIPT.format(path=path))
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def _check_importtime():
+    if sys.version_info < (3, 7):
+        raise NotImplementedError("-X importtime requires Python >= 3.7")
+
+
+class RADIS_ColdStart:
+    """
+    First calls of a new Python process
+    """
+
+    timeout = 600
+
+    def timeraw_import_radis(self):
+        return "import radis"
+
+    def timeraw_import_spectrumfactory(self):
+        return IMPORT_CODE
+
+    def timeraw_first_factory(self):
+        return (
+            """
+            SpectrumFactory(2000, 2250, molecule="CO2", isotope="1,2,3", wstep=0.01, verbose=0)
+            """,
+            "from radis import SpectrumFactory",
+        )
+
+
+class RADIS_ColdStart_CalcSpectrum:
+    """
+    First :py:func:`~radis.lbl.calc.calc_spectrum` of a new Python process, on
+    the HITRAN database (same as :py:class:`~benchmarks.benchmarks.CO2_HITRAN`,
+    includes cache discovery)
+    """
+
+    timeout = 600
+
+    def setup(self):
+        # databank downloaded & cached once, outside of the measure
+        from .benchmarks import CO2_HITRAN
+
+        CO2_HITRAN().setup()
+
+    def timeraw_first_calc_spectrum(self):
+        return (
+            """
+            calc_spectrum(wavelength_min=4165, wavelength_max=4200, molecule="CO2",
+                          isotope="1,2", Tgas=300, databank="hitran", verbose=0)
+            """,
+            "from radis import calc_spectrum",
+        )
+
+
+class RADIS_ImportTime:
+    """
+    Import time of the main RADIS subpackages and dependencies when importing
+    :py:class:`~radis.lbl.factory.SpectrumFactory` and
+    :py:func:`~radis.lbl.calc.calc_spectrum`, from ``python -X importtime``.
+
+    The time of a package is the sum of the self times of all its modules (not
+    counting the other packages they import), so that it does not depend on
+    which package happens to import it first. ``"total"`` is the whole import.
+    """
+
+    params = [
+        [
+            "total",
+            "radis",
+            "radis.lbl",
+            "radis.spectrum",
+            "radis.los",
+            "radis.phys",
+            "radis.db",
+            "radis.api",
+            "radis.io",
+            "radis.levels",
+            "radis.misc",
+            "radis.tools",
+            "numba",
+            "pandas",
+            "astropy",
+            "scipy",
+            "matplotlib",
+        ]
+    ]
+    param_names = ["package"]
+    timeout = 600
+
+    def setup(self, package):
+        _check_importtime()
+        times = import_times()
+        modules = [
+            m for m in times if package == "total" or m == package or m.startswith(package + ".")
+        ]
+        if not modules:
+            raise NotImplementedError("{0} not imported".format(package))
+        self.import_time = sum(times[m][0] for m in modules)
+        self.n_modules = len(modules)
+
+    def track_import_time(self, package):
+        return self.import_time
+
+    track_import_time.unit = "seconds"
+
+    def track_imported_modules(self, package):
+        return self.n_modules
+
+    track_imported_modules.unit = "modules"
+
+
+class RADIS_FirstSpectrum:
+    """
+    First equilibrium spectrum of a new Python process (10k lines), split
+    between warm-up (numba compilation, lazy loading) and steady state
+    """
+
+    timeout = 600
+
+    def setup(self):
+        from .compat import require_synthetic
+
+        require_synthetic()
+        self.times = first_spectrum_times()
+
+    def track_first_spectrum(self):
+        return self.times["first_spectrum"]
+
+    track_first_spectrum.unit = "seconds"
+
+    def track_steady_spectrum(self):
+        return self.times["steady_spectrum"]
+
+    track_steady_spectrum.unit = "seconds"
+
+    def track_warmup(self):
+        """ Extra time of the first spectrum : compilation & first-call costs """
+        return self.times["first_spectrum"] - self.times["steady_spectrum"]
+
+    track_warmup.unit = "seconds"
+
+    def track_load_databank(self):
+        return self.times["load_databank"]
+
+    track_load_databank.unit = "seconds"
+
+
+if __name__ == "__main__":
+    times = import_times()
+    print("{0:>10} {1:>10}  module".format("self (s)", "cumul. (s)"))
+    for name, (self_time, cumulative) in sorted(times.items(), key=lambda x: -x[1][0])[:25]:
+        print("{0:10.4f} {1:10.4f}  {2}".format(self_time, cumulative, name))
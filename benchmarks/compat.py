@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark options across RADIS versions
+
+Benchmarks write their options once, with the names of the latest RADIS
+version. :py:func:`translate_options` rewrites them for the installed version
+from a single table of option changes, keyed by the version that introduced
+them (:py:data:`OPTION_CHANGES`) ; :py:func:`build_factory` creates the
+:py:class:`~radis.lbl.factory.SpectrumFactory` and loads its lines from such
+options, for all suites.
+
+An option the installed version cannot express raises :py:class:`NotImplementedError`
+(asv skips the benchmark) instead of being dropped, which would time another
+calculation under the same name. Wrap values in :py:class:`IfSupported` for
+options that may be left out : they are dropped by the translation, or when
+the RADIS function does not accept them (loader options added or removed in
+versions not recorded here).
+
+Examples
+--------
+::
+
+    sf = build_factory({
+        "wavenum_min": 2000,
+        "wavenum_max": 2250,
+        "molecule": "CO2",
+        "truncation": 10,
+        "neighbour_lines": 10,
+        "optimization": IfSupported("simple"),
+        "path": path,
+        "dbformat": "hitemp-radisdb",
+        "parfuncfmt": IfSupported("hapi"),
+    }, n_lines=1_000_000)
+
+"""
+
+from functools import lru_cache
+from inspect import Parameter, signature
+
+from packaging.version import parse
+
+from radis import SpectrumFactory, get_version
+
+DATABANK_OPTIONS = [
+    "databank",
+    "path",
+    "dbformat",
+    "db_use_cached",
+    "parfuncfmt",
+    "levelsfmt",
+    "load_columns",
+    "load_energies",
+]
+"""Options of :py:meth:`~radis.lbl.loader.DatabankLoader.fetch_databank` /
+:py:meth:`~radis.lbl.loader.DatabankLoader.load_databank` ; the others go to
+the :py:class:`~radis.lbl.factory.SpectrumFactory`"""
+
+
+class IfSupported:
+    """Option value used only if the installed RADIS supports the option
+
+    Examples
+    --------
+    ::
+
+        {"optimization": IfSupported("simple")}  # LDM if available, else legacy
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return "IfSupported({0!r})".format(self.value)
+
+
+def _value(value):
+    return value.value if isinstance(value, IfSupported) else value
+
+
+@lru_cache()
+def radis_version():
+    """ Installed RADIS version (:py:class:`packaging.version.Version`) """
+    return parse(get_version(add_git_number=False))
+
+
+def require(version, feature):
+    """Skip the benchmark (raise :py:class:`NotImplementedError`) if RADIS is older than ``version``
+
+    Parameters
+    ----------
+    version: str
+        first RADIS version with ``feature``
+    feature: str
+        used in the error message
+    """
+    if radis_version() < parse(version):
+        raise NotImplementedError("{0} requires RADIS >= {1}".format(feature, version))
+
+
+def require_synthetic():
+    """ Synthetic line lists (hitemp-radisdb format) and ``truncation`` require RADIS >= 0.10.1 """
+    require("0.10.1", "truncation / hitemp-radisdb format")
+
+
+def _unsupported(opt, key, feature, version):
+    """ Drop option ``key`` if optional, else skip the benchmark """
+    if not isinstance(opt[key], IfSupported):
+        raise NotImplementedError("{0} requires RADIS >= {1}".format(feature, version))
+    del opt[key]
+
+
+def _to_broadening_max_width(opt, version):
+    """``truncation`` (half width) & ``neighbour_lines`` -> ``broadening_max_width`` (full width)
+
+    Lines outside the spectral range, within ``broadening_max_width / 2``,
+    were always included : ``neighbour_lines`` is dropped.
+    """
+    if "truncation" in opt:
+        if _value(opt["truncation"]) is None:
+            _unsupported(opt, "truncation", "no truncation", version)
+        else:
+            opt["broadening_max_width"] = 2 * _value(opt.pop("truncation"))
+    opt.pop("neighbour_lines", None)
+
+
+def _to_hitemp_radisdb(opt, version):
+    """ no ``hitemp-radisdb`` format (RADIS HDF5 line databases, used for synthetic lines) """
+    if _value(opt.get("dbformat")) == "hitemp-radisdb":
+        _unsupported(opt, "dbformat", "hitemp-radisdb format", version)
+
+
+def _to_legacy_broadening(opt, version):
+    """ no LDM : ``optimization`` must be ``None``, and no ``fft`` broadening """
+    if "optimization" in opt:
+        if _value(opt["optimization"]) is None:
+            del opt["optimization"]  # legacy broadening, the only one
+        else:
+            _unsupported(opt, "optimization", "LDM optimization", version)
+    if _value(opt.get("broadening_method")) == "fft":
+        _unsupported(opt, "broadening_method", "fft broadening", version)
+
+
+def _to_cdsd(opt, version):
+    """ ``cdsd-hitemp`` format was named ``cdsd`` """
+    if _value(opt.get("dbformat")) == "cdsd-hitemp":
+        opt["dbformat"] = "cdsd"
+
+
+OPTION_CHANGES = [
+    ("0.10.1", "truncation & neighbour_lines replace broadening_max_width", _to_broadening_max_width),
+    ("0.10.1", "hitemp-radisdb format", _to_hitemp_radisdb),
+    ("0.9.26", "LDM optimization & fft broadening", _to_legacy_broadening),
+    ("0.9.21", "cdsd format renamed cdsd-hitemp", _to_cdsd),
+]
+"""``(version, description, translate)`` : options of the latest versions are
+translated by ``translate(opt, version)`` for RADIS versions older than
+``version``, newest changes first"""
+
+
+def _voigt_name(opt):
+    """The analytical Voigt broadening is ``"voigt"`` or ``"voigt_poly"`` depending
+    on the version : use the name of the factory default"""
+    if _value(opt.get("broadening_method")) in ["voigt", "voigt_poly"]:
+        default = signature(SpectrumFactory).parameters.get("broadening_method")
+        if default is not None and default.default in ["voigt", "voigt_poly"]:
+            opt["broadening_method"] = default.default
+
+
+def translate_options(options, version=None):
+    """Options written for the latest RADIS, translated for ``version``
+
+    Parameters
+    ----------
+    options: dict
+        options of :py:class:`~radis.lbl.factory.SpectrumFactory`,
+        :py:func:`~radis.lbl.calc.calc_spectrum`, or :py:func:`build_factory`
+    version: str
+        RADIS version. Default : the installed one.
+
+    Returns
+    -------
+    opt: dict
+        new dict. Values may still be :py:class:`IfSupported` : see
+        :py:func:`resolve_options`.
+
+    Raises
+    ------
+    NotImplementedError
+        if an option cannot be expressed in ``version``
+    """
+    version = radis_version() if version is None else parse(version)
+    opt = dict(options)
+    for introduced, _, translate in OPTION_CHANGES:
+        if version < parse(introduced):
+            translate(opt, introduced)
+    _voigt_name(opt)
+    return opt
+
+
+def resolve_options(func, options):
+    """Keyword arguments of ``func`` : :py:class:`IfSupported` values are
+    unwrapped, or dropped if ``func`` does not accept them"""
+    parameters = signature(func).parameters
+    any_keyword = any(p.kind == Parameter.VAR_KEYWORD for p in parameters.values())
+    return {
+        k: _value(v)
+        for (k, v) in options.items()
+        if not isinstance(v, IfSupported) or k in parameters or any_keyword
+    }
+
+
+def build_factory(options, n_lines=None):
+    """Create a :py:class:`~radis.lbl.factory.SpectrumFactory` and load its lines
+
+    Parameters
+    ----------
+    options: dict
+        options of the latest RADIS (see :py:func:`translate_options`) : the
+        factory options, and the line database : ``databank`` (fetched), or
+        ``path`` & ``dbformat`` (loaded), with the other :py:data:`DATABANK_OPTIONS`.
+        Without database options, no lines are loaded.
+    n_lines: int
+        expected number of lines, checked if given
+
+    Returns
+    -------
+    sf: SpectrumFactory
+
+    Raises
+    ------
+    NotImplementedError
+        if an option cannot be expressed in the installed version
+    """
+    opt = translate_options(options)
+    load = {k: opt.pop(k) for k in DATABANK_OPTIONS if k in opt}
+
+    sf = SpectrumFactory(**resolve_options(SpectrumFactory, opt))
+    if "databank" in load:
+        source = _value(load.pop("databank"))
+        sf.fetch_databank(source, **resolve_options(sf.fetch_databank, load))
+    elif "path" in load:
+        sf.load_databank(
+            path=_value(load.pop("path")),
+            format=_value(load.pop("dbformat")),
+            **resolve_options(sf.load_databank, load)
+        )
+
+    if n_lines is not None:
+        assert len(sf.df0) == n_lines, "{0} lines loaded, expected {1}".format(len(sf.df0), n_lines)
+    return sf
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Hot paths of the benchmarks, as collapsed stacks
+
+A ``time_*`` benchmark that regresses between two RADIS versions only gives a
+number. :py:class:`StackSampler` samples the call stack of the benchmark
+from a background thread (no tracing : the overhead does not depend on the
+number of function calls), and :py:func:`save_cpu_profile` writes the
+sampled time per stack in the "collapsed stacks" format read by
+``flamegraph.pl``, `speedscope <https://www.speedscope.app/>`__ or inferno,
+keyed by commit, environment and benchmark. ``tools/compare_profiles.py``
+lists the functions whose self time changed between two commits.
+
+:py:func:`profiled` generates, for a benchmark class, a class whose
+``track_*_profile`` benchmarks run each of its ``time_*`` benchmarks once
+(after a warm-up, so that numba compilation and caches are not profiled)
+under the sampler, and return the profiled time. They are skipped unless
+``RADIS_BENCHMARK_PROFILE`` is set, and are run by asv in the environment of
+each commit like the other benchmarks.
+
+Profiled suites : the ``CO2_HITRAN`` / ``CO2_HITEMP`` spectra and the
+``CO2_HITEMP`` stages and temperature sweep (:py:mod:`benchmarks.benchmarks`),
+the scaling grid (:py:mod:`benchmarks.scaling`), the broadening engines
+(:py:mod:`benchmarks.broadening`) and the lines of sight of many slabs
+(:py:mod:`benchmarks.slabs`). Other ``time_*`` benchmarks are not profiled.
+
+Environment variables :
+
+- ``RADIS_BENCHMARK_PROFILE`` : set to ``1`` to run the ``*_Profile`` benchmarks.
+- ``RADIS_BENCHMARK_PROFILE_DIR`` : output folder. Default ``profiles/`` in the
+  asv project folder.
+
+Examples
+--------
+::
+
+    RADIS_BENCHMARK_PROFILE=1 asv run HASHFILE:tested_radis_versions.txt --bench _Profile
+    python tools/compare_profiles.py 0.9.29 0.10.2 --bench CO2_HITEMP.time_eq_spectrum
+
+or, in a script ::
+
+    sampler = StackSampler()
+    with sampler:
+        sf.eq_spectrum(Tgas=1700)
+    save_cpu_profile(sampler, "benchmarks.CO2_HITEMP.time_eq_spectrum")
+
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from os.path import basename, join
+
+from . import benchmarks as _suite
+from . import broadening as _broadening
+from . import scaling as _scaling
+from . import slabs as _slabs
+
+SAMPLING_INTERVAL = 0.001  # s ; actual intervals are longer while C code holds the GIL
+TOP_FUNCTIONS = 50  # functions stored with their self time in the JSON summary
+BENCHMARK_PREFIXES = ("time_", "timeraw_", "peakmem_", "mem_", "track_")
+
+
+def _frame_label(code):
+    """``package/module.py:function`` : stable across environments and line changes"""
+    fname = code.co_filename.replace("\\", "/")
+    for marker in ("site-packages/", "dist-packages/"):
+        if marker in fname:
+            fname = fname.split(marker, 1)[1]
+            break
+    else:
+        fname = basename(fname)
+    return "{0}:{1}".format(fname, code.co_name)
+
+
+class StackSampler:
+    """Sample the call stack of the current thread while the context is active
+
+    Each sample is weighted by the time elapsed since the previous one. Frames
+    above the ``with`` statement are not recorded.
+
+    Parameters
+    ----------
+    interval: float
+        sampling period (s)
+
+    Attributes
+    ----------
+    stacks: dict
+        ``{tuple of frame labels, outermost first: time (s)}``
+    duration: float
+        time spent in the context (s)
+    n_samples: int
+    """
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+        self.n_samples = 0
+        self._codes = defaultdict(float)  # stacks of code objects : labels are made once at the end
+
+    def __enter__(self):
+        frame = sys._getframe(1)
+        self._skip = 0  # frames above the caller
+        while frame.f_back is not None:
+            frame = frame.f_back
+            self._skip += 1
+        self._thread_id = threading.get_ident()
+        self._running = True
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._t0 = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self._t0
+        self._running = False
+        self._sampler.join()
+        labels = {}
+        stacks = defaultdict(float)
+        for codes, weight in self._codes.items():
+            for code in codes:
+                if code not in labels:
+                    labels[code] = _frame_label(code)
+            stacks[tuple(labels[code] for code in codes)] += weight
+        self.stacks = dict(stacks)
+        return False
+
+    def _sample(self):
+        last = self._t0
+        while self._running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._thread_id)
+            now = time.perf_counter()
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes = tuple(reversed(codes))[self._skip :]
+            if codes:
+                self._codes[codes] += now - last
+                self.n_samples += 1
+            last = now
+
+    def collapsed(self):
+        """Lines ``frame;frame;frame weight`` of the collapsed stacks format,
+        weights in microseconds"""
+        return [
+            "{0} {1}".format(";".join(stack), int(round(weight * 1e6)))
+            for stack, weight in sorted(self.stacks.items())
+            if weight >= 0.5e-6
+        ]
+
+    def self_time(self):
+        """ Time (s) spent in each function itself (last frame of the stacks), largest first """
+        times = defaultdict(float)
+        for stack, weight in self.stacks.items():
+            times[stack[-1]] += weight
+        return dict(sorted(times.items(), key=lambda item: -item[1]))
+
+
+def get_profile_folder():
+    """ Folder of the collapsed stacks, next to the asv results """
+    return os.environ.get(
+        "RADIS_BENCHMARK_PROFILE_DIR",
+        join(os.environ.get("ASV_CONF_DIR", os.getcwd()), "profiles"),
+    )
+
+
+def profiling_enabled():
+    """ Whether the ``*_Profile`` benchmarks run (see ``RADIS_BENCHMARK_PROFILE``) """
+    return os.environ.get("RADIS_BENCHMARK_PROFILE", "") not in ("", "0")
+
+
+def save_cpu_profile(sampler, benchmark, folder=None):
+    """Write the collapsed stacks of ``sampler``, and a JSON summary
+
+    Files are stored in ``<folder>/<commit>/<environment>/<benchmark>.collapsed``
+    (and ``.json``), the commit and environment being those of the asv run
+    (``ASV_COMMIT`` and ``ASV_ENV_NAME``), or of the installed RADIS version
+    outside of asv, as for :py:func:`~benchmarks.memprofile.save_memory_profile`.
+
+    Returns
+    -------
+    str: path of the collapsed stacks file
+    """
+    from radis import get_version
+
+    if folder is None:
+        folder = get_profile_folder()
+    commit = os.environ.get("ASV_COMMIT", get_version(add_git_number=False))[:8]
+    env = os.environ.get("ASV_ENV_NAME", "local")
+    fname = join(folder, commit, env, "{0}.collapsed".format(benchmark))
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+    with open(fname, "w") as f:
+        f.write("\n".join(sampler.collapsed()) + "\n")
+    summary = {
+        "benchmark": benchmark,
+        "commit": os.environ.get("ASV_COMMIT"),
+        "environment": env,
+        "radis_version": get_version(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "duration": sampler.duration,
+        "n_samples": sampler.n_samples,
+        "interval": sampler.interval,
+        "self_time": dict(list(sampler.self_time().items())[:TOP_FUNCTIONS]),
+    }
+    with open(fname[: -len(".collapsed")] + ".json", "w") as f:
+        json.dump(summary, f, indent=1)
+    return fname
+
+
+def _benchmark_name(cls, method, params):
+    name = "{0}.{1}.{2}".format(cls.__module__, cls.__name__, method)
+    if params:
+        name += "({0})".format(", ".join(str(p) for p in params))
+    return name
+
+
+def _profile_method(cls, method, warmup=True):
+    has_cache = hasattr(cls, "setup_cache")
+
+    def track_profile(self, *args):
+        func = getattr(cls, method)
+        if warmup:
+            func(self, *args)
+        sampler = StackSampler()
+        with sampler:
+            func(self, *args)
+        save_cpu_profile(sampler, _benchmark_name(cls, method, args[1:] if has_cache else args))
+        return sampler.duration
+
+    track_profile.__name__ = "track_{0}_profile".format(method[len("time_") :])
+    track_profile.__doc__ = "Profiled time of ``{0}.{1}`` ; collapsed stacks are saved".format(
+        cls.__name__, method
+    )
+    track_profile.unit = "seconds"
+    return track_profile
+
+
+def profiled(cls, warmup=True):
+    """Class with one ``track_*_profile`` benchmark per ``time_*`` benchmark of ``cls``
+
+    Setup, setup cache, parameters and helper methods are those of ``cls`` ;
+    its benchmarks are not copied. The class does not derive from ``cls`` :
+    its methods must call base classes explicitly, not with ``super()``.
+    Setup skips the benchmarks (raises :py:class:`NotImplementedError`)
+    unless :py:func:`profiling_enabled`.
+
+    Parameters
+    ----------
+    cls: class
+        asv benchmark class
+    warmup: bool
+        run each benchmark once before the profiled run. Set to ``False``
+        for benchmarks that can run only once per setup (ex: they modify the
+        factory state) ; their setup must then compile the numba functions.
+    """
+    attrs = {}
+    for klass in reversed(cls.__mro__[:-1]):
+        for k, v in vars(klass).items():
+            if not k.startswith("__") and not k.startswith(BENCHMARK_PREFIXES):
+                attrs[k] = v
+    setup = attrs.get("setup")
+
+    def setup_profile(self, *args):
+        if not profiling_enabled():
+            raise NotImplementedError("set RADIS_BENCHMARK_PROFILE=1 to profile the benchmarks")
+        if setup is not None:
+            setup(self, *args)
+
+    attrs["setup"] = setup_profile
+    attrs["repeat"] = 1
+    for method in dir(cls):
+        if method.startswith("time_"):
+            track = _profile_method(cls, method, warmup)
+            attrs[track.__name__] = track
+    attrs["__module__"] = __name__
+    attrs["__doc__"] = "Hot paths of the ``time_*`` benchmarks of :py:class:`~{0}.{1}`".format(
+        cls.__module__, cls.__name__
+    )
+    return type(cls.__name__ + "_Profile", (), attrs)
+
+
+CO2_HITRAN_Profile = profiled(_suite.CO2_HITRAN)
+CO2_HITEMP_Profile = profiled(_suite.CO2_HITEMP)
+CO2_HITEMP_NonEq_Profile = profiled(_suite.CO2_HITEMP_NonEq)
+# stages modify the factory state : one call per setup (numba compiled by the setup)
+CO2_HITEMP_Load_Profile = profiled(_suite.CO2_HITEMP_Load, warmup=False)
+CO2_HITEMP_Linestrength_Profile = profiled(_suite.CO2_HITEMP_Linestrength, warmup=False)
+CO2_HITEMP_Broadening_Profile = profiled(_suite.CO2_HITEMP_Broadening, warmup=False)
+# the sweep is prepared by the warm-up : the profile is the temperature-dependent part
+CO2_HITEMP_TemperatureSweep_Profile = profiled(_suite.CO2_HITEMP_TemperatureSweep)
+CO2_Scaling_Profile = profiled(_scaling.CO2_Scaling)
+CO2_Scaling_NonEq_Profile = profiled(_scaling.CO2_Scaling_NonEq)
+CO2_Broadening_Profile = profiled(_broadening.CO2_Broadening)
+LOS_SerialSlabs_Profile = profiled(_slabs.LOS_SerialSlabs)
+LOS_MergeSlabs_Profile = profiled(_slabs.LOS_MergeSlabs)
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Spectrum fitting benchmarks
+
+Benchmarks the 17 LMFIT methods compared in
+``manual_benchmarks/plot_newfitting_comparison_algorithm.py`` : final
+residual and number of function evaluations as in the script, and also the
+wall time per evaluation and the total time to converge.
+
+:py:class:`FitEngine` evaluates the same residual as
+:py:func:`~radis.tools.new_fitting.fit_spectrum` (model spectrum, slit,
+offset, normalization, L2 residual), in two modes :
+
+- ``"recompute"`` : the model spectrum is recalculated from scratch at each
+  evaluation (:py:meth:`~radis.lbl.factory.SpectrumFactory.eq_spectrum`), as
+  in :py:func:`~radis.tools.new_fitting.fit_spectrum`.
+- ``"reuse"`` : lines are loaded, shifted and sorted once, wavenumber grids
+  and lineshape ranges are kept between evaluations, and only the
+  temperature-dependent terms (linestrengths, widths, lineshapes) are
+  recomputed (see :py:class:`~benchmarks.sweep.TemperatureSweep`). Only the
+  gas temperature and offsets can then be fitted.
+
+Both modes give the same spectra. Fits run on a synthetic CO2 spectrum, so
+they do not need any download.
+
+Examples
+--------
+::
+
+    sf, s_data = get_fit_problem()
+    engine = FitEngine(sf, s_data, {"slit": "1 nm"}, {"fit_var": "radiance"}, mode="reuse")
+    result = engine.fit({"Tgas": 700}, {"Tgas": [500, 2000]}, method="leastsq")
+
+"""
+
+from time import perf_counter, time
+
+import numpy as np
+
+from radis import Spectrum
+
+from .compat import require_synthetic
+from .sweep import TemperatureSweep
+from .synthetic import synthetic_factory, use_synthetic_databank
+
+METHODS = [
+    "leastsq",  # Levenberg-Marquardt
+    "least_squares",  # Least-Squares minimization, using Trust Region Reflective method
+    "differential_evolution",  # Differential evolution
+    "brute",  # Brute force
+    "basinhopping",  # Basin-hopping
+    "ampgo",  # Adaptive Memory Programming for Global Optimization
+    "nelder",  # Nelder-Mead method
+    "lbfgsb",  # Limited-memory Broyden–Fletcher–Goldfarb–Shanno (L-BFGS-B)
+    "powell",  # Powell method
+    "cg",  # Conjugate-gradient
+    "cobyla",  # Cobyla method
+    "bfgs",  # Broyden–Fletcher–Goldfarb–Shanno (BFGS)
+    "tnc",  # Truncated Newton
+    "trust-constr",  # Trust-region for constrained optimization
+    "slsqp",  # Sequential Linear Squares Programming
+    "shgo",  # Simplicial Homology Global Optimization
+    "dual_annealing",  # Dual Annealing optimization
+]
+MAX_LOOP = 150  # max number of function evaluations, as in the comparison script
+SEEDED_METHODS = ["differential_evolution", "dual_annealing"]  # stochastic : fixed seed
+
+# Synthetic fitting problem : find the temperature of a CO2 emission spectrum
+T_TRUE = 1200  # K
+FIT_PARAMETERS = {"Tgas": 700}
+BOUNDING_RANGES = {"Tgas": [500, 2000]}
+FIT_MODEL = {"slit": "1 nm"}
+FIT_PROPERTIES = {"fit_var": "radiance", "normalize": False, "max_loop": MAX_LOOP, "tol": 1e-15}
+N_LINES = 5_000
+WAVENUM_MIN, WAVENUM_MAX = 2200, 2250  # cm-1
+FIT_FACTORY_KWARGS = {
+    "wstep": 0.01,
+    "truncation": 5,
+    "neighbour_lines": 5,
+    "cutoff": 0,
+    "pressure": 1,
+    "mole_fraction": 0.1,
+    "path_length": 1,
+}
+
+
+def get_fit_problem(n_lines=N_LINES):
+    """Synthetic CO2 spectrum to fit, and the factory that models it
+
+    The "experimental" spectrum is the radiance calculated at
+    :py:data:`T_TRUE`, convolved with the slit of :py:data:`FIT_MODEL`.
+
+    Returns
+    -------
+    sf: SpectrumFactory
+        lines loaded ; pressure, mole fraction and path length set
+    s_data: Spectrum
+    """
+    sf = synthetic_factory(n_lines, WAVENUM_MIN, WAVENUM_MAX, **FIT_FACTORY_KWARGS)
+    slit_val, slit_unit = FIT_MODEL["slit"].split()
+    s_data = sf.eq_spectrum(T_TRUE).apply_slit(float(slit_val), slit_unit)
+    s_data = s_data.take(FIT_PROPERTIES["fit_var"])
+    return sf, s_data
+
+
+class FitEngine:
+    """Residual of :py:func:`~radis.tools.new_fitting.fit_spectrum`, with reusable preparation
+
+    Parameters
+    ----------
+    sf: SpectrumFactory
+        factory with its line database loaded, and the fixed conditions
+        (pressure, mole fraction, path length) as inputs
+    s_data: Spectrum
+        experimental spectrum, on the spectral range of the factory
+    model: dict
+        post-processing of the model spectrum : ``"slit"`` and ``"offset"``
+        as in :py:func:`~radis.tools.new_fitting.fit_spectrum`
+    pipeline: dict
+        ``"fit_var"``, ``"normalize"`` as in
+        :py:func:`~radis.tools.new_fitting.fit_spectrum`
+    mode: ``"recompute"`` or ``"reuse"``
+        see :py:mod:`benchmarks.fitting`
+
+    Attributes
+    ----------
+    spectrum_source: callable
+        ``values -> Spectrum`` compared to the data. Default
+        :py:meth:`~benchmarks.fitting.FitEngine.processed_spectrum` ; can be
+        replaced by a surrogate (see :py:mod:`benchmarks.surrogate`)
+    log: dict
+        residual, fit values, wall time and end time (``time.time()``, can be
+        compared between processes) of each evaluation
+    """
+
+    def __init__(self, sf, s_data, model, pipeline, mode="reuse"):
+        if mode not in ["recompute", "reuse"]:
+            raise ValueError("mode must be 'recompute' or 'reuse'. Got {0}".format(mode))
+        self.sf = sf
+        self.s_data = s_data
+        self.model = model
+        self.pipeline = pipeline
+        self.mode = mode
+        self.sweep = TemperatureSweep(sf) if mode == "reuse" else None
+        self.spectrum_source = self.processed_spectrum
+        self.reset_log()
+
+    def reset_log(self):
+        self.log = {"residual": [], "fit_vals": [], "eval_time": [], "timestamp": []}
+
+    def model_spectrum(self, Tgas, **conditions):
+        """Spectrum at ``Tgas``, before slit and offsets
+
+        Other ``conditions`` (ex: ``mole_fraction``) are passed to
+        :py:meth:`~radis.lbl.factory.SpectrumFactory.eq_spectrum` ; they
+        cannot change in ``"reuse"`` mode.
+        """
+        if self.mode == "recompute":
+            return self.sf.eq_spectrum(Tgas, **conditions)
+        if conditions:
+            raise ValueError(
+                "Only Tgas and offsets can be fitted in 'reuse' mode. Got {0}".format(list(conditions))
+            )
+        wavenumber, abscoeff = self.sweep.abscoeff(Tgas)
+        s = Spectrum.from_array(
+            wavenumber,
+            abscoeff,
+            "abscoeff",
+            wunit="cm-1",
+            Iunit="cm-1",
+            conditions={
+                "Tgas": Tgas,
+                "path_length": self.sf.input.path_length,
+                "thermal_equilibrium": True,
+            },
+            cond_units={"Tgas": "K", "path_length": "cm"},
+        )
+        s.update(verbose=False)  # radiance, transmittance, ... at equilibrium
+        return s
+
+    def processed_spectrum(self, values):
+        """Model spectrum compared to the data : slit, offsets, fit variable, normalization
+
+        Same steps as :py:func:`~radis.tools.new_fitting.residual_LTE`
+
+        Parameters
+        ----------
+        values: dict
+            values of the fit parameters
+        """
+        conditions = {k: v for (k, v) in values.items() if k not in ["offsetnm", "offsetcm1"]}
+        s_model = self.model_spectrum(**conditions)
+        if "offsetnm" in values:
+            s_model = s_model.offset(values["offsetnm"], "nm")
+        if "offsetcm1" in values:
+            s_model = s_model.offset(values["offsetcm1"], "cm-1")
+        if "slit" in self.model:
+            slit_val, slit_unit = self.model["slit"].split()
+            s_model = s_model.apply_slit(float(slit_val), slit_unit)
+        s_model = s_model.take(self.pipeline["fit_var"])
+        if "offset" in self.model:
+            off_val, off_unit = self.model["offset"].split()
+            s_model = s_model.offset(float(off_val), off_unit)
+        if self.pipeline.get("normalize", False):
+            s_model = s_model.normalize()
+        return s_model
+
+    def residual(self, params):
+        """L2 residual between the data and the spectrum of :py:attr:`~benchmarks.fitting.FitEngine.spectrum_source`"""
+        from radis.spectrum.compare import get_residual
+
+        t0 = perf_counter()
+        values = {name: float(p) for (name, p) in params.items()}
+        s_model = self.spectrum_source(values)
+        fit_var = self.pipeline["fit_var"]
+        residual = get_residual(s_model, self.s_data, fit_var, norm="L2", ignore_nan=True)
+
+        self.log["residual"].append(residual)
+        self.log["fit_vals"].append(list(values.values()))
+        self.log["eval_time"].append(perf_counter() - t0)
+        self.log["timestamp"].append(time())
+        return residual
+
+    def fit(
+        self,
+        fit_params,
+        bounds,
+        method="leastsq",
+        max_nfev=MAX_LOOP,
+        target=None,
+        stop=None,
+        **fit_kws
+    ):
+        """Minimize the residual with LMFIT
+
+        Parameters
+        ----------
+        fit_params, bounds: dict
+            initial values and bounding ranges of the fit parameters
+        method: str
+            LMFIT method
+        max_nfev: int
+            max number of evaluations
+        target: float
+            stop as soon as the residual is below ``target``
+        stop: ``multiprocessing.Event``
+            stop as soon as it is set (ex: another worker reached the target)
+
+        Returns
+        -------
+        result: lmfit.minimizer.MinimizerResult
+            ``None`` if the fit was stopped (``target`` reached, or ``stop``
+            set) : see :py:attr:`~benchmarks.fitting.FitEngine.log`
+        """
+        from lmfit import Parameters, minimize
+        from lmfit.minimizer import AbortFitException
+
+        params = Parameters()
+        for name, value in fit_params.items():
+            vmin, vmax = bounds.get(name, (-np.inf, np.inf))
+            params.add(name, value=value, min=vmin, max=vmax)
+        if method == "lbfgsb" and "tol" in self.pipeline:
+            fit_kws["tol"] = self.pipeline["tol"]
+        if target is not None or stop is not None:
+
+            def iter_cb(params, iteration, resid, *args, **kwargs):
+                """ Returning True aborts the fit """
+                reached = target is not None and np.all(resid <= target)
+                return bool(reached or (stop is not None and stop.is_set()))
+
+            fit_kws["iter_cb"] = iter_cb
+        self.reset_log()
+        try:
+            return minimize(self.residual, params, method=method, max_nfev=max_nfev, **fit_kws)
+        except AbortFitException:  # not always caught by LMFIT (scalar minimizers)
+            return None
+
+
+def elapsed_to_target(log, target, start):
+    """Time from ``start`` (``time.time()``) to the first evaluation of ``log`` below ``target``
+
+    Returns ``nan`` if the target was not reached.
+    """
+    reached = [t for (t, r) in zip(log["timestamp"], log["residual"]) if r <= target]
+    return min(reached) - start if reached else np.nan
+
+
+class CO2_FitEngine:
+    """
+    Fit of the temperature of a synthetic CO2 spectrum (5k lines) with all
+    LMFIT methods, recomputing each model spectrum from scratch or reusing
+    the preparation of the lines.
+    """
+
+    params = (METHODS, ["recompute", "reuse"])
+    param_names = ["method", "mode"]
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 600
+
+    def setup_cache(self):
+        """Fit once per method and mode
+
+        asv runs ``setup`` in a new process for each ``track_*`` benchmark :
+        the fits run here, and all benchmarks of a method read the same fit.
+
+        Returns
+        -------
+        dict
+            ``{(method, mode): summary}`` : fit time, mean time per
+            evaluation, number of evaluations and best residual, or the error
+            raised by the fit
+        """
+        require_synthetic()
+        sf, s_data = get_fit_problem()
+        fits = {}
+        for mode in self.params[1]:
+            engine = FitEngine(sf, s_data, FIT_MODEL, FIT_PROPERTIES, mode=mode)
+            engine.model_spectrum(FIT_PARAMETERS["Tgas"])  # compile numba functions
+            for method in self.params[0]:
+                fit_kws = {"seed": 0} if method in SEEDED_METHODS else {}
+                t0 = perf_counter()
+                try:
+                    engine.fit(FIT_PARAMETERS, BOUNDING_RANGES, method=method, **fit_kws)
+                except Exception as err:  # only fails the benchmarks of this method
+                    fits[method, mode] = {"error": repr(err)}
+                    continue
+                fits[method, mode] = {
+                    "time": perf_counter() - t0,
+                    "eval_time": float(np.mean(engine.log["eval_time"])),
+                    "nfev": len(engine.log["residual"]),
+                    # global methods do not end on their best evaluation
+                    "residual": float(min(engine.log["residual"])),
+                }
+        return fits
+
+    setup_cache.timeout = 3600
+
+    def setup(self, fits, method, mode):
+        self.fit = fits[method, mode]
+        if "error" in self.fit:
+            raise RuntimeError("{0} fit failed : {1}".format(method, self.fit["error"]))
+
+    def track_time_to_converge(self, fits, method, mode):
+        return self.fit["time"]
+
+    track_time_to_converge.unit = "seconds"
+
+    def track_time_per_evaluation(self, fits, method, mode):
+        return self.fit["eval_time"]
+
+    track_time_per_evaluation.unit = "seconds"
+
+    def track_nfev(self, fits, method, mode):
+        return self.fit["nfev"]
+
+    track_nfev.unit = "evaluations"
+
+    def track_residual(self, fits, method, mode):
+        """ Best residual of the fit """
+        return self.fit["residual"]
+
+    track_residual.unit = "L2"
+
+
+class NH3_FitSpectrum:
+    """
+    :py:func:`~radis.tools.new_fitting.fit_spectrum` on the NH3 case of
+    ``manual_benchmarks/plot_newfitting_comparison_algorithm.py`` (HITRAN
+    database ; every evaluation recomputes the spectrum)
+    """
+
+    params = [METHODS]
+    param_names = ["method"]
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 900
+
+    def setup_cache(self):
+        """Fit once per method (see :py:meth:`CO2_FitEngine.setup_cache`)
+
+        Returns
+        -------
+        dict
+            ``{method: summary}`` : fit time, number of evaluations, number of
+            residuals computed and best residual, or the error raised by the fit
+        """
+        if use_synthetic_databank():
+            raise NotImplementedError("fit_spectrum downloads the HITRAN database")
+        try:
+            from radis.tools.new_fitting import fit_spectrum
+        except ImportError:  # RADIS < 0.14
+            raise NotImplementedError("radis.tools.new_fitting not available")
+        from radis import load_spec
+        from radis.test.utils import getTestFile
+
+        s_experimental = load_spec(getTestFile("synth-NH3-1-500-2000cm-P10-mf0.01-p1.spec"))
+        model = {
+            "molecule": "NH3",
+            "isotope": "1",
+            "wmin": 1000,
+            "wmax": 1050,
+            "wunit": "cm-1",
+            "mole_fraction": 0.01,
+            "pressure": 10,
+            "path_length": 1,
+            "slit": "1 nm",
+            "offset": "-0.2 nm",
+            "wstep": 0.003,
+            "databank": "hitran",
+        }
+        fits = {}
+        for method in self.params[0]:
+            try:
+                _, result, log = fit_spectrum(
+                    s_exp=s_experimental,
+                    fit_params={"Tgas": 700},
+                    bounds={"Tgas": [500, 2000]},
+                    model=dict(model),  # "databank" is popped
+                    pipeline=dict(FIT_PROPERTIES, method=method),
+                    verbose=False,
+                    show_plot=False,
+                    fit_kws={"seed": 0} if method in SEEDED_METHODS else {},
+                )
+            except Exception as err:  # only fails the benchmarks of this method
+                fits[method] = {"error": repr(err)}
+                continue
+            fits[method] = {
+                "time": log["time_fitting"],
+                "nfev": result.nfev,
+                "n_residuals": len(log["residual"]),
+                "residual": float(min(log["residual"])),
+            }
+        return fits
+
+    setup_cache.timeout = 7200
+
+    def setup(self, fits, method):
+        self.fit = fits[method]
+        if "error" in self.fit:
+            raise RuntimeError("{0} fit failed : {1}".format(method, self.fit["error"]))
+
+    def track_time_to_converge(self, fits, method):
+        return self.fit["time"]
+
+    track_time_to_converge.unit = "seconds"
+
+    def track_time_per_evaluation(self, fits, method):
+        return self.fit["time"] / self.fit["n_residuals"]
+
+    track_time_per_evaluation.unit = "seconds"
+
+    def track_nfev(self, fits, method):
+        return self.fit["nfev"]
+
+    track_nfev.unit = "evaluations"
+
+    def track_residual(self, fits, method):
+        """ Best residual of the fit """
+        return self.fit["residual"]
+
+    track_residual.unit = "L2"
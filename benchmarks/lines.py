@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Line selection helpers
+
+Lines without vibrational assignment (``v1u == -1``) cannot be computed out of
+equilibrium. They are removed before
+:py:meth:`~radis.lbl.factory.SpectrumFactory.non_eq_spectrum`, outside of the
+timed region : once per environment in
+:py:meth:`~benchmarks.benchmarks.CO2_HITEMP.setup_cache` (lines are then
+loaded already filtered), or in ``setup`` for the smaller cases.
+
+See :py:class:`~benchmarks.benchmarks.CO2_HITEMP_LineFiltering` for the cost
+of the different ways of filtering.
+"""
+
+import numpy as np
+
+
+def assigned_lines(df):
+    """ Positions of the lines with a vibrational assignment """
+    return np.flatnonzero(df["v1u"].to_numpy() != -1)
+
+
+def take_assigned_lines(df):
+    """Lines of ``df`` with a vibrational assignment
+
+    One integer ``take`` per column (no intermediate boolean Series or index).
+    Returns ``df`` itself, without copy, if all lines are assigned.
+    """
+    index = assigned_lines(df)
+    if len(index) == len(df):
+        return df
+    attrs = df.attrs
+    df = df.take(index)
+    df.attrs = attrs
+    return df
+
+
+def drop_unassigned_lines(sf):
+    """ Remove the lines of ``sf.df0`` that cannot be computed out of equilibrium """
+    sf.df0 = take_assigned_lines(sf.df0)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Batched line-of-sight engine
+
+Same recurrence as :py:func:`radis.los.slabs.SerialSlabs` (light goes from the
+first slab to the last) ::
+
+    I = I * t_i + r_i
+    T = T * t_i
+
+but on radiance and transmittance arrays stacked once into contiguous 2-D
+arrays, without any unit conversion, copy or Spectrum object per slab. The
+spectral axis is processed by blocks small enough to stay in the CPU cache
+while all slabs are applied.
+
+The recurrence is associative : slabs can also be combined by pairs, then
+pairs of pairs, etc. (:py:func:`tree_reduce`), in log2(n_slabs) vectorized
+steps, or by chunks of consecutive slabs in different processes. Slabs in
+parallel (:py:func:`radis.los.slabs.MergeSlabs`) add their absorption and
+emission coefficients, reduced the same way.
+
+"""
+
+import numpy as np
+from numba import njit
+
+# Number of spectral points per block : 4 arrays of 4096 float64 = 128 kB,
+# fits in the L2 cache of most CPUs
+BLOCK_SIZE = 4096
+
+
+def common_grid(s_list):
+    """Wavenumbers shared by spectra on different grids : the intersection of
+    their ranges, on the smallest wavenumber step (as ``resample="intersect"``
+    in :py:func:`~radis.los.slabs.SerialSlabs`)
+
+    Returns
+    -------
+    w: numpy array
+        cm-1
+    """
+    grids = [s.get_wavenumber() for s in s_list]
+    wmin = max(w.min() for w in grids)
+    wmax = min(w.max() for w in grids)
+    wstep = min(np.abs(np.diff(w)).min() for w in grids)
+    return np.arange(wmin, wmax + wstep / 2, wstep)
+
+
+def stack_slabs(s_list, radiance="radiance_noslit", transmittance="transmittance_noslit", w=None):
+    """Stack the radiance and transmittance of spectra in 2-D arrays
+
+    Spectra must share the same wavespace and units (no conversion is done),
+    or be resampled on ``w``.
+
+    Parameters
+    ----------
+    s_list: list of Spectrum
+        slabs, in the order light travels through them
+    w: numpy array
+        if given, wavenumbers (cm-1) on which the slabs are linearly
+        interpolated, ex : :py:func:`~benchmarks.los.common_grid`. Spectra
+        must then be stored in cm-1.
+
+    Returns
+    -------
+    R, T: numpy arrays of shape (n_slabs, n_points)
+        C-contiguous radiance and transmittance
+    """
+    n = len(s_list[0].get(transmittance, copy=False)[1]) if w is None else len(w)
+    R = np.empty((len(s_list), n))
+    T = np.empty((len(s_list), n))
+    for i, s in enumerate(s_list):
+        if w is None:
+            R[i] = s.get(radiance, copy=False)[1]
+            T[i] = s.get(transmittance, copy=False)[1]
+        else:
+            R[i] = np.interp(w, *s.get(radiance, wunit="cm-1", copy=False))
+            T[i] = np.interp(w, *s.get(transmittance, wunit="cm-1", copy=False))
+    return R, T
+
+
+def serial_slabs_batched(R, T, block_size=BLOCK_SIZE):
+    """Radiance and transmittance of slabs in series, computed by spectral blocks
+
+    Parameters
+    ----------
+    R, T: numpy arrays of shape (n_slabs, n_points)
+        radiance and transmittance of each slab, see :py:func:`~benchmarks.los.stack_slabs`
+    block_size: int
+        number of spectral points processed at once
+
+    Returns
+    -------
+    I, Ttot: numpy arrays of shape (n_points,)
+        radiance and transmittance of the line of sight
+
+    See Also
+    --------
+    :py:func:`~benchmarks.los.serial_slabs_numba`
+    """
+    n = R.shape[1]
+    I = np.zeros(n)
+    Ttot = np.ones(n)
+    for start in range(0, n, block_size):
+        Ib = I[start : start + block_size]
+        Tb = Ttot[start : start + block_size]
+        for ri, ti in zip(R[:, start : start + block_size], T[:, start : start + block_size]):
+            Ib *= ti
+            Ib += ri
+            Tb *= ti
+    return I, Ttot
+
+
+@njit
+def serial_slabs_numba(R, T):
+    """Compiled version of :py:func:`~benchmarks.los.serial_slabs_batched`
+
+    Arrays are passed as arguments (not closed over as globals) so that
+    numba knows their type and layout at compile time.
+    """
+    n_slabs, n = R.shape
+    I = np.zeros(n)
+    Ttot = np.ones(n)
+    for i in range(n_slabs):
+        for j in range(n):
+            I[j] = I[j] * T[i, j] + R[i, j]
+            Ttot[j] *= T[i, j]
+    return I, Ttot
+
+
+def tree_reduce(A, B, mode="serial"):
+    """Combine slabs by pairs of neighbours, until one is left
+
+    Parameters
+    ----------
+    A, B: numpy arrays of shape (n_slabs, n_points)
+        ``"serial"`` : radiance and transmittance of each slab, in the order
+        light travels through them (see :py:func:`~benchmarks.los.stack_slabs`).
+        ``"merge"`` : emission and absorption coefficients of slabs of the same
+        path length.
+    mode: ``"serial"``, ``"merge"``
+
+    Returns
+    -------
+    a, b: numpy arrays of shape (n_points,)
+        radiance and transmittance of the line of sight (``"serial"``), or
+        emission and absorption coefficients of the merged slab (``"merge"``)
+
+    See Also
+    --------
+    :py:func:`~benchmarks.los.merged_radiance`
+    """
+    if mode not in ["serial", "merge"]:
+        raise ValueError("mode should be 'serial' or 'merge'. Got {0}".format(mode))
+    while len(A) > 1:
+        n = len(A) // 2 * 2
+        if mode == "serial":
+            A_pairs = A[0:n:2] * B[1:n:2] + A[1:n:2]
+            B_pairs = B[0:n:2] * B[1:n:2]
+        else:
+            A_pairs = A[0:n:2] + A[1:n:2]
+            B_pairs = B[0:n:2] + B[1:n:2]
+        if n < len(A):  # odd number of slabs : the last one is combined at the next step
+            A_pairs = np.concatenate((A_pairs, A[n:]))
+            B_pairs = np.concatenate((B_pairs, B[n:]))
+        A, B = A_pairs, B_pairs
+    return A[0], B[0]
+
+
+def merged_radiance(emisscoeff, abscoeff, path_length):
+    """Radiance and transmittance of a slab from its coefficients, with self-absorption,
+    as in :py:meth:`~radis.spectrum.spectrum.Spectrum.update`
+
+    Returns
+    -------
+    radiance, transmittance: numpy arrays
+        in the units of ``emisscoeff`` times cm, and no unit
+    """
+    absorbance = abscoeff * path_length
+    radiance = emisscoeff * path_length  # optically thin limit
+    b = abscoeff != 0
+    radiance[b] = emisscoeff[b] / abscoeff[b] * -np.expm1(-absorbance[b])
+    return radiance, np.exp(-absorbance)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Memory breakdown of a spectrum calculation, stage by stage
+
+``peakmem_*`` benchmarks only report one peak RSS. :py:class:`MemoryTracer`
+records, for each stage of the calculation :
+
+- the traced memory (:py:mod:`tracemalloc`) at start and end, and its peak,
+- the RSS at start and end, and its peak (sampled in a background thread),
+- the top allocators of the stage (difference of tracemalloc snapshots,
+  grouped by traceback).
+
+Stages are the entries of the RADIS :py:class:`~radis.misc.profiler.Profiler`
+("reinitialize", "scaled_eq_linestrength", "calc_lineshift", ...) found
+automatically, plus the stages declared by the benchmark with
+:py:meth:`~benchmarks.memprofile.MemoryTracer.stage`.
+
+Tracing slows the calculation down : it is used in ``track_*`` benchmarks
+(see :py:class:`~benchmarks.benchmarks.CO2_HITEMP_MemoryProfile`), never in the
+``time_*`` or ``peakmem_*`` ones. The breakdown is written as JSON, next to the
+asv results, by :py:func:`~benchmarks.memprofile.save_memory_profile`.
+
+Environment variables :
+
+- ``RADIS_BENCHMARK_MEMPROFILE`` : output folder. Default ``memprofile/`` in the
+  asv project folder.
+
+Examples
+--------
+::
+
+    tracer = MemoryTracer()
+    with tracer:
+        with tracer.stage("prepare_lines"):
+            ...
+        sf.non_eq_spectrum(...)
+    save_memory_profile(tracer, "benchmarks.CO2_HITEMP_NonEq.peakmem_noneq_spectrum")
+
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from os.path import join
+
+from psutil import Process
+
+SAMPLING_INTERVAL = 0.005  # s ; RSS sampling period
+TOP_ALLOCATORS = 10  # allocators stored per stage
+SNAPSHOT_LEVEL = 2  # tracemalloc snapshots only for stages up to this profiler level
+SNAPSHOT_MIN_DURATION = 0.01  # s ; no snapshot for shorter stages
+TOP_MIN_MEMORY = 1e6  # B ; no top allocators for stages that allocate less
+NFRAMES = 6  # frames stored per allocation ; tracing cost grows with it
+
+
+class MemoryTracer:
+    """Trace memory per stage while the context is active
+
+    Parameters
+    ----------
+    sampling_interval: float
+        RSS sampling period (s)
+    snapshot_level: int
+        take tracemalloc snapshots (to find top allocators) for stages up to
+        this profiler level only ; snapshots of deeply nested stages would cost
+        more than the stages themselves.
+    top: int
+        number of top allocators stored per stage
+
+    Notes
+    -----
+    Comparing snapshots is the main cost of tracing. Snapshots are only taken
+    at the end of the stages : the top allocators of a stage are the
+    difference with the last snapshot taken before the stage started (end of
+    the previous stage, or start of the trace), and may include a few
+    allocations of the parent stage. They are computed once the trace is
+    over, and only for stages longer than :py:data:`SNAPSHOT_MIN_DURATION`
+    that allocate more than :py:data:`TOP_MIN_MEMORY`.
+
+    Attributes
+    ----------
+    stages: list of dict
+        one record per stage, in the order they end
+    rss_timeline: list of (float, int)
+        sampled (time, RSS) pairs, time relative to the start of the trace
+    total: dict
+        record of the whole trace, once the context is exited
+    """
+
+    def __init__(
+        self,
+        sampling_interval=SAMPLING_INTERVAL,
+        snapshot_level=SNAPSHOT_LEVEL,
+        top=TOP_ALLOCATORS,
+    ):
+        self.sampling_interval = sampling_interval
+        self.snapshot_level = snapshot_level
+        self.top = top
+        self.stages = []
+        self.rss_timeline = []
+        self._open = {}
+        self._process = Process()
+
+    # %% Context
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self._running = True
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+        tracemalloc.start(NFRAMES)
+        self._patch_profiler()
+        self._last_snapshot = tracemalloc.take_snapshot()
+        self._start("total", 0)
+        return self
+
+    def __exit__(self, *exc):
+        self._stop("total")
+        self.total = self.stages[-1]
+        self._unpatch_profiler()
+        tracemalloc.stop()
+        self._running = False
+        self._sampler.join()
+        self._rss_peaks()
+        for record in self.stages:
+            snapshots = record.pop("_snapshots", None)
+            allocated = max(
+                record["traced_peak"] - record["traced_start"],
+                abs(record["traced_end"] - record["traced_start"]),
+            )
+            if snapshots is not None and allocated >= TOP_MIN_MEMORY:
+                record["top_allocators"] = self._top_allocators(*snapshots)
+        return False
+
+    @contextmanager
+    def stage(self, name, level=1):
+        """ Declare a stage of the calculation, ex: a preprocessing step of the benchmark """
+        self._start(name, level)
+        try:
+            yield
+        finally:
+            self._stop(name)
+
+    # %% Stage records
+
+    def _start(self, name, level):
+        self._update_peaks()
+        current, _ = tracemalloc.get_traced_memory()
+        self._open[name] = {
+            "name": name,
+            "level": level,
+            "start": time.perf_counter() - self._t0,
+            "traced_start": current,
+            "traced_peak": current,
+            "rss_start": self._process.memory_info().rss,
+            "_snapshot": self._last_snapshot,
+        }
+
+    def _stop(self, name):
+        if name not in self._open:
+            return
+        self._update_peaks()
+        record = self._open.pop(name)
+        current, _ = tracemalloc.get_traced_memory()
+        record.update(
+            {
+                "end": time.perf_counter() - self._t0,
+                "traced_end": current,
+                "rss_end": self._process.memory_info().rss,
+            }
+        )
+        start_snapshot = record.pop("_snapshot")
+        if (
+            record["level"] <= self.snapshot_level
+            and record["end"] - record["start"] >= SNAPSHOT_MIN_DURATION
+        ):
+            self._last_snapshot = tracemalloc.take_snapshot()
+            record["_snapshots"] = (start_snapshot, self._last_snapshot)
+        self.stages.append(record)
+
+    def _update_peaks(self):
+        """Fold the tracemalloc peak since the last event into all open stages
+
+        The peak is then reset, so that each stage gets the peak of its own
+        time interval. Python < 3.9 cannot reset it : peaks are then those of
+        the whole trace so far.
+        """
+        _, peak = tracemalloc.get_traced_memory()
+        for record in self._open.values():
+            record["traced_peak"] = max(record["traced_peak"], peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def _top_allocators(self, start_snapshot, end_snapshot):
+        """ Allocations still alive at the end of the stage, grouped by traceback """
+        diff = end_snapshot.compare_to(start_snapshot, "traceback")
+        return [
+            {
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "traceback": [
+                    "{0}:{1}".format(frame.filename, frame.lineno)
+                    for frame in stat.traceback
+                ],
+            }
+            for stat in diff[: self.top]
+        ]
+
+    # %% RSS sampling
+
+    def _sample_rss(self):
+        while self._running:
+            self.rss_timeline.append(
+                (time.perf_counter() - self._t0, self._process.memory_info().rss)
+            )
+            time.sleep(self.sampling_interval)
+
+    def _rss_peaks(self):
+        for record in self.stages:
+            samples = [
+                rss
+                for (t, rss) in self.rss_timeline
+                if record["start"] <= t <= record["end"]
+            ]
+            record["rss_peak"] = max(samples + [record["rss_start"], record["rss_end"]])
+
+    # %% RADIS Profiler hooks
+
+    def _patch_profiler(self):
+        """ Record each RADIS profiler entry as a stage """
+        try:
+            from radis.misc.profiler import Profiler
+        except ImportError:  # older RADIS : total only
+            self._profiler = None
+            return
+        self._profiler = Profiler
+        self._profiler_methods = (Profiler.start, Profiler.stop)
+        tracer = self
+        start, stop = self._profiler_methods
+
+        def traced_start(profiler, key, verbose_level, *args, **kwargs):
+            tracer._start(key, verbose_level)
+            return start(profiler, key, verbose_level, *args, **kwargs)
+
+        def traced_stop(profiler, key, *args, **kwargs):
+            out = stop(profiler, key, *args, **kwargs)
+            tracer._stop(key)
+            return out
+
+        Profiler.start = traced_start
+        Profiler.stop = traced_stop
+
+    def _unpatch_profiler(self):
+        if self._profiler is not None:
+            self._profiler.start, self._profiler.stop = self._profiler_methods
+
+    # %% Export
+
+    def to_dict(self, max_samples=2000):
+        """Stage records, and the RSS timeline (downsampled to ``max_samples``)"""
+        step = max(1, len(self.rss_timeline) // max_samples)
+        return {
+            "stages": sorted(self.stages, key=lambda r: r["start"]),
+            "rss_timeline": self.rss_timeline[::step],
+        }
+
+
+def get_memprofile_folder():
+    """ Folder of the memory breakdowns, next to the asv results """
+    return os.environ.get(
+        "RADIS_BENCHMARK_MEMPROFILE",
+        join(os.environ.get("ASV_CONF_DIR", os.getcwd()), "memprofile"),
+    )
+
+
+def save_memory_profile(tracer, benchmark, folder=None):
+    """Write the memory breakdown of ``tracer`` as JSON
+
+    Files are stored in ``<folder>/<commit>/<environment>/<benchmark>.json``,
+    the commit and environment being those of the asv run (``ASV_COMMIT`` and
+    ``ASV_ENV_NAME``), or of the installed RADIS version outside of asv.
+
+    Returns
+    -------
+    str: path of the file written
+    """
+    from radis import get_version
+
+    if folder is None:
+        folder = get_memprofile_folder()
+    commit = os.environ.get("ASV_COMMIT", get_version(add_git_number=False))[:8]
+    env = os.environ.get("ASV_ENV_NAME", "local")
+    fname = join(folder, commit, env, "{0}.json".format(benchmark))
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+    profile = tracer.to_dict()
+    profile.update(
+        {
+            "benchmark": benchmark,
+            "commit": os.environ.get("ASV_COMMIT"),
+            "environment": env,
+            "radis_version": get_version(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    )
+    with open(fname, "w") as f:
+        json.dump(profile, f, indent=1)
+    return fname
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel global fitting
+
+Global optimizers (``differential_evolution``, ``basinhopping``, ``ampgo``,
+``dual_annealing``) are the robust choice for multi-parameter fits, but need
+far more evaluations than local ones (see :py:mod:`benchmarks.fitting`).
+:py:class:`ParallelFit` evaluates them in parallel worker processes :
+
+- ``"multistart"`` : local fits (LMFIT, ``lbfgsb`` by default) started from
+  random seeds within the bounds, one per task ; all workers stop as soon as
+  one of them reaches the target residual.
+- ``"population"`` : differential evolution (:py:func:`scipy.optimize.differential_evolution`),
+  the members of each generation being evaluated in parallel.
+
+Each worker builds its :py:class:`~benchmarks.fitting.FitEngine` once : the
+line database is memory-mapped and shared by all workers (see
+:py:mod:`benchmarks.throughput`), the experimental spectrum is sent once when
+the worker starts.
+
+Examples
+--------
+::
+
+    sf, s_data = get_fit_problem()
+    with ParallelFit(s_data, n_workers=8) as fitter:
+        best, residual, log = fitter.multistart(fit_params, bounds, n_starts=16, target=1e-6)
+
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import time
+
+import numpy as np
+
+from .compat import require_synthetic
+from .fitting import (
+    FIT_FACTORY_KWARGS,
+    FIT_MODEL,
+    FIT_PROPERTIES,
+    MAX_LOOP,
+    N_LINES,
+    SEEDED_METHODS,
+    WAVENUM_MAX,
+    WAVENUM_MIN,
+    FitEngine,
+    elapsed_to_target,
+    get_fit_problem,
+)
+from .throughput import _n_workers_list, prepare_shared_databank, shared_factory
+
+# Multi-parameter fitting problem : temperature and spectral offset
+GLOBAL_FIT_PARAMETERS = {"Tgas": 700, "offsetcm1": 0.3}
+GLOBAL_BOUNDING_RANGES = {"Tgas": [500, 2000], "offsetcm1": [-1, 1]}
+TARGET_RESIDUAL = 1e-6
+GLOBAL_METHODS = ["differential_evolution", "basinhopping", "ampgo", "dual_annealing"]
+POPSIZE = 15  # population of differential evolution, per parameter (scipy default)
+
+# %% Workers
+
+_engine = None  # FitEngine of the worker process
+_stop = None  # set when a worker reached the target
+
+
+def _init_fit_worker(header_path, shared_folder, s_data, mode, stop):
+    global _engine, _stop
+    sf = shared_factory(
+        header_path,
+        shared_folder,
+        wavenum_min=WAVENUM_MIN,
+        wavenum_max=WAVENUM_MAX,
+        molecule="CO2",
+        isotope="1,2,3",
+        verbose=0,
+        **FIT_FACTORY_KWARGS
+    )
+    _engine = FitEngine(sf, s_data, FIT_MODEL, FIT_PROPERTIES, mode=mode)
+    _engine.model_spectrum(GLOBAL_FIT_PARAMETERS["Tgas"])  # compile numba functions
+    _stop = stop
+
+
+def _local_fit(start, bounds, method, max_nfev, target):
+    """ Local fit from ``start`` ; returns its best values, best residual and log """
+    if _stop.is_set():
+        return None, np.inf, None
+    result = _engine.fit(start, bounds, method, max_nfev, target=target, stop=_stop)
+    log = _engine.log
+    if target is not None and min(log["residual"]) <= target:
+        _stop.set()
+    best = int(np.argmin(log["residual"]))
+    return dict(zip(start, log["fit_vals"][best])), log["residual"][best], log
+
+
+def _evaluate(values):
+    """ Residual of one population member ; returns (residual, end time) """
+    residual = _engine.residual(values)
+    return residual, _engine.log["timestamp"][-1]
+
+
+# %% Parallel fit
+
+
+class ParallelFit:
+    """Fit the synthetic CO2 spectrum with workers evaluating seeds or population members in parallel
+
+    Parameters
+    ----------
+    s_data: Spectrum
+        experimental spectrum (see :py:func:`~benchmarks.fitting.get_fit_problem`)
+    n_workers: int
+        number of worker processes
+    mode: ``"reuse"`` or ``"recompute"``
+        see :py:class:`~benchmarks.fitting.FitEngine`
+    """
+
+    def __init__(self, s_data, n_workers=None, mode="reuse", n_lines=N_LINES):
+        header_path, shared_folder = prepare_shared_databank(n_lines, WAVENUM_MIN, WAVENUM_MAX)
+        self.n_workers = n_workers or os.cpu_count()
+        self._manager = multiprocessing.Manager()
+        self._stop = self._manager.Event()
+        self.executor = ProcessPoolExecutor(
+            self.n_workers,
+            # fork is unsafe once numba functions ran in the parent process
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_fit_worker,
+            initargs=(header_path, shared_folder, s_data, mode, self._stop),
+        )
+        # start all workers
+        list(self.executor.map(_evaluate, [GLOBAL_FIT_PARAMETERS] * self.n_workers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.executor.shutdown()
+        self._manager.shutdown()
+
+    def multistart(
+        self, fit_params, bounds, n_starts=None, method="lbfgsb", max_nfev=MAX_LOOP, target=None, seed=0
+    ):
+        """Local fits from ``n_starts`` seeds, in parallel
+
+        The first seed is ``fit_params`` ; the others are drawn uniformly
+        within ``bounds``. Default : one seed per worker. The residual is a
+        scalar : ``leastsq`` can only fit one parameter.
+
+        Returns
+        -------
+        best: dict
+            best fit values
+        residual: float
+        log: dict
+            ``"residual"`` and ``"timestamp"`` of all evaluations of all workers
+        """
+        n_starts = n_starts or self.n_workers
+        rng = np.random.default_rng(seed)
+        starts = [dict(fit_params)] + [
+            {k: rng.uniform(*bounds[k]) for k in fit_params} for _ in range(n_starts - 1)
+        ]
+        self._stop.clear()
+        futures = [
+            self.executor.submit(_local_fit, start, bounds, method, max_nfev, target)
+            for start in starts
+        ]
+        best, best_residual = None, np.inf
+        log = {"residual": [], "timestamp": []}
+        for future in as_completed(futures):
+            values, residual, worker_log = future.result()
+            if worker_log is not None:
+                log["residual"] += worker_log["residual"]
+                log["timestamp"] += worker_log["timestamp"]
+            if residual < best_residual:
+                best, best_residual = values, residual
+        return best, best_residual, log
+
+    def population(
+        self, fit_params, bounds, max_nfev=MAX_LOOP, target=None, popsize=POPSIZE, seed=0
+    ):
+        """Differential evolution, each generation evaluated in parallel
+
+        Returns
+        -------
+        best: dict
+            best fit values
+        residual: float
+        log: dict
+            ``"residual"`` and ``"timestamp"`` of all evaluations
+        """
+        from scipy.optimize import differential_evolution
+
+        names = list(fit_params)
+        log = {"residual": [], "timestamp": []}
+
+        def parallel_map(func, population):
+            """ Evaluate a generation in the workers ; ``func`` is not needed """
+            results = list(self.executor.map(_evaluate, [dict(zip(names, x)) for x in population]))
+            for residual, timestamp in results:
+                log["residual"].append(residual)
+                log["timestamp"].append(timestamp)
+            return [residual for (residual, _) in results]
+
+        def callback(xk, convergence=None):
+            """ Returning True stops the optimization """
+            return target is not None and min(log["residual"]) <= target
+
+        result = differential_evolution(
+            lambda x: np.nan,  # evaluated by parallel_map
+            [bounds[k] for k in names],
+            x0=[fit_params[k] for k in names],
+            popsize=popsize,
+            maxiter=max(max_nfev // (popsize * len(names)) - 1, 1),
+            workers=parallel_map,
+            updating="deferred",
+            polish=False,
+            callback=callback,
+            seed=seed,
+        )
+        best = int(np.argmin(log["residual"]))
+        return dict(zip(names, result.x)), log["residual"][best], log
+
+
+# %% Benchmarks
+
+
+def summarize_fit(log, start):
+    """Time to reach :py:data:`TARGET_RESIDUAL` (``nan`` if not reached), best
+    residual and number of evaluations of a fit started at ``start`` (``time.time()``)"""
+    return {
+        "time_to_target": elapsed_to_target(log, TARGET_RESIDUAL, start),
+        "residual": float(min(log["residual"])),
+        "nfev": len(log["residual"]),
+    }
+
+
+class CO2_GlobalFit:
+    """
+    Serial global fits of temperature and offset of a synthetic CO2 spectrum,
+    with the methods of the fitting comparison that exceed its loop limit.
+    Time to reach :py:data:`TARGET_RESIDUAL` (``nan`` if not reached).
+    """
+
+    params = [GLOBAL_METHODS]
+    param_names = ["method"]
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 900
+
+    def setup_cache(self):
+        """Fit once per method
+
+        asv runs ``setup`` in a new process for each ``track_*`` benchmark :
+        the fits run here, and all benchmarks of a method read the same fit.
+
+        Returns
+        -------
+        dict
+            ``{method: summary}`` (see :py:func:`summarize_fit`), or the error
+            raised by the fit
+        """
+        require_synthetic()
+        sf, s_data = get_fit_problem()
+        engine = FitEngine(sf, s_data, FIT_MODEL, FIT_PROPERTIES, mode="reuse")
+        engine.model_spectrum(GLOBAL_FIT_PARAMETERS["Tgas"])  # compile numba functions
+        fits = {}
+        for method in self.params[0]:
+            fit_kws = {"seed": 0} if method in SEEDED_METHODS else {}
+            start = time()
+            try:
+                engine.fit(
+                    GLOBAL_FIT_PARAMETERS,
+                    GLOBAL_BOUNDING_RANGES,
+                    method=method,
+                    max_nfev=10 * MAX_LOOP,
+                    target=TARGET_RESIDUAL,
+                    **fit_kws
+                )
+            except Exception as err:  # only fails the benchmarks of this method
+                fits[method] = {"error": repr(err)}
+                continue
+            fits[method] = summarize_fit(engine.log, start)
+        return fits
+
+    setup_cache.timeout = 3600
+
+    def setup(self, fits, method):
+        self.fit = fits[method]
+        if "error" in self.fit:
+            raise RuntimeError("{0} fit failed : {1}".format(method, self.fit["error"]))
+
+    def track_time_to_target(self, fits, method):
+        return self.fit["time_to_target"]
+
+    track_time_to_target.unit = "seconds"
+
+    def track_residual(self, fits, method):
+        return self.fit["residual"]
+
+    track_residual.unit = "L2"
+
+    def track_nfev(self, fits, method):
+        return self.fit["nfev"]
+
+    track_nfev.unit = "evaluations"
+
+
+class CO2_GlobalFit_Parallel:
+    """
+    Same fit as :py:class:`~benchmarks.multistart.CO2_GlobalFit`, with
+    multi-start seeds or differential evolution population members evaluated
+    by ``n_workers`` processes
+    """
+
+    params = (["multistart", "population"], _n_workers_list())
+    param_names = ["strategy", "n_workers"]
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 900
+
+    def setup_cache(self):
+        """Fit once per strategy and number of workers (see :py:meth:`CO2_GlobalFit.setup_cache`)
+
+        Returns
+        -------
+        dict
+            ``{(strategy, n_workers): summary}`` (see :py:func:`summarize_fit`),
+            or the error raised by the fit
+        """
+        require_synthetic()
+        _, s_data = get_fit_problem()
+        kwargs = {"max_nfev": 10 * MAX_LOOP, "target": TARGET_RESIDUAL}
+        fits = {}
+        for n_workers in self.params[1]:
+            with ParallelFit(s_data, n_workers) as fitter:
+                for strategy in self.params[0]:
+                    start = time()
+                    try:
+                        if strategy == "multistart":
+                            _, _, log = fitter.multistart(
+                                GLOBAL_FIT_PARAMETERS, GLOBAL_BOUNDING_RANGES, n_starts=2 * n_workers, **kwargs
+                            )
+                        else:
+                            _, _, log = fitter.population(GLOBAL_FIT_PARAMETERS, GLOBAL_BOUNDING_RANGES, **kwargs)
+                    except Exception as err:  # only fails the benchmarks of this strategy
+                        fits[strategy, n_workers] = {"error": repr(err)}
+                        continue
+                    fits[strategy, n_workers] = summarize_fit(log, start)
+        return fits
+
+    setup_cache.timeout = 3600
+
+    def setup(self, fits, strategy, n_workers):
+        self.fit = fits[strategy, n_workers]
+        if "error" in self.fit:
+            raise RuntimeError("{0} fit failed : {1}".format(strategy, self.fit["error"]))
+
+    def track_time_to_target(self, fits, strategy, n_workers):
+        return self.fit["time_to_target"]
+
+    track_time_to_target.unit = "seconds"
+
+    def track_residual(self, fits, strategy, n_workers):
+        return self.fit["residual"]
+
+    track_residual.unit = "L2"
+
+    def track_nfev(self, fits, strategy, n_workers):
+        return self.fit["nfev"]
+
+    track_nfev.unit = "evaluations"
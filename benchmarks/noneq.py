@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+"""
+Non-equilibrium spectra on (Tvib, Trot) grids
+
+Plasma diagnostics compare measured spectra to non-equilibrium spectra on 2-D
+grids of vibrational and rotational temperatures. Each
+:py:meth:`~radis.lbl.factory.SpectrumFactory.non_eq_spectrum` call sorts the
+lines by vibrational band again, and sums the partition function over all
+energy levels (1.2 million per CO2 isotope) for one temperature pair.
+
+:py:class:`PartitionFunctionGrid` groups the energy levels of an isotope by
+vibrational level once. Partition functions of a whole grid are then one
+matrix product, of the vibrational factors of each level (one column per
+Tvib) by the sums of the rotational factors per vibrational level (one column
+per Trot). They are kept in a bounded LRU cache, keyed on the temperatures
+rounded to :py:data:`DIGITS` significant digits.
+
+:py:class:`NonEqGrid` prepares the lines once (vibrational bands, HWHM at the
+fixed translational temperature, line shifts, wavenumber grids), then
+computes the populations of each grid point from cached factors :
+vibrational factors of the vibrational levels per Tvib, rotational factors of
+the lines per Trot (LRU of :py:data:`ROT_LRU_SIZE` temperatures), and the
+partition functions of the grid, computed in one batched pass. Linestrengths,
+emission integrals, pseudo-continuum and lineshape broadening are computed
+for each point. Absorption and emission coefficients are returned as arrays :
+no Spectrum object is generated per point.
+
+Boltzmann vibrational and rotational distributions, molecules in their
+ground electronic state. Uses private methods of the factory : requires
+RADIS >= 0.10.1
+
+Examples
+--------
+::
+
+    sf = SpectrumFactory(...)
+    sf.load_databank(...)
+    grid = NonEqGrid(sf, Ttrans=300)
+    wavenumber, abscoeff, emisscoeff = grid.sweep([1000, 2000, 3000], [500, 1000])
+
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from radis.db.classes import get_molecule
+from radis.phys.constants import hc_k, k_b
+
+from .compat import require
+from .lines import drop_unassigned_lines
+from .synthetic import synthetic_factory
+
+DIGITS = 12  # significant digits of the temperatures of cached values
+LRU_SIZE = 4096  # partition functions kept, per isotope
+ROT_LRU_SIZE = 32  # rotational factors of the lines kept (one array per Trot)
+
+
+def _key(T, digits=DIGITS):
+    return float("{0:.{1}g}".format(T, digits))
+
+
+class PartitionFunctionGrid:
+    """Non-equilibrium partition functions of an isotope on (Tvib, Trot) grids
+
+    Parameters
+    ----------
+    parsum: RovibParFuncCalculator
+        partition function calculator of the isotope, with its energy levels
+        (``Evib``, ``gvib``, ``Erot``, ``grot``), as returned by
+        :py:meth:`~radis.lbl.base.BaseFactory.get_partition_function_calculator`
+    digits: int
+        significant digits of the temperatures of the cache keys
+    maxsize: int
+        number of (Tvib, Trot) partition functions kept
+
+    Attributes
+    ----------
+    hits, misses: int
+        grid points found in the cache, and calculated
+
+    See Also
+    --------
+    :py:meth:`~benchmarks.noneq.PartitionFunctionGrid.at`
+    """
+
+    def __init__(self, parsum, digits=DIGITS, maxsize=LRU_SIZE):
+        df = parsum.df
+        # vibrational level of each energy level : same (Evib, gvib)
+        Evib_code, Evib = pd.factorize(df["Evib"].to_numpy())
+        gvib_code, gvib = pd.factorize(df["gvib"].to_numpy())
+        vib_code, vib_levels = pd.factorize(Evib_code.astype(np.int64) * len(gvib) + gvib_code)
+        self.vib_index = vib_code
+        self.Evib = Evib[vib_levels // len(gvib)]
+        self.gvib = gvib[vib_levels % len(gvib)]
+        self.Erot = df["Erot"].to_numpy()
+        self.grot = df["grot"].to_numpy()
+
+        self.digits = digits
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self.hits = self.misses = 0
+
+    def evaluate(self, Tvib, Trot):
+        """Partition functions of all pairs of ``Tvib`` and ``Trot``, without cache
+
+        Returns
+        -------
+        Q: numpy array of shape (len(Tvib), len(Trot))
+        """
+        Tvib, Trot = np.atleast_1d(Tvib), np.atleast_1d(Trot)
+        vib = self.gvib[:, None] * np.exp(-hc_k * self.Evib[:, None] / Tvib)
+        rot = np.empty((len(self.Evib), len(Trot)))
+        for j, T in enumerate(Trot):
+            rot[:, j] = np.bincount(
+                self.vib_index,
+                weights=self.grot * np.exp(-hc_k * self.Erot / T),
+                minlength=len(self.Evib),
+            )
+        return vib.T @ rot
+
+    def at(self, Tvib, Trot):
+        """Partition functions of all pairs of ``Tvib`` and ``Trot``
+
+        Pairs missing from the cache are calculated in one batched pass (on
+        the missing Tvib and Trot), and added to the cache.
+
+        Returns
+        -------
+        Q: numpy array of shape (len(Tvib), len(Trot))
+        """
+        Tvib = [_key(T, self.digits) for T in np.atleast_1d(Tvib)]
+        Trot = [_key(T, self.digits) for T in np.atleast_1d(Trot)]
+        missing = [(Tv, Tr) for Tv in Tvib for Tr in Trot if (Tv, Tr) not in self._cache]
+        if missing:
+            Tvib_missing = sorted({Tv for (Tv, _) in missing})
+            Trot_missing = sorted({Tr for (_, Tr) in missing})
+            Q = self.evaluate(Tvib_missing, Trot_missing)
+            for i, Tv in enumerate(Tvib_missing):
+                for j, Tr in enumerate(Trot_missing):
+                    self._cache[Tv, Tr] = Q[i, j]
+        self.misses += len(missing)
+        self.hits += len(Tvib) * len(Trot) - len(missing)
+
+        Q = np.empty((len(Tvib), len(Trot)))
+        for i, Tv in enumerate(Tvib):
+            for j, Tr in enumerate(Trot):
+                self._cache.move_to_end((Tv, Tr))
+                Q[i, j] = self._cache[Tv, Tr]
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return Q
+
+
+class NonEqGrid:
+    """Non-equilibrium absorption and emission coefficients of a factory on (Tvib, Trot) grids
+
+    Parameters
+    ----------
+    sf: SpectrumFactory
+        factory with its line database loaded, lines with vibrational
+        assignment only (see :py:func:`~benchmarks.lines.drop_unassigned_lines`)
+    Ttrans: float
+        translational temperature (K), fixed on the grid
+    mole_fraction, pressure, diluent:
+        as in :py:meth:`~radis.lbl.factory.SpectrumFactory.non_eq_spectrum`. If
+        ``None``, use the factory inputs.
+    maxsize: int
+        number of rotational temperatures whose line factors are kept
+
+    See Also
+    --------
+    :py:meth:`~benchmarks.noneq.NonEqGrid.sweep`
+    """
+
+    def __init__(self, sf, Ttrans, mole_fraction=None, pressure=None, diluent=None, maxsize=ROT_LRU_SIZE):
+        self.sf = sf
+        self.Ttrans = Ttrans
+        if mole_fraction is not None:
+            sf.input.mole_fraction = mole_fraction
+        if pressure is not None:
+            sf.input.pressure = pressure
+        self.diluent = diluent
+        self._rot_factors = lru_cache(maxsize)(self._rot_factors_at)
+        self.lines = None  # lines with vibrational bands, shifted & sorted, once prepared
+        self.Q = {}  # PartitionFunctionGrid of each isotope
+
+    def _start(self, Tvib, Trot):
+        """ New profiler entries & temperatures, as at the start of non_eq_spectrum """
+        sf = self.sf
+        sf.input.Tvib, sf.input.Trot, sf.input.Tgas = Tvib, Trot, self.Ttrans
+        sf._reset_profiler(sf.verbose)
+        sf.profiler.start("spectrum_calculation", 1)
+        sf.profiler.start("spectrum_calc_before_obj", 2)
+
+    def prepare(self, Tvib, Trot):
+        """Compute the quantities that do not depend on Tvib and Trot
+
+        Called automatically by :py:meth:`~benchmarks.noneq.NonEqGrid.sweep`.
+        ``Tvib`` and ``Trot`` are only used for the first populations, which
+        add the vibrational bands and energies of the lines.
+        """
+        sf = self.sf
+        self._start(Tvib, Trot)
+        sf._check_line_databank()
+        sf._calc_noneq_parameters("boltzmann", True)
+        sf._reinitialize()  # copy of df0, done once for the whole grid
+        sf.calc_populations_noneq(Tvib, Trot)  # vibrational bands : slowest step of non_eq_spectrum
+        sf._generate_diluent_molefraction(sf.input.mole_fraction, self.diluent)
+        sf._calc_broadening_HWHM()  # Ttrans only
+        sf.calc_lineshift()  # shiftwav & sorted lines : pressure only
+        sf._generate_wavenumber_arrays()
+        df = self.lines = sf.df1
+
+        # vibrational levels of the lines, upper and lower
+        n = len(df)
+        E = np.concatenate((df["Evibu"].to_numpy(), df["Evibl"].to_numpy()))
+        g = np.concatenate((df["gvibu"].to_numpy(), df["gvibl"].to_numpy()))
+        levels, index = np.unique(np.column_stack((E, g)), axis=0, return_inverse=True)
+        index = index.ravel()
+        self._Evib, self._gvib = levels[:, 0], levels[:, 1]
+        self._vib_u, self._vib_l = index[:n], index[n:]
+
+        if "iso" in df:
+            isotopes, self._iso_index = np.unique(df["iso"].to_numpy(), return_inverse=True)
+        else:
+            isotopes, self._iso_index = [df.attrs["iso"]], np.zeros(n, dtype=int)
+        self._isotopes = list(isotopes)
+        molecule = get_molecule(df.attrs["id"])
+        for iso in self._isotopes:
+            if iso not in self.Q:
+                parsum = sf.get_partition_function_calculator(molecule, iso, sf.input.state)
+                self.Q[iso] = PartitionFunctionGrid(parsum)
+        self._rot_factors.cache_clear()
+
+    def _rot_factors_at(self, Trot):
+        df = self.lines
+        return (
+            df["grotu"].to_numpy() * np.exp(-hc_k * df["Erotu"].to_numpy() / Trot),
+            df["grotl"].to_numpy() * np.exp(-hc_k * df["Erotl"].to_numpy() / Trot),
+        )
+
+    def partition_functions(self, Tvib, Trot):
+        """Partition functions of each isotope on the grid ``Tvib`` x ``Trot``
+
+        Returns
+        -------
+        Q: dict
+            ``{iso: numpy array of shape (len(Tvib), len(Trot))}``
+        """
+        if self.lines is None:
+            self.prepare(np.atleast_1d(Tvib)[0], np.atleast_1d(Trot)[0])
+        return {iso: self.Q[iso].at(Tvib, Trot) for iso in self._isotopes}
+
+    def populations(self, Tvib, Trot):
+        """Upper and lower state populations of the lines (fractions, not corrected for abundance)
+
+        Returns
+        -------
+        nu, nl: numpy arrays
+        """
+        Q = self.partition_functions(Tvib, Trot)
+        Q_lines = np.array([Q[iso][0, 0] for iso in self._isotopes])[self._iso_index]
+        vib = self._gvib * np.exp(-hc_k * self._Evib / Tvib)
+        rot_u, rot_l = self._rot_factors(_key(Trot))
+        return vib[self._vib_u] * rot_u / Q_lines, vib[self._vib_l] * rot_l / Q_lines
+
+    def coefficients(self, Tvib, Trot):
+        """Absorption and emission coefficients at ``(Tvib, Trot)``
+
+        Returns
+        -------
+        wavenumber, abscoeff, emisscoeff: numpy arrays
+            in cm-1, cm-1, and mW/cm3/sr/cm-1
+        """
+        if self.lines is None:
+            self.prepare(Tvib, Trot)
+        sf = self.sf
+        self._start(Tvib, Trot)
+        sf.df1 = self.lines  # columns are overwritten in place ; cutoff creates a new DataFrame
+        sf.df1["nu"], sf.df1["nl"] = self.populations(Tvib, Trot)
+        sf.calc_linestrength_noneq()
+        sf.calc_emission_integral()
+        sf._cutoff_linestrength()
+        k_continuum, j_continuum = sf.calculate_pseudo_continuum(noneq=True)
+        wavenumber, abscoeff_v, emisscoeff_v = sf._calc_broadening_noneq()
+        abscoeff_v = sf._add_pseudo_continuum(abscoeff_v, k_continuum)
+        emisscoeff_v = sf._add_pseudo_continuum(emisscoeff_v, j_continuum)
+
+        density = self.density()
+        return wavenumber, abscoeff_v * density, emisscoeff_v * density
+
+    def density(self):
+        """ Number density of the molecule at ``Ttrans`` (cm-3) """
+        sf = self.sf
+        return sf.input.mole_fraction * ((sf.input.pressure * 1e5) / (k_b * self.Ttrans)) * 1e-6
+
+    def sweep(self, Tvib_list, Trot_list):
+        """Coefficients of all pairs of ``Tvib_list`` and ``Trot_list``
+
+        Partition functions of the whole grid are calculated first, in one
+        batched pass.
+
+        Returns
+        -------
+        wavenumber: numpy array
+            in cm-1
+        abscoeff, emisscoeff: numpy arrays of shape (len(Tvib_list), len(Trot_list), len(wavenumber))
+            in cm-1, and mW/cm3/sr/cm-1
+        """
+        self.partition_functions(Tvib_list, Trot_list)
+        abscoeff = emisscoeff = None
+        for i, Tvib in enumerate(Tvib_list):
+            for j, Trot in enumerate(Trot_list):
+                wavenumber, k, j_ = self.coefficients(Tvib, Trot)
+                if abscoeff is None:
+                    shape = (len(Tvib_list), len(Trot_list), len(k))
+                    abscoeff, emisscoeff = np.empty(shape), np.empty(shape)
+                abscoeff[i, j], emisscoeff[i, j] = k, j_
+        return wavenumber, abscoeff, emisscoeff
+
+
+# %% Benchmarks
+
+N_LINES = 50_000
+TTRANS = 300  # K
+TVIB_RANGE = (1000, 3000)  # K
+TROT_RANGE = (500, 1500)  # K
+FACTORY_KWARGS = {
+    "wstep": 0.01,
+    "truncation": 5,
+    "neighbour_lines": 5,
+    "optimization": "simple",
+    "cutoff": 0,
+}
+SPECTRUM_KWARGS = {"pressure": 1, "mole_fraction": 0.1, "path_length": 1}
+
+
+def get_grid(n):
+    """ ``n`` vibrational and ``n`` rotational temperatures """
+    return list(np.linspace(*TVIB_RANGE, n)), list(np.linspace(*TROT_RANGE, n))
+
+
+def noneq_factory():
+    """ Synthetic CO2 factory (50k lines) with the lines that can be computed out of equilibrium """
+    sf = synthetic_factory(N_LINES, **FACTORY_KWARGS)
+    drop_unassigned_lines(sf)
+    sf.input.pressure = SPECTRUM_KWARGS["pressure"]
+    sf.input.mole_fraction = SPECTRUM_KWARGS["mole_fraction"]
+    sf.input.path_length = SPECTRUM_KWARGS["path_length"]
+    return sf
+
+
+class CO2_NonEqGrid:
+    """
+    Non-equilibrium spectra of a synthetic CO2 line list on a grid of n x n
+    (Tvib, Trot), at fixed Ttrans, with :py:class:`NonEqGrid` (``"grid"``)
+    or one :py:meth:`~radis.lbl.factory.SpectrumFactory.non_eq_spectrum` per
+    point. The grid method includes the preparation of the lines and the
+    partition functions of the grid, as for a new grid.
+    """
+
+    params = ([5, 20], ["grid", "non_eq_spectrum"])
+    param_names = ["n", "method"]
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 3600
+
+    def setup(self, n, method):
+        require("0.10.1", "non-equilibrium grids")
+        self.sf = noneq_factory()
+        self.sf.non_eq_spectrum(Ttrans=TTRANS, Tvib=TVIB_RANGE[0], Trot=TROT_RANGE[0])  # warm-up
+        self.Tvib, self.Trot = get_grid(n)
+
+    def track_spectra_per_second(self, n, method):
+        t0 = perf_counter()
+        if method == "grid":
+            NonEqGrid(self.sf, TTRANS).sweep(self.Tvib, self.Trot)
+        else:
+            for Tvib in self.Tvib:
+                for Trot in self.Trot:
+                    self.sf.non_eq_spectrum(Ttrans=TTRANS, Tvib=Tvib, Trot=Trot)
+        return n * n / (perf_counter() - t0)
+
+    track_spectra_per_second.unit = "spectra/s"
+
+    def time_partition_functions(self, n, method):
+        """Partition functions of all isotopes on the grid : one batched pass
+        (without cache), or ``at_noneq`` per point as in non_eq_spectrum"""
+        sf = self.sf
+        molecule = get_molecule(sf.df0.attrs["id"])
+        for iso in sf.df0["iso"].unique():
+            parsum = sf.get_partition_function_calculator(molecule, iso, sf.input.state)
+            if method == "grid":
+                PartitionFunctionGrid(parsum).evaluate(self.Tvib, self.Trot)
+            else:
+                for Tvib in self.Tvib:
+                    for Trot in self.Trot:
+                        parsum.at_noneq(Tvib, Trot)
+
+
+class CO2_NonEqGrid_Accuracy:
+    """
+    Max difference between :py:class:`NonEqGrid` and
+    :py:meth:`~radis.lbl.factory.SpectrumFactory.non_eq_spectrum` at the
+    corners of the :py:class:`CO2_NonEqGrid` temperature range, relative to
+    the max of each coefficient
+    """
+
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 600
+
+    def setup(self):
+        require("0.10.1", "non-equilibrium grids")
+        sf = noneq_factory()
+        Tvib_list, Trot_list = get_grid(2)
+        _, abscoeff, emisscoeff = NonEqGrid(sf, TTRANS).sweep(Tvib_list, Trot_list)
+        self.residual = {"abscoeff": 0, "emisscoeff": 0}
+        for i, Tvib in enumerate(Tvib_list):
+            for j, Trot in enumerate(Trot_list):
+                s = sf.non_eq_spectrum(Ttrans=TTRANS, Tvib=Tvib, Trot=Trot)
+                for name, grid in [("abscoeff", abscoeff), ("emisscoeff", emisscoeff)]:
+                    unit = "cm-1" if name == "abscoeff" else "mW/cm3/sr/cm-1"
+                    ref = s.get(name, wunit="cm-1", Iunit=unit)[1]
+                    error = np.max(np.abs(grid[i, j] - ref)) / np.max(np.abs(ref))
+                    self.residual[name] = max(self.residual[name], error)
+
+    def track_max_residual_abscoeff(self):
+        return self.residual["abscoeff"]
+
+    track_max_residual_abscoeff.unit = "relative"
+
+    def track_max_residual_emisscoeff(self):
+        return self.residual["emisscoeff"]
+
+    track_max_residual_emisscoeff.unit = "relative"
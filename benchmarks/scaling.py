@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmarks
+
+How :py:meth:`~radis.lbl.factory.SpectrumFactory.eq_spectrum` and
+:py:meth:`~radis.lbl.factory.SpectrumFactory.non_eq_spectrum` scale with the
+number of lines, the spectral range, the wavenumber step and the lineshape
+truncation. Runs on synthetic line lists (see :py:mod:`benchmarks.synthetic`)
+so that the number of lines can be chosen freely.
+
+"""
+
+from time import perf_counter
+
+import numpy as np
+
+from .compat import require_synthetic
+from .lines import drop_unassigned_lines
+from .synthetic import synthetic_factory
+
+WAVENUM_MIN = 2000  # cm-1
+
+
+class _CO2_ScalingSetup:
+    """
+    Parameter grid & synthetic factory shared by the scaling benchmarks
+    """
+
+    params = (
+        [10_000, 100_000, 1_000_000, 10_000_000],  # n_lines
+        [50, 250],  # range_width (cm-1)
+        [0.01, 0.002],  # wstep (cm-1)
+        [10, 50],  # truncation (cm-1)
+    )
+    param_names = ["n_lines", "range_width", "wstep", "truncation"]
+    timeout = 3600
+
+    def setup(self, n_lines, range_width, wstep, truncation):
+        require_synthetic()
+        self.sf = synthetic_factory(
+            n_lines,
+            WAVENUM_MIN,
+            WAVENUM_MIN + range_width,
+            wstep=wstep,
+            truncation=truncation,
+            neighbour_lines=truncation,
+            cutoff=0,
+        )
+
+
+class CO2_Scaling(_CO2_ScalingSetup):
+    """
+    Time & memory of equilibrium spectra as the problem grows
+    """
+
+    def time_eq_spectrum(self, n_lines, range_width, wstep, truncation):
+        self.sf.eq_spectrum(Tgas=1700)
+
+    def peakmem_eq_spectrum(self, n_lines, range_width, wstep, truncation):
+        self.sf.eq_spectrum(Tgas=1700)
+
+
+class CO2_Scaling_NonEq(_CO2_ScalingSetup):
+    """
+    Time & memory of non-equilibrium spectra as the problem grows
+    """
+
+    def setup(self, n_lines, range_width, wstep, truncation):
+        _CO2_ScalingSetup.setup(self, n_lines, range_width, wstep, truncation)
+        # lines without vibrational assignment cannot be computed out of equilibrium
+        drop_unassigned_lines(self.sf)
+
+    def time_noneq_spectrum(self, n_lines, range_width, wstep, truncation):
+        self.sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+
+    def peakmem_noneq_spectrum(self, n_lines, range_width, wstep, truncation):
+        self.sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+
+
+class CO2_ScalingExponent:
+    """
+    Scaling exponent ``a`` of the calculation time ``t ~ N_lines ** a``
+
+    Fitted in log-log scale on the number of lines actually loaded (about
+    :py:attr:`N_LINES`), for each RADIS version.
+    A value close to 1 is the expected O(N_lines) behavior ; a larger value
+    means a release scales worse than linearly with the number of lines.
+    """
+
+    N_LINES = [10_000, 100_000, 1_000_000]
+    REPEAT = 3
+    unit = "exponent"
+    timeout = 3600
+
+    def setup(self):
+        require_synthetic()
+        self.factories = [
+            synthetic_factory(
+                n, WAVENUM_MIN, WAVENUM_MIN + 250, wstep=0.01, truncation=10, cutoff=0
+            )
+            for n in self.N_LINES
+        ]
+        for sf in self.factories:
+            # lines without vibrational assignment cannot be computed out of equilibrium
+            drop_unassigned_lines(sf)
+        self.n_lines = [len(sf.df0) for sf in self.factories]
+
+    def _fit_exponent(self, calc):
+        times = []
+        for sf in self.factories:
+            t = []
+            for _ in range(self.REPEAT):
+                t0 = perf_counter()
+                calc(sf)
+                t.append(perf_counter() - t0)
+            times.append(min(t))
+        return np.polyfit(np.log(self.n_lines), np.log(times), 1)[0]
+
+    def track_eq_spectrum_exponent(self):
+        return self._fit_exponent(lambda sf: sf.eq_spectrum(Tgas=1700))
+
+    def track_noneq_spectrum_exponent(self):
+        return self._fit_exponent(
+            lambda sf: sf.non_eq_spectrum(Ttrans=300, Tvib=1700, Trot=1550)
+        )
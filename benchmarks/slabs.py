@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Lines of sight of many distinct slabs, in series and in parallel
+
+Slabs differ by their gas temperature, mole fraction and wavenumber grid
+(:py:func:`make_slabs`), and are combined with :
+
+- ``"radis"`` : one :py:func:`~radis.los.slabs.SerialSlabs` or
+  :py:func:`~radis.los.slabs.MergeSlabs` call on all slabs. ``SerialSlabs``
+  recurses once per slab : the recursion limit is raised above the number of
+  slabs.
+- ``"pairwise"`` : calls on 2 slabs, by pairs of neighbours, then pairs of
+  pairs, etc. (:py:func:`reduce_slabs`).
+- ``"pairwise-processes"`` : same, each worker process reducing a chunk of
+  consecutive slabs, then the partial results are reduced in order.
+- ``"tree"`` : the same reduction on arrays (:py:func:`~benchmarks.los.tree_reduce`),
+  after one resampling of all slabs on their common grid.
+
+Slabs on different grids are resampled with ``resample="intersect"`` on the
+grid of the first slab of each call : pairwise reductions resample partial
+results again, and differ from a single call by the interpolation error.
+
+"""
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+from .compat import require_synthetic
+from .los import common_grid, merged_radiance, stack_slabs, tree_reduce
+from .synthetic import synthetic_factory
+
+N_LINES = 10_000
+WAVENUM_MIN, WAVENUM_MAX = 2000, 2020  # cm-1
+WSTEP = 0.02  # cm-1 : 1,001 spectral points
+TEMPERATURES = np.linspace(500, 2500, 8)  # K : gas temperatures of the slabs
+PATH_LENGTH = 1  # cm, all slabs : required by MergeSlabs
+N_SLABS = [10, 100, 1000, 10000]
+METHODS = ["radis", "pairwise", "pairwise-processes", "tree"]
+
+
+def slab_coefficients():
+    """Equilibrium absorption & emission coefficients of synthetic CO2 lines,
+    for a mole fraction of 1, at each temperature of :py:data:`TEMPERATURES`
+
+    Returns
+    -------
+    dict
+        ``wavenumber`` (cm-1), ``abscoeff`` (cm-1) and ``emisscoeff``
+        (mW/cm3/sr/cm-1), of shape (len(TEMPERATURES), n_points)
+    """
+    sf = synthetic_factory(
+        N_LINES,
+        WAVENUM_MIN,
+        WAVENUM_MAX,
+        wstep=WSTEP,
+        truncation=5,
+        neighbour_lines=5,
+        cutoff=0,
+        path_length=PATH_LENGTH,
+    )
+    abscoeff, emisscoeff = [], []
+    for Tgas in TEMPERATURES:
+        s = sf.eq_spectrum(Tgas, mole_fraction=1, pressure=1)
+        w, k = s.get("abscoeff", wunit="cm-1", Iunit="cm-1")
+        abscoeff.append(k)
+        emisscoeff.append(s.get("emisscoeff", wunit="cm-1", Iunit="mW/cm3/sr/cm-1")[1])
+    return {"wavenumber": w, "abscoeff": np.array(abscoeff), "emisscoeff": np.array(emisscoeff)}
+
+
+def make_slabs(coefficients, n_slabs):
+    """Distinct slabs : temperatures of :py:data:`TEMPERATURES` in turn, mole
+    fractions from 0.01 to 0.2, one slab out of two on a grid of step 1.5 x
+    :py:data:`WSTEP` shifted by a third of the step
+
+    Coefficients are scaled by the mole fraction (self-broadening neglected).
+
+    Returns
+    -------
+    list of Spectrum
+        with ``abscoeff``, ``emisscoeff``, ``radiance_noslit`` and ``transmittance_noslit``
+    """
+    from radis import Spectrum
+
+    w = coefficients["wavenumber"]
+    w_coarse = np.arange(w[0] + WSTEP / 3, w[-1], 1.5 * WSTEP)
+    slabs = []
+    for i in range(n_slabs):
+        iT = i % len(TEMPERATURES)
+        x = 0.01 + 0.19 * ((i * 0.618034) % 1)  # golden ratio : all different
+        wi = w if i % 2 == 0 else w_coarse
+        k = x * np.interp(wi, w, coefficients["abscoeff"][iT])
+        j = x * np.interp(wi, w, coefficients["emisscoeff"][iT])
+        radiance, transmittance = merged_radiance(j, k, PATH_LENGTH)
+        slabs.append(
+            Spectrum(
+                quantities={
+                    "abscoeff": (wi, k),
+                    "emisscoeff": (wi, j),
+                    "radiance_noslit": (wi, radiance),
+                    "transmittance_noslit": (wi, transmittance),
+                },
+                units={
+                    "abscoeff": "cm-1",
+                    "emisscoeff": "mW/cm3/sr/cm-1",
+                    "radiance_noslit": "mW/cm2/sr/cm-1",
+                    "transmittance_noslit": "",
+                },
+                conditions={
+                    "Tgas": TEMPERATURES[iT],
+                    "mole_fraction": x,
+                    "path_length": PATH_LENGTH,
+                    "thermal_equilibrium": True,
+                },
+                cond_units={"Tgas": "K", "path_length": "cm"},
+                wunit="cm-1",
+                name="slab{0}".format(i),
+            )
+        )
+    return slabs
+
+
+def combine(s1, s2, operation):
+    """ ``s1`` then ``s2`` on the line of sight (``"serial"``), or side by side (``"merge"``) """
+    from radis import MergeSlabs, SerialSlabs
+
+    # 'resample_wavespace' : name in all versions (deprecated alias of 'resample')
+    if operation == "serial":
+        return SerialSlabs(s1, s2, resample_wavespace="intersect", modify_inputs=False)
+    return MergeSlabs(s1, s2, resample_wavespace="intersect")
+
+
+def pairwise_reduce(s_list, operation):
+    """ Combine slabs by pairs of neighbours, until one is left """
+    s_list = list(s_list)
+    while len(s_list) > 1:
+        pairs = [combine(s_list[i], s_list[i + 1], operation) for i in range(0, len(s_list) - 1, 2)]
+        if len(s_list) % 2:
+            pairs.append(s_list[-1])
+        s_list = pairs
+    return s_list[0]
+
+
+def reduce_slabs(s_list, operation, executor=None, n_chunks=None):
+    """Pairwise reduction of slabs, in worker processes if ``executor`` is given
+
+    Parameters
+    ----------
+    s_list: list of Spectrum
+        slabs, in the order light travels through them
+    operation: ``"serial"``, ``"merge"``
+        as :py:func:`~radis.los.slabs.SerialSlabs`, or :py:func:`~radis.los.slabs.MergeSlabs`
+    executor: concurrent.futures.Executor
+        each of its workers reduces a chunk of consecutive slabs (slabs are
+        pickled to the workers) ; partial results are then reduced in order
+    n_chunks: int
+        number of chunks. Default : number of CPUs.
+
+    Returns
+    -------
+    s: Spectrum
+    """
+    if executor is None or len(s_list) < 2:
+        return pairwise_reduce(s_list, operation)
+    n_chunks = min(n_chunks or os.cpu_count() or 1, len(s_list) // 2)
+    chunks = [list(c) for c in np.array_split(np.array(s_list, dtype=object), n_chunks)]
+    partial = list(executor.map(pairwise_reduce, chunks, [operation] * n_chunks))
+    return pairwise_reduce(partial, operation)
+
+
+class _LOS_Setup:
+    """
+    Distinct slabs of :py:func:`make_slabs`, combined by ``method``.
+    Throughput is in slabs per second.
+    """
+
+    params = (N_SLABS, METHODS)
+    param_names = ["n_slabs", "method"]
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 3600
+    operation = None  # "serial" or "merge"
+
+    def setup_cache(self):
+        require_synthetic()
+        return slab_coefficients()
+
+    def setup(self, coefficients, n_slabs, method):
+        require_synthetic()
+        self.s_list = make_slabs(coefficients, n_slabs)
+        self.executor = None
+        if method == "pairwise-processes":
+            self.executor = ProcessPoolExecutor(
+                os.cpu_count() or 1,
+                # fork is unsafe once numba functions ran in the parent process
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            list(self.executor.map(abs, range(os.cpu_count() or 1)))  # start the workers
+        self.recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(self.recursion_limit, 2 * n_slabs + 1000))
+
+    def teardown(self, coefficients, n_slabs, method):
+        sys.setrecursionlimit(self.recursion_limit)
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def _los(self, method):
+        if method == "radis":
+            return self._radis()
+        if method == "tree":
+            return self._tree()
+        return reduce_slabs(self.s_list, self.operation, self.executor)
+
+    def time_los(self, coefficients, n_slabs, method):
+        self._los(method)
+
+    def peakmem_los(self, coefficients, n_slabs, method):
+        self._los(method)
+
+    def track_slabs_per_second(self, coefficients, n_slabs, method):
+        t0 = perf_counter()
+        self._los(method)
+        return n_slabs / (perf_counter() - t0)
+
+    track_slabs_per_second.unit = "slabs/s"
+
+
+class LOS_SerialSlabs(_LOS_Setup):
+    """
+    Line of sight of 10 to 10,000 distinct slabs in series :
+    :py:func:`~radis.los.slabs.SerialSlabs`, pairwise reductions, and tree
+    reduction of the arrays resampled once.
+    """
+
+    operation = "serial"
+
+    def _radis(self):
+        from radis import SerialSlabs
+
+        return SerialSlabs(*self.s_list, resample_wavespace="intersect", modify_inputs=False)
+
+    def _tree(self):
+        R, T = stack_slabs(self.s_list, w=common_grid(self.s_list))
+        return tree_reduce(R, T, "serial")
+
+
+class LOS_MergeSlabs(_LOS_Setup):
+    """
+    10 to 10,000 distinct slabs in parallel (same path length) :
+    :py:func:`~radis.los.slabs.MergeSlabs`, pairwise reductions, and tree
+    reduction of the coefficients resampled once, then radiance and
+    transmittance of the merged slab.
+    """
+
+    operation = "merge"
+
+    def _radis(self):
+        from radis import MergeSlabs
+
+        return MergeSlabs(*self.s_list, resample_wavespace="intersect")
+
+    def _tree(self):
+        J, K = stack_slabs(
+            self.s_list, radiance="emisscoeff", transmittance="abscoeff", w=common_grid(self.s_list)
+        )
+        emisscoeff, abscoeff = tree_reduce(J, K, "merge")
+        return merged_radiance(emisscoeff, abscoeff, PATH_LENGTH)
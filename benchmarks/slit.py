@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Slit convolution and resampling of spectra
+
+:py:meth:`~radis.spectrum.spectrum.Spectrum.apply_slit` builds the slit
+function, interpolates it on the wavenumber step and convolves each
+``*_noslit`` quantity, at every call : in a fit, the same slit is applied on
+the same grid at every evaluation. :py:class:`SlitConvolver` builds the slit
+kernel once for a grid, and convolves by :
+
+- ``"direct"`` : :py:func:`numpy.convolve`, in O(n x m) for a kernel of m points,
+- ``"fft"`` : product with the Fourier transform of the kernel, computed once,
+  of the padded spectrum,
+- ``"overlap-add"`` : same, by blocks of a few kernel widths, whose Fourier
+  transforms stay small (faster, and in cache, when m << n),
+
+all quantities at once. ``"auto"`` uses the direct convolution for narrow
+slits (below :py:data:`DIRECT_MAX_POINTS`), overlap-add otherwise.
+
+Slabs of a line of sight with different grids are resampled on a common grid
+before :py:func:`~radis.los.slabs.SerialSlabs` : see
+:py:func:`~benchmarks.los.stack_slabs`.
+
+Examples
+--------
+::
+
+    convolve = SlitConvolver(s.get_wavenumber(), 0.5)  # triangular, 0.5 cm-1 FWHM
+    radiance = convolve(s.get("radiance_noslit")[1])
+
+"""
+
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+
+from .broadening import max_residual
+from .compat import require_synthetic
+from .los import common_grid, serial_slabs_batched, stack_slabs
+from .synthetic import synthetic_factory
+
+N_LINES = 50_000
+WAVENUM_MIN, WAVENUM_MAX = 2000, 2500  # cm-1
+WSTEP = 0.005  # cm-1 : 100,001 spectral points
+T_GAS = 1500  # K
+SLIT_WIDTHS = [5, 20, 100]  # slit FWHM, in wavenumber steps
+DIRECT_MAX_POINTS = 100
+"""Kernels of more points are convolved by overlap-add with ``method="auto"``
+(crossover measured with :py:class:`Slit_Convolve`, 100,001 points)"""
+BLOCK_FACTOR = 8  # overlap-add blocks : ~ 8 kernel widths
+
+
+def slit_kernel(w, slit_function, shape="triangular", norm_by="area"):
+    """Slit function sampled on the wavenumber step of ``w``, as in
+    :py:meth:`~radis.spectrum.spectrum.Spectrum.apply_slit`
+
+    Parameters
+    ----------
+    w: numpy array
+        evenly spaced wavenumbers (cm-1)
+    slit_function: float
+        FWHM (cm-1)
+    shape, norm_by:
+        see :py:func:`~radis.tools.slit.get_slit_function`
+
+    Returns
+    -------
+    kernel: numpy array
+        slit function times the wavenumber step : convolutions are sums
+    """
+    from radis.tools.slit import get_slit_function
+    from scipy.interpolate import splev, splrep
+
+    wstep = abs(np.diff(w)).min()
+    w_slit, I_slit = get_slit_function(
+        slit_function,
+        unit="cm-1",
+        norm_by=norm_by,
+        shape=shape,
+        center_wavespace=w[len(w) // 2],
+        return_unit="cm-1",
+        wstep=wstep,
+        verbose=False,
+    )
+    if not np.allclose(np.diff(w_slit), wstep):
+        w_slit_interp = np.arange(w_slit[0], w_slit[-1] + wstep, wstep)
+        I_slit = splev(w_slit_interp, splrep(w_slit, I_slit, k=1))
+    return I_slit * wstep
+
+
+class SlitConvolver:
+    """Convolution of quantities on a fixed grid with a slit function
+
+    The kernel, and its Fourier transforms, are computed once.
+
+    Parameters
+    ----------
+    w: numpy array
+        evenly spaced wavenumbers (cm-1) of the quantities to convolve
+    slit_function: float
+        FWHM (cm-1)
+    method: ``"direct"``, ``"fft"``, ``"overlap-add"``, ``"auto"``
+        see :py:mod:`benchmarks.slit`
+    shape, norm_by:
+        see :py:func:`~radis.tools.slit.get_slit_function`
+
+    Notes
+    -----
+    The output has the length of the input ; points where the kernel does not
+    fully overlap the input are ``nan``, as with ``mode="valid"`` in
+    :py:func:`~radis.tools.slit.convolve_with_slit` (RADIS >= 0.9.30).
+    """
+
+    def __init__(self, w, slit_function, method="auto", shape="triangular", norm_by="area"):
+        self.n = len(w)
+        self.kernel = slit_kernel(w, slit_function, shape=shape, norm_by=norm_by)
+        m = len(self.kernel)
+        if method == "auto":
+            method = "direct" if m <= DIRECT_MAX_POINTS else "overlap-add"
+        self.method = method
+        if method == "fft":
+            self.nfft = next_fast_len(self.n + m - 1, real=True)
+            self.kernel_fft = rfft(self.kernel, self.nfft)
+        elif method == "overlap-add":
+            self.nfft = next_fast_len(BLOCK_FACTOR * m, real=True)
+            self.block = self.nfft - m + 1
+            self.kernel_fft = rfft(self.kernel, self.nfft)
+        elif method != "direct":
+            raise ValueError("Unexpected method: {0}".format(method))
+
+    def _full(self, I):
+        """ Full convolution of the rows of ``I`` (2-D) """
+        m = len(self.kernel)
+        if self.method == "direct":
+            return np.array([np.convolve(Ii, self.kernel) for Ii in I])
+        if self.method == "fft":
+            return irfft(rfft(I, self.nfft) * self.kernel_fft, self.nfft)[:, : self.n + m - 1]
+        # overlap-add : blocks of the input convolved independently, then their
+        # tails (m - 1 points) added to the start of the next block
+        L = self.block
+        n_blocks = -(-self.n // L)
+        blocks = np.zeros((len(I), n_blocks, L))
+        blocks.reshape(len(I), -1)[:, : self.n] = I
+        y = irfft(rfft(blocks, self.nfft) * self.kernel_fft, self.nfft)
+        out = np.zeros((len(I), (n_blocks + 1) * L))
+        out[:, : n_blocks * L] = y[:, :, :L].reshape(len(I), -1)
+        tails = out[:, L:].reshape(len(I), n_blocks, L)
+        tails[:, :, : m - 1] += y[:, :, L:]
+        return out[:, : self.n + m - 1]
+
+    def __call__(self, *quantities):
+        """Convolve ``quantities`` (arrays on the grid ``w``)
+
+        Returns
+        -------
+        numpy array, or tuple of numpy arrays if several quantities are given
+        """
+        m = len(self.kernel)
+        start = (m - 1) // 2
+        I = self._full(np.atleast_2d(np.array(quantities, dtype=float)))[:, start : start + self.n]
+        # boundaries, as remove_boundary(mode="valid")
+        a, b = (m - 1) // 2, m // 2
+        I[:, :a] = np.nan
+        if b > 0:
+            I[:, -b:] = np.nan
+        return I[0] if len(quantities) == 1 else tuple(I)
+
+
+def slit_spectrum_arrays():
+    """Equilibrium radiance & transmittance of synthetic CO2 lines,
+    2000 - 2500 cm-1, on :py:data:`WSTEP`
+
+    Returns
+    -------
+    dict
+        ``wavenumber`` (cm-1), ``radiance_noslit`` (mW/cm2/sr/cm-1) and ``transmittance_noslit``
+    """
+    sf = synthetic_factory(
+        N_LINES,
+        WAVENUM_MIN,
+        WAVENUM_MAX,
+        wstep=WSTEP,
+        truncation=5,
+        neighbour_lines=5,
+        cutoff=0,
+        path_length=10,
+    )
+    s = sf.eq_spectrum(T_GAS, mole_fraction=0.1, pressure=1)
+    w, radiance = s.get("radiance_noslit", wunit="cm-1", Iunit="mW/cm2/sr/cm-1")
+    _, transmittance = s.get("transmittance_noslit", wunit="cm-1")
+    return {"wavenumber": w, "radiance_noslit": radiance, "transmittance_noslit": transmittance}
+
+
+def make_spectrum(w, radiance, transmittance):
+    """ Spectrum of a slab, with the units of :py:func:`slit_spectrum_arrays` """
+    from radis import Spectrum
+
+    return Spectrum(
+        quantities={"radiance_noslit": (w, radiance), "transmittance_noslit": (w, transmittance)},
+        units={"radiance_noslit": "mW/cm2/sr/cm-1", "transmittance_noslit": ""},
+        conditions={"Tgas": T_GAS},
+        wunit="cm-1",
+    )
+
+
+def mismatched_slabs(arrays, n_slabs):
+    """Slabs of the spectrum ``arrays`` on different grids : steps of 1, 1.5
+    and 2 x :py:data:`WSTEP`, shifted by fractions of the step
+
+    Returns
+    -------
+    list of Spectrum
+    """
+    w = arrays["wavenumber"]
+    slabs = []
+    for i in range(n_slabs):
+        step = WSTEP * (1 + (i % 3) / 2)
+        wi = np.arange(w[0] + step * (i % 5) / 5, w[-1], step)
+        slabs.append(
+            make_spectrum(
+                wi,
+                np.interp(wi, w, arrays["radiance_noslit"]),
+                np.interp(wi, w, arrays["transmittance_noslit"]),
+            )
+        )
+    return slabs
+
+
+class _SlitSetup:
+    """ Spectrum of :py:func:`slit_spectrum_arrays`, computed once per environment """
+
+    timeout = 1200
+
+    def setup_cache(self):
+        require_synthetic()
+        return slit_spectrum_arrays()
+
+
+class Slit_ApplySlit(_SlitSetup):
+    """
+    :py:meth:`~radis.spectrum.spectrum.Spectrum.apply_slit` on radiance &
+    transmittance (100,001 points), triangular slits of 5 to 100 wavenumber
+    steps (FWHM)
+    """
+
+    params = SLIT_WIDTHS
+    param_names = ["slit_width"]
+
+    def setup(self, arrays, slit_width):
+        self.s = make_spectrum(
+            arrays["wavenumber"], arrays["radiance_noslit"], arrays["transmittance_noslit"]
+        )
+
+    def time_apply_slit(self, arrays, slit_width):
+        self.s.apply_slit(slit_width * WSTEP, "cm-1", verbose=False)
+
+    def peakmem_apply_slit(self, arrays, slit_width):
+        self.s.apply_slit(slit_width * WSTEP, "cm-1", verbose=False)
+
+
+class Slit_Convolve(_SlitSetup):
+    """
+    Convolution of radiance & transmittance with the slits of
+    :py:class:`Slit_ApplySlit`, by the methods of :py:class:`~benchmarks.slit.SlitConvolver`
+    (kernel built in ``setup``, once per fit). ``track_max_residual`` is the
+    max difference with the direct convolution, relative to the max radiance.
+    """
+
+    params = (SLIT_WIDTHS, ["direct", "fft", "overlap-add", "auto"])
+    param_names = ["slit_width", "method"]
+
+    def setup(self, arrays, slit_width, method):
+        w = arrays["wavenumber"]
+        self.quantities = arrays["radiance_noslit"], arrays["transmittance_noslit"]
+        self.convolve = SlitConvolver(w, slit_width * WSTEP, method=method)
+        self.reference = SlitConvolver(w, slit_width * WSTEP, method="direct")
+
+    def time_convolve(self, arrays, slit_width, method):
+        self.convolve(*self.quantities)
+
+    def time_build_and_convolve(self, arrays, slit_width, method):
+        SlitConvolver(arrays["wavenumber"], slit_width * WSTEP, method=method)(*self.quantities)
+
+    def peakmem_convolve(self, arrays, slit_width, method):
+        self.convolve(*self.quantities)
+
+    def track_max_residual(self, arrays, slit_width, method):
+        radiance = self.convolve(self.quantities[0])
+        reference = self.reference(self.quantities[0])
+        valid = ~np.isnan(reference)
+        return max_residual(radiance[valid], reference[valid])
+
+    track_max_residual.unit = "relative"
+
+
+class Slab_Resampling(_SlitSetup):
+    """
+    Line of sight of slabs on different grids (steps of 1 to 2 x 0.005 cm-1,
+    shifted) : resampled on a common grid, then combined in series with
+    :py:func:`~radis.los.slabs.SerialSlabs` (``resample="intersect"``), or
+    interpolated & stacked once (:py:func:`~benchmarks.los.stack_slabs`) then
+    combined with :py:func:`~benchmarks.los.serial_slabs_batched`.
+    ``track_max_residual`` is the max difference of the radiances, relative to
+    the max radiance of SerialSlabs.
+    """
+
+    params = [10, 50]
+    param_names = ["n_slabs"]
+
+    def setup(self, arrays, n_slabs):
+        self.s_list = mismatched_slabs(arrays, n_slabs)
+
+    def _serial_slabs(self):
+        from radis import SerialSlabs
+
+        # 'resample_wavespace' : name in all versions (deprecated alias of 'resample')
+        return SerialSlabs(*self.s_list, resample_wavespace="intersect", modify_inputs=False)
+
+    def _batched(self, w=None):
+        R, T = stack_slabs(self.s_list, w=common_grid(self.s_list) if w is None else w)
+        return serial_slabs_batched(R, T)
+
+    def time_SerialSlabs_resample(self, arrays, n_slabs):
+        self._serial_slabs()
+
+    def peakmem_SerialSlabs_resample(self, arrays, n_slabs):
+        self._serial_slabs()
+
+    def time_resample_batched(self, arrays, n_slabs):
+        self._batched()
+
+    def peakmem_resample_batched(self, arrays, n_slabs):
+        self._batched()
+
+    def track_max_residual(self, arrays, n_slabs):
+        w, radiance = self._serial_slabs().get("radiance_noslit", wunit="cm-1")
+        I, _ = self._batched(w)
+        valid = ~np.isnan(radiance)
+        return max_residual(I[valid], radiance[valid])
+
+    track_max_residual.unit = "relative"
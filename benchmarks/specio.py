@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""
+Spectrum files : ``.spec`` and a columnar, memory-mappable layout
+
+:py:meth:`~radis.spectrum.spectrum.Spectrum.store` writes one JSON file per
+spectrum (gzip-compressed by default), that :py:func:`~radis.tools.database.load_spec`
+parses entirely, and :py:class:`~radis.tools.database.SpecDatabase` loads a
+folder of them. The columnar layout stores spectra that share one wavenumber
+grid in a folder ::
+
+    spectra.json          number of spectra & points, units
+    conditions.json       conditions of all spectra (one list per condition)
+    wavespace.npy         the shared grid
+    <quantity>.npy        array (n_spectra, n_points), memory-mapped when read
+
+or, compressed (``compress=True``), each spectrum of each quantity compressed
+independently, after a byte shuffle (bytes of the same significance together)
+that makes floats compressible ::
+
+    <quantity>.zbin       compressed rows, one after the other
+    <quantity>.offsets.npy
+
+In both cases opening a folder only reads ``spectra.json`` : a quantity of a
+spectrum is read without reading (or parsing) the others, nor the conditions.
+
+Examples
+--------
+::
+
+    store_columnar(spectra, "folder")
+    db = ColumnarSpectra("folder")
+    i = db.conditions.index[db.conditions.Tgas == 1500][0]
+    w, radiance = db.get("radiance_noslit", i)
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from os.path import exists, getsize, join
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from .compat import IfSupported, resolve_options, require_synthetic
+from .synthetic import synthetic_factory
+
+FORMAT_VERSION = 1
+SPECTRUM_RANGE = 2000, 2050  # cm-1 : 5,002 points, single spectrum I/O
+DATABASE_RANGE = 2000, 2005  # cm-1 : 502 points, database I/O
+WSTEP = 0.01  # cm-1
+DEFAULT_SPECTRA_COUNTS = "1000,10000"
+
+
+def get_spectra_counts():
+    """Number of spectra of the database benchmarks (see ``RADIS_BENCHMARK_SPECTRA``,
+    ex : ``1000,10000,100000``)"""
+    counts = os.environ.get("RADIS_BENCHMARK_SPECTRA", DEFAULT_SPECTRA_COUNTS)
+    return [int(float(n)) for n in counts.split(",")]
+
+
+def _shuffle(row):
+    """ Bytes of the floats of ``row`` grouped by significance """
+    return np.ascontiguousarray(row.view(np.uint8).reshape(-1, row.itemsize).T).tobytes()
+
+
+def _unshuffle(data, dtype, n_points):
+    itemsize = np.dtype(dtype).itemsize
+    shuffled = np.frombuffer(data, np.uint8).reshape(itemsize, n_points)
+    return np.ascontiguousarray(shuffled.T).view(dtype).ravel()
+
+
+def _jsonable(value):
+    try:
+        json.dumps(value)
+    except TypeError:
+        return False
+    return True
+
+
+def store_columnar(spectra, folder, compress=False, level=1):
+    """Write spectra that share one wavenumber grid in a columnar folder
+
+    Spectra are written one at a time : an archive does not need to fit in memory.
+
+    Parameters
+    ----------
+    spectra: list of Spectrum
+        same wavespace, units and quantities (those of the first spectrum)
+    folder: str
+        replaced if it exists
+    compress: bool
+        compress each spectrum of each quantity (zlib, after a byte shuffle)
+    level: int
+        zlib compression level
+
+    Returns
+    -------
+    folder: str
+    """
+    if exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    s0 = spectra[0]
+    quantities = s0.get_vars()
+    w = s0.get(quantities[0], wunit=s0.get_waveunit(), copy=False)[0]
+    n_points = len(w)
+    np.save(join(folder, "wavespace.npy"), w)
+
+    conditions = {}
+    if compress:
+        files = {q: open(join(folder, q + ".zbin"), "wb") for q in quantities}
+        offsets = {q: np.zeros(len(spectra) + 1, dtype=np.int64) for q in quantities}
+    else:
+        arrays = {
+            q: np.lib.format.open_memmap(
+                join(folder, q + ".npy"), mode="w+", dtype=np.float64, shape=(len(spectra), n_points)
+            )
+            for q in quantities
+        }
+    try:
+        for i, s in enumerate(spectra):
+            for k, v in s.conditions.items():
+                conditions.setdefault(k, [None] * len(spectra))[i] = v
+            for q in quantities:
+                I = s.get(q, wunit=s0.get_waveunit(), Iunit=s0.units[q], copy=False)[1]
+                if compress:
+                    data = zlib.compress(_shuffle(np.asarray(I, dtype=np.float64)), level)
+                    files[q].write(data)
+                    offsets[q][i + 1] = offsets[q][i] + len(data)
+                else:
+                    arrays[q][i] = I
+    finally:
+        if compress:
+            for q in quantities:
+                files[q].close()
+                np.save(join(folder, q + ".offsets.npy"), offsets[q])
+        else:
+            for a in arrays.values():
+                a.flush()
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "n_spectra": len(spectra),
+        "n_points": n_points,
+        "compress": compress,
+        "waveunit": s0.get_waveunit(),
+        "units": {q: s0.units[q] for q in quantities},
+        "cond_units": {k: v for (k, v) in s0.cond_units.items() if _jsonable(v)},
+    }
+    with open(join(folder, "spectra.json"), "w") as f:
+        json.dump(header, f)
+    with open(join(folder, "conditions.json"), "w") as f:
+        # as Spectrum.store : conditions that are not JSON-serializable are discarded
+        json.dump({k: v for (k, v) in conditions.items() if _jsonable(v)}, f)
+    return folder
+
+
+class ColumnarSpectra:
+    """Spectra of a columnar folder, read lazily
+
+    Parameters
+    ----------
+    folder: str
+        written by :py:func:`~benchmarks.specio.store_columnar`
+
+    See Also
+    --------
+    :py:meth:`~benchmarks.specio.ColumnarSpectra.get`,
+    :py:meth:`~benchmarks.specio.ColumnarSpectra.spectrum`
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(join(folder, "spectra.json")) as f:
+            self.header = json.load(f)
+        self._wavespace = None
+        self._conditions = None
+        self._arrays = {}
+
+    def __len__(self):
+        return self.header["n_spectra"]
+
+    @property
+    def conditions(self):
+        """ Conditions of all spectra (pandas DataFrame, one row per spectrum) """
+        return pd.DataFrame(self._read_conditions())
+
+    def _read_conditions(self):
+        if self._conditions is None:
+            with open(join(self.folder, "conditions.json")) as f:
+                self._conditions = json.load(f)
+        return self._conditions
+
+    @property
+    def wavespace(self):
+        if self._wavespace is None:
+            self._wavespace = np.load(join(self.folder, "wavespace.npy"))
+        return self._wavespace
+
+    def _read_rows(self, quantity, index=None):
+        """ Decompress spectrum ``index`` of ``quantity``, or all spectra """
+        offsets = self._arrays.get(quantity)
+        if offsets is None:
+            offsets = self._arrays[quantity] = np.load(join(self.folder, quantity + ".offsets.npy"))
+        n_points = self.header["n_points"]
+        with open(join(self.folder, quantity + ".zbin"), "rb") as f:
+            if index is not None:
+                f.seek(offsets[index])
+                data = f.read(offsets[index + 1] - offsets[index])
+                return _unshuffle(zlib.decompress(data), np.float64, n_points)
+            data = f.read()
+        I = np.empty((len(self), n_points))
+        for i in range(len(self)):
+            I[i] = _unshuffle(zlib.decompress(data[offsets[i] : offsets[i + 1]]), np.float64, n_points)
+        return I
+
+    def get(self, quantity, index=None):
+        """Wavespace and ``quantity`` of spectrum ``index``, or of all spectra
+
+        Parameters
+        ----------
+        quantity: str
+            ex: ``"radiance_noslit"``
+        index: int
+            spectrum. If ``None``, all spectra.
+
+        Returns
+        -------
+        w: numpy array
+            in the waveunit of the folder
+        I: numpy array
+            shape ``(n_points,)``, or ``(n_spectra, n_points)`` if ``index``
+            is ``None`` ; memory-mapped (read-only) if not compressed
+        """
+        if self.header["compress"]:
+            return self.wavespace, self._read_rows(quantity, index)
+        if quantity not in self._arrays:
+            self._arrays[quantity] = np.load(join(self.folder, quantity + ".npy"), mmap_mode="r")
+        array = self._arrays[quantity]
+        return self.wavespace, array if index is None else array[index]
+
+    def spectrum(self, index):
+        """ Spectrum ``index``, with all its quantities """
+        from radis import Spectrum
+
+        conditions = {k: v[index] for (k, v) in self._read_conditions().items()}
+        return Spectrum(
+            quantities={q: self.get(q, index) for q in self.header["units"]},
+            units=self.header["units"],
+            conditions=conditions,
+            cond_units=self.header["cond_units"],
+            wunit=self.header["waveunit"],
+        )
+
+
+# %% Benchmarks
+
+FORMATS = ["spec", "spec-compressed", "columnar", "columnar-compressed"]
+
+
+def spectrum_variants(s, n, seed=0):
+    """``n`` copies of ``s`` at different temperatures, with their quantities
+    scaled by random factors (spectra with different data)
+
+    Returns
+    -------
+    list of Spectrum
+    """
+    from radis import Spectrum
+
+    rng = np.random.default_rng(seed)
+    waveunit = s.get_waveunit()
+    arrays = {q: s.get(q, wunit=waveunit, copy=False) for q in s.get_vars()}
+    spectra = []
+    for i, factor in enumerate(1 + 0.1 * rng.random(n)):
+        spectra.append(
+            Spectrum(
+                quantities={q: (w, I * factor) for (q, (w, I)) in arrays.items()},
+                units=s.units,
+                conditions=dict(s.conditions, Tgas=1000 + i * 0.01),
+                cond_units=s.cond_units,
+                wunit=waveunit,
+            )
+        )
+    return spectra
+
+
+def reference_spectrum(wavenum_min, wavenum_max):
+    """ Equilibrium spectrum of synthetic CO2 lines, with all its quantities """
+    sf = synthetic_factory(
+        20_000, wavenum_min, wavenum_max, wstep=WSTEP, truncation=5, neighbour_lines=5, cutoff=0
+    )
+    return sf.eq_spectrum(1500, mole_fraction=0.1, pressure=1, path_length=1)
+
+
+def store(spectra, path, fmt):
+    """Write ``spectra`` in format ``fmt`` (see :py:data:`FORMATS`) : ``.spec`` files
+    in folder ``path``, or a columnar folder ``path``. ``path`` is replaced if it exists."""
+    if fmt.startswith("columnar"):
+        return store_columnar(spectra, path, compress=fmt == "columnar-compressed")
+    if exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    for i, s in enumerate(spectra):
+        s.store(
+            join(path, "spectrum_{0:06d}.spec".format(i)),
+            compress=fmt == "spec-compressed",
+            if_exists_then="replace",
+            verbose=False,
+        )
+    return path
+
+
+def folder_size(path):
+    """ Size of the files of ``path`` (bytes) """
+    return sum(getsize(join(root, f)) for (root, _, files) in os.walk(path) for f in files)
+
+
+def spectra_bytes(s):
+    """ Size of the arrays of the quantities of ``s`` (bytes) : the data of MB/s """
+    return sum(s.get(q, copy=False)[1].nbytes for q in s.get_vars())
+
+
+def spec_database(path, **kwargs):
+    """:py:class:`~radis.tools.database.SpecDatabase` of folder ``path``, one process
+    (same as the columnar reader), quiet"""
+    from radis import SpecDatabase
+
+    options = dict(verbose=False, nJobs=IfSupported(1), **kwargs)
+    return SpecDatabase(path, **resolve_options(SpecDatabase, options))
+
+
+def first_quantity(path, fmt, quantity="radiance_noslit"):
+    """ Open ``path`` and read ``quantity`` of its first spectrum """
+    if fmt.startswith("columnar"):
+        return ColumnarSpectra(path).get(quantity, 0)[1]
+    from radis import load_spec
+
+    s = load_spec(join(path, "spectrum_000000.spec"), binary=fmt == "spec-compressed")
+    return s.get(quantity, copy=False)[1]
+
+
+class SpecIO_Spectrum:
+    """
+    Store & load of one spectrum (5,002 points, 5 quantities) in each format.
+    ``spec`` : :py:meth:`~radis.spectrum.spectrum.Spectrum.store` (JSON text),
+    ``spec-compressed`` : gzip-compressed JSON (``compress=True``),
+    ``columnar(-compressed)`` : see :py:mod:`benchmarks.specio`. MB/s are
+    MB of spectral arrays (the same in all formats) per second.
+    """
+
+    timeout = 600
+    params = FORMATS
+    param_names = ["format"]
+
+    def setup_cache(self):
+        require_synthetic()
+        return reference_spectrum(*SPECTRUM_RANGE)
+
+    def setup(self, s, fmt):
+        self.spectra = [s]
+        self.path = tempfile.mkdtemp(prefix="specio_")
+        store(self.spectra, self.path, fmt)
+
+    def teardown(self, s, fmt):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _load(self, fmt):
+        if fmt.startswith("columnar"):
+            return ColumnarSpectra(self.path).spectrum(0)
+        from radis import load_spec
+
+        return load_spec(join(self.path, "spectrum_000000.spec"), binary=fmt == "spec-compressed")
+
+    def time_store(self, s, fmt):
+        store(self.spectra, self.path, fmt)
+
+    def time_load(self, s, fmt):
+        self._load(fmt)
+
+    def time_first_quantity(self, s, fmt):
+        first_quantity(self.path, fmt)
+
+    def track_file_size(self, s, fmt):
+        return folder_size(self.path)
+
+    track_file_size.unit = "bytes"
+
+    def track_store_MBps(self, s, fmt):
+        t0 = perf_counter()
+        store(self.spectra, self.path, fmt)
+        return spectra_bytes(s) / 1e6 / (perf_counter() - t0)
+
+    track_store_MBps.unit = "MB/s"
+
+    def track_load_MBps(self, s, fmt):
+        t0 = perf_counter()
+        self._load(fmt)
+        return spectra_bytes(s) / 1e6 / (perf_counter() - t0)
+
+    track_load_MBps.unit = "MB/s"
+
+
+class SpecIO_Database:
+    """
+    Bulk loading of 1,000 to 10,000 spectra (502 points, 5 quantities ; set
+    ``RADIS_BENCHMARK_SPECTRA=1000,10000,100000`` for more). ``spec-compressed`` :
+    folder of ``.spec`` files, loaded with :py:class:`~radis.tools.database.SpecDatabase`.
+    ``columnar(-compressed)`` : folder of :py:func:`~benchmarks.specio.store_columnar`.
+
+    - ``time_open`` : conditions of all spectra (SpecDatabase index)
+    - ``time_load_all`` : all quantities of all spectra
+    - ``time_first_quantity`` : open, and read the radiance of the first spectrum
+    """
+
+    timeout = 3600
+    number = 1
+    warmup_time = 0
+    params = (get_spectra_counts(), ["spec-compressed", "columnar", "columnar-compressed"])
+    param_names = ["n_spectra", "format"]
+
+    def setup_cache(self):
+        require_synthetic()
+        s = reference_spectrum(*DATABASE_RANGE)
+        folders = {}
+        for n in get_spectra_counts():
+            spectra = spectrum_variants(s, n)
+            for fmt in SpecIO_Database.params[1]:
+                folders[n, fmt] = store(spectra, os.path.abspath("specio_{0}_{1}".format(fmt, n)), fmt)
+            spec_database(folders[n, "spec-compressed"])  # writes the index of the folder
+        return {"folders": folders, "spectrum_bytes": spectra_bytes(s)}
+
+    def setup(self, cache, n_spectra, fmt):
+        self.path = cache["folders"][n_spectra, fmt]
+
+    def _load_all(self, fmt):
+        if fmt == "spec-compressed":
+            return spec_database(self.path, lazy_loading=IfSupported(False))
+        db = ColumnarSpectra(self.path)
+        return [np.array(db.get(q)[1]) for q in db.header["units"]]
+
+    def time_open(self, cache, n_spectra, fmt):
+        if fmt == "spec-compressed":
+            spec_database(self.path)
+        else:
+            ColumnarSpectra(self.path).conditions
+
+    def time_load_all(self, cache, n_spectra, fmt):
+        self._load_all(fmt)
+
+    def peakmem_load_all(self, cache, n_spectra, fmt):
+        self._load_all(fmt)
+
+    def time_first_quantity(self, cache, n_spectra, fmt):
+        first_quantity(self.path, fmt)
+
+    def track_load_MBps(self, cache, n_spectra, fmt):
+        t0 = perf_counter()
+        self._load_all(fmt)
+        return n_spectra * cache["spectrum_bytes"] / 1e6 / (perf_counter() - t0)
+
+    track_load_MBps.unit = "MB/s"
+
+    def track_size_per_spectrum(self, cache, n_spectra, fmt):
+        return folder_size(self.path) / n_spectra
+
+    track_size_per_spectrum.unit = "bytes"
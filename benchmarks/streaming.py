@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core spectra of line databases larger than memory
+
+``CO2_HITEMP`` loads the whole line list in ``sf.df0``. Here the line
+database is stored on disk as partitions of :py:data:`PARTITION_LINES` lines,
+sorted by wavenumber, each partition being a folder of memory-mapped ``.npy``
+columns (see :py:func:`~benchmarks.throughput.write_shared_lines`).
+:py:class:`StreamingSpectrum` reads them one batch at a time, calculates the
+absorption coefficient of the batch on its own spectral range only (its lines
+± truncation, on the same grid as the full spectrum), adds it to the full
+spectrum and frees the batch. Absorption coefficients of lines add up : the
+result is that of the whole line list, but the memory is that of one batch.
+
+Only the columns of equilibrium spectra are stored (~80 bytes per line, see
+:py:data:`BYTES_PER_LINE`).
+
+Environment variables :
+
+- ``RADIS_BENCHMARK_MEMORY_BUDGET`` : memory budget (default 2 GB, see
+  :py:mod:`benchmarks.chunks`). Benchmarks stream a line list
+  :py:data:`OVERSIZE` times larger than the budget.
+
+Examples
+--------
+::
+
+    index = prepare_partitioned_databank(50_000_000, 1000, 5000)
+    stream = StreamingSpectrum(index, batch_lines=1_000_000)
+    wavenumber, abscoeff = stream.abscoeff(1500)
+
+"""
+
+import gc
+import json
+import os
+import threading
+import time
+from os.path import exists, join
+
+import numpy as np
+import pandas as pd
+from psutil import Process
+
+from radis import Spectrum
+
+from .chunks import get_memory_budget
+from .compat import require_synthetic
+from .memprofile import SAMPLING_INTERVAL
+from .sweep import TemperatureSweep
+from .synthetic import get_cache_folder, iter_line_blocks, write_databank
+from .throughput import HEADER_LINES, load_shared_lines, shared_factory, write_shared_lines
+
+PARTITION_LINES = 250_000  # lines per partition on disk
+OVERSIZE = 2  # line list size / memory budget
+BYTES_PER_LINE = 80  # equilibrium columns
+WAVENUM_MIN, WAVENUM_MAX = 1000, 5000  # cm-1
+
+FACTORY_KWARGS = {
+    "molecule": "CO2",
+    "isotope": "1,2,3",
+    "wstep": 0.01,
+    "truncation": 5,
+    "neighbour_lines": 5,
+    "cutoff": 0,
+    "verbose": 0,
+}
+SPECTRUM_KWARGS = {"pressure": 1, "mole_fraction": 0.1}
+T_GAS = 1500  # K
+
+
+# %% Partitioned line database
+
+
+def prepare_partitioned_databank(
+    n_lines, wavenum_min=WAVENUM_MIN, wavenum_max=WAVENUM_MAX, partition_lines=PARTITION_LINES, seed=0
+):
+    """Write a synthetic CO2 line list as partitions (once) ; never loaded in memory as a whole
+
+    Returns
+    -------
+    index: str
+        JSON file with the header databank and the folder, spectral range and
+        number of lines of each partition
+    """
+    folder = join(
+        get_cache_folder(),
+        "streaming_{0:g}-{1:g}cm-1_{2}lines_{3}perpartition_seed{4}".format(
+            wavenum_min, wavenum_max, n_lines, partition_lines, seed
+        ),
+    )
+    index = join(folder, "partitions.json")
+    if exists(index):
+        return index
+
+    os.makedirs(folder, exist_ok=True)
+    header_path = join(folder, "header.h5")
+    columns, partitions = None, []
+    for block in iter_line_blocks(n_lines, wavenum_min, wavenum_max, seed=seed):
+        if columns is None:
+            # columns of equilibrium calculations, as loaded by RADIS
+            write_databank(block.iloc[:HEADER_LINES], header_path)
+            header = shared_factory(
+                header_path, None, wavenum_min=wavenum_min, wavenum_max=wavenum_max, **FACTORY_KWARGS
+            ).df0
+            columns = header.dtypes.to_dict()
+        for start in range(0, len(block), partition_lines):
+            lines = block.iloc[start : start + partition_lines]
+            name = "part{0:05d}".format(len(partitions))
+            write_shared_lines(lines[list(columns)].astype(columns), join(folder, name))
+            partitions.append(
+                {
+                    "folder": name,
+                    "wav_min": float(lines["wav"].iloc[0]),
+                    "wav_max": float(lines["wav"].iloc[-1]),
+                    "n_lines": len(lines),
+                }
+            )
+        del block
+    with open(index + ".tmp", "w") as f:
+        json.dump(
+            {
+                "header": "header.h5",
+                "wavenum_min": wavenum_min,
+                "wavenum_max": wavenum_max,
+                "n_lines": int(n_lines),
+                "bytes_per_line": int(sum(dtype.itemsize for dtype in columns.values())),
+                "partitions": partitions,
+            },
+            f,
+            indent=1,
+        )
+    os.replace(index + ".tmp", index)  # only complete databanks are reused
+    return index
+
+
+def read_partitions(index):
+    """ Content of the index written by :py:func:`prepare_partitioned_databank`, with absolute paths """
+    with open(index) as f:
+        content = json.load(f)
+    folder = os.path.dirname(index)
+    content["header"] = join(folder, content["header"])
+    for partition in content["partitions"]:
+        partition["folder"] = join(folder, partition["folder"])
+    return content
+
+
+# %% Streaming calculation
+
+
+class StreamingSpectrum:
+    """Equilibrium spectrum of a partitioned line database, one batch of partitions at a time
+
+    Parameters
+    ----------
+    index: str
+        see :py:func:`prepare_partitioned_databank`
+    batch_lines: int
+        lines read and calculated at once. Consecutive partitions are grouped
+        up to this size ; a single partition is memory-mapped, not copied.
+    wavenum_min, wavenum_max: float
+        spectral range (cm-1). Default : the range of the line database.
+    **factory_kwargs:
+        forwarded to :py:class:`~radis.lbl.factory.SpectrumFactory`. Default
+        :py:data:`FACTORY_KWARGS`.
+    """
+
+    def __init__(self, index, batch_lines=PARTITION_LINES, wavenum_min=None, wavenum_max=None, **factory_kwargs):
+        content = read_partitions(index)
+        self.wavenum_min = content["wavenum_min"] if wavenum_min is None else wavenum_min
+        self.wavenum_max = content["wavenum_max"] if wavenum_max is None else wavenum_max
+        self.bytes_per_line = content["bytes_per_line"]
+        kwargs = {**FACTORY_KWARGS, **factory_kwargs}
+        # the header databank only holds the first lines : build the factory on
+        # the full range of the database, then narrow it
+        self.sf = shared_factory(
+            content["header"], None, wavenum_min=content["wavenum_min"], wavenum_max=content["wavenum_max"], **kwargs
+        )
+        self.sf.input.wavenum_min, self.sf.input.wavenum_max = self.wavenum_min, self.wavenum_max
+        self.attrs = dict(self.sf.df0.attrs)
+        self.wstep = self.sf.params.wstep
+        self.truncation = self.sf.params.truncation
+
+        # partitions with lines that contribute to the spectral range
+        margin = max(self.sf.params.neighbour_lines, self.truncation)
+        partitions = [
+            p
+            for p in content["partitions"]
+            if p["wav_max"] >= self.wavenum_min - margin and p["wav_min"] <= self.wavenum_max + margin
+        ]
+        self.batches = []
+        for p in partitions:
+            if self.batches and sum(q["n_lines"] for q in self.batches[-1]) + p["n_lines"] <= batch_lines:
+                self.batches[-1].append(p)
+            else:
+                self.batches.append([p])
+        self.n_lines = sum(p["n_lines"] for p in partitions)
+
+    def _read(self, batch):
+        """ Lines of a batch ; memory-mapped if it is a single partition """
+        if len(batch) == 1:
+            df = load_shared_lines(batch[0]["folder"])
+        else:
+            df = pd.concat([load_shared_lines(p["folder"]) for p in batch], ignore_index=True)
+        margin = self.sf.params.neighbour_lines
+        if batch[0]["wav_min"] < self.wavenum_min - margin or batch[-1]["wav_max"] > self.wavenum_max + margin:
+            wav = df["wav"].to_numpy()
+            df = df[(wav >= self.wavenum_min - margin) & (wav <= self.wavenum_max + margin)]
+        df.attrs = dict(self.attrs)
+        return df
+
+    def _local_range(self, batch):
+        """ Spectral range of a batch : its lines ± truncation, on the grid of the full spectrum """
+        wstep = self.wstep
+        n_max = np.floor((self.wavenum_max - self.wavenum_min) / wstep)
+        i_min = np.clip(np.floor((batch[0]["wav_min"] - self.truncation - self.wavenum_min) / wstep), 0, n_max - 1)
+        i_max = np.clip(np.ceil((batch[-1]["wav_max"] + self.truncation - self.wavenum_min) / wstep), i_min + 1, n_max)
+        return self.wavenum_min + i_min * wstep, self.wavenum_min + i_max * wstep
+
+    def _batch_abscoeff(self, batch, Tgas):
+        """ Absorption coefficient of the lines of ``batch``, on its own spectral range """
+        sf = self.sf
+        sf.input.wavenum_min, sf.input.wavenum_max = self._local_range(batch)
+        sf.df0 = self._read(batch)
+        try:
+            return TemperatureSweep(sf, **SPECTRUM_KWARGS).abscoeff(Tgas)
+        finally:
+            sf.df0 = sf.df1 = None  # free the batch (and unmap its partitions)
+            gc.collect()
+
+    def abscoeff(self, Tgas):
+        """Absorption coefficient of all lines at ``Tgas``
+
+        Returns
+        -------
+        wavenumber, abscoeff: numpy arrays
+            in cm-1, and cm-1
+        """
+        n = int(np.floor((self.wavenum_max - self.wavenum_min) / self.wstep)) + 1
+        wavenumber = self.wavenum_min + self.wstep * np.arange(n)
+        abscoeff = np.zeros(n)
+        for batch in self.batches:
+            w, k = self._batch_abscoeff(batch, Tgas)
+            start = int(round((w[0] - self.wavenum_min) / self.wstep))
+            k = k[: n - start]
+            abscoeff[start : start + len(k)] += k
+        self.sf.input.wavenum_min, self.sf.input.wavenum_max = self.wavenum_min, self.wavenum_max
+        return wavenumber, abscoeff
+
+    def eq_spectrum(self, Tgas, path_length=1):
+        """ Equilibrium :py:class:`~radis.spectrum.spectrum.Spectrum` of all lines at ``Tgas`` """
+        wavenumber, abscoeff = self.abscoeff(Tgas)
+        s = Spectrum.from_array(
+            wavenumber,
+            abscoeff,
+            "abscoeff",
+            wunit="cm-1",
+            Iunit="cm-1",
+            conditions={"Tgas": Tgas, "path_length": path_length, "thermal_equilibrium": True, **SPECTRUM_KWARGS},
+            cond_units={"Tgas": "K", "path_length": "cm", "pressure": "bar"},
+        )
+        s.update(verbose=False)
+        return s
+
+
+class PeakRSS:
+    """ Peak RSS while the context is active, sampled in a background thread (bytes) """
+
+    def __enter__(self):
+        self._process = Process()
+        self.peak = self._process.memory_info().rss
+        self._running = True
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._running = False
+        self._sampler.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+        return False
+
+    def _sample(self):
+        while self._running:
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            time.sleep(SAMPLING_INTERVAL)
+
+
+# %% Benchmarks
+
+
+class CO2_Streaming:
+    """
+    Equilibrium spectrum (1000 - 5000 cm-1) of a synthetic CO2 line list
+    :py:data:`OVERSIZE` times larger than the memory budget, streamed by
+    batches of ``batch_lines`` lines.
+    """
+
+    params = [[PARTITION_LINES, 1_000_000, 4_000_000]]
+    param_names = ["batch_lines"]
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 3600
+
+    def setup_cache(self):
+        """ Write the partitioned line database (once) """
+        require_synthetic()
+        budget = get_memory_budget()
+        n_lines = int(OVERSIZE * budget / BYTES_PER_LINE) // PARTITION_LINES * PARTITION_LINES
+        return prepare_partitioned_databank(n_lines)
+
+    def setup(self, index, batch_lines):
+        require_synthetic()
+        self.stream = StreamingSpectrum(index, batch_lines)
+        self.stream._batch_abscoeff(self.stream.batches[0], T_GAS)  # compile numba functions
+
+    def time_streaming_spectrum(self, index, batch_lines):
+        self.stream.abscoeff(T_GAS)
+
+    def peakmem_streaming_spectrum(self, index, batch_lines):
+        self.stream.abscoeff(T_GAS)
+
+    def track_lines_per_second(self, index, batch_lines):
+        t0 = time.perf_counter()
+        self.stream.abscoeff(T_GAS)
+        return self.stream.n_lines / (time.perf_counter() - t0)
+
+    track_lines_per_second.unit = "lines/s"
+
+    def track_peak_memory(self, index, batch_lines):
+        """ Peak RSS of the process during the calculation """
+        with PeakRSS() as rss:
+            self.stream.abscoeff(T_GAS)
+        return rss.peak
+
+    track_peak_memory.unit = "bytes"
+
+    def track_peak_memory_fraction(self, index, batch_lines):
+        """ Peak RSS during the calculation / size of the line list (< 1 : out-of-core) """
+        with PeakRSS() as rss:
+            self.stream.abscoeff(T_GAS)
+        return rss.peak / (self.stream.n_lines * self.stream.bytes_per_line)
+
+    track_peak_memory_fraction.unit = "fraction"
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Surrogate spectra for repeated fits over the gas temperature
+
+Fits evaluate hundreds of near-identical spectra within the same bounded
+temperature range. :py:class:`SpectralCache` precomputes the model spectrum
+compared to the data (after slit, offsets and normalization, see
+:py:meth:`~benchmarks.fitting.FitEngine.processed_spectrum`) on a coarse
+temperature grid, and interpolates between them (cubic spline in
+temperature). Its error bound is measured against exact spectra at the
+middle of each grid interval.
+
+Exact evaluations are kept in an LRU cache, keyed on the fit parameters
+rounded to :py:data:`DIGITS` significant digits : repeated evaluations of the
+same point are free, while the finite-difference steps of gradient-based
+methods (~1e-8 relative) are still distinct points.
+
+:py:func:`surrogate_fit` first converges on the interpolated spectra, then
+refines on the exact model from there.
+
+Examples
+--------
+::
+
+    sf, s_data = get_fit_problem()
+    engine = FitEngine(sf, s_data, FIT_MODEL, FIT_PROPERTIES)
+    cache = SpectralCache(engine, 500, 2000, n_points=32)
+    result = surrogate_fit(engine, cache, {"Tgas": 700}, {"Tgas": [500, 2000]})
+
+"""
+
+from functools import lru_cache
+from time import perf_counter
+
+import numpy as np
+
+from radis import Spectrum
+
+from .compat import require_synthetic
+from .fitting import (
+    BOUNDING_RANGES,
+    FIT_MODEL,
+    FIT_PARAMETERS,
+    FIT_PROPERTIES,
+    FitEngine,
+    get_fit_problem,
+)
+
+N_POINTS = 32  # temperature grid of the surrogate
+DIGITS = 12  # significant digits of the parameters of exact evaluations
+LRU_SIZE = 256  # exact spectra kept
+
+
+class SpectralCache:
+    """Interpolated and cached model spectra of a :py:class:`~benchmarks.fitting.FitEngine`
+
+    Parameters
+    ----------
+    engine: FitEngine
+    Tmin, Tmax: float
+        temperature range (K), usually the bounds of the fit
+    n_points: int
+        number of spectra of the temperature grid
+    digits: int
+        significant digits of the keys of the exact spectra cache
+    maxsize: int
+        number of exact spectra kept
+
+    Attributes
+    ----------
+    error_bound: float
+        max difference between interpolated and exact spectra at the middle
+        of the grid intervals, relative to the max of the exact spectrum
+    build_time: float
+        time to compute the grid and its error bound (s)
+    """
+
+    def __init__(self, engine, Tmin, Tmax, n_points=N_POINTS, digits=DIGITS, maxsize=LRU_SIZE):
+        from scipy.interpolate import CubicSpline
+
+        self.engine = engine
+        self.Tmin, self.Tmax = Tmin, Tmax
+        self.digits = digits
+        self.fit_var = engine.pipeline["fit_var"]
+        self._exact = lru_cache(maxsize)(self._exact_spectrum)
+
+        t0 = perf_counter()
+        grid = np.linspace(Tmin, Tmax, n_points)
+        spectra = [self._arrays({"Tgas": T}) for T in grid]
+        self.wavenumber, self.unit = spectra[0][0], spectra[0][2]
+        I_grid = np.array([I for (_, I, _) in spectra])
+        self.valid = np.isfinite(I_grid).all(axis=0)  # not the edges of the slit
+        self.spline = CubicSpline(grid, I_grid[:, self.valid], axis=0)
+
+        # error bound : exact spectra in the middle of the intervals
+        error = 0
+        for T in (grid[1:] + grid[:-1]) / 2:
+            I_exact = self._arrays({"Tgas": T})[1][self.valid]
+            error = max(error, np.max(np.abs(self.spline(T) - I_exact)) / np.max(np.abs(I_exact)))
+        self.error_bound = error
+        self.build_time = perf_counter() - t0
+
+    def _arrays(self, values):
+        s = self.engine.processed_spectrum(values)
+        w, I = s.get(self.fit_var, wunit="cm-1")
+        return w, I, s.units[self.fit_var]
+
+    def interpolated(self, values):
+        """ Interpolated spectrum ; only the gas temperature can vary """
+        if set(values) != {"Tgas"}:
+            raise ValueError("Surrogate spectra only depend on Tgas. Got {0}".format(list(values)))
+        Tgas = np.clip(values["Tgas"], self.Tmin, self.Tmax)
+        I = np.full(len(self.wavenumber), np.nan)
+        I[self.valid] = self.spline(Tgas)
+        return Spectrum.from_array(self.wavenumber, I, self.fit_var, wunit="cm-1", Iunit=self.unit)
+
+    def _exact_spectrum(self, key):
+        return self.engine.processed_spectrum(dict(key))
+
+    def exact(self, values):
+        """ Exact spectrum, cached on rounded parameters """
+        key = tuple(sorted((k, float("{0:.{1}g}".format(v, self.digits))) for (k, v) in values.items()))
+        return self._exact(key)
+
+    def cache_info(self):
+        """ Hits and misses of the exact evaluations """
+        return self._exact.cache_info()
+
+
+def surrogate_fit(engine, cache, fit_params, bounds, method="leastsq", **fit_kws):
+    """Fit on the interpolated spectra, then refine on the exact (cached) ones
+
+    Returns
+    -------
+    result: lmfit.minimizer.MinimizerResult
+        of the refinement
+    log: dict
+        ``"surrogate"`` and ``"exact"`` : logs of both fits (see
+        :py:attr:`~benchmarks.fitting.FitEngine.log`)
+    """
+    source = engine.spectrum_source
+    try:
+        engine.spectrum_source = cache.interpolated
+        result = engine.fit(fit_params, bounds, method=method, **fit_kws)
+        log = {"surrogate": engine.log}
+        start = {name: float(p) for (name, p) in result.params.items()}
+        engine.spectrum_source = cache.exact
+        result = engine.fit(start, bounds, method=method, **fit_kws)
+        log["exact"] = engine.log
+    finally:
+        engine.spectrum_source = source
+    return result, log
+
+
+class CO2_SurrogateFit:
+    """
+    Temperature fit of the synthetic CO2 spectrum (see
+    :py:class:`~benchmarks.fitting.CO2_FitEngine`) on surrogate spectra
+    refined on exact ones, compared with the direct fit on exact spectra.
+    The surrogate is built once per fitting range, from ``2 n_points - 1``
+    exact spectra (grid and midpoints) : the speedup of a single fit includes
+    its build time, and ``track_break_even_fits`` is the number of fits on the
+    same range for the surrogate to pay off.
+    """
+
+    params = (["leastsq", "lbfgsb", "nelder"], [8, 32])
+    param_names = ["method", "n_points"]
+    number = 1
+    repeat = 1
+    warmup_time = 0
+    timeout = 600
+
+    def setup(self, method, n_points):
+        require_synthetic()
+        sf, s_data = get_fit_problem()
+        self.engine = FitEngine(sf, s_data, FIT_MODEL, FIT_PROPERTIES, mode="reuse")
+        self.cache = SpectralCache(self.engine, *BOUNDING_RANGES["Tgas"], n_points=n_points)
+
+        t0 = perf_counter()
+        result = self.engine.fit(FIT_PARAMETERS, BOUNDING_RANGES, method=method)
+        self.direct_time = perf_counter() - t0
+        self.direct_T = result.params["Tgas"].value
+        self.direct_residual = min(self.engine.log["residual"])
+
+        t0 = perf_counter()
+        result, self.log = surrogate_fit(
+            self.engine, self.cache, FIT_PARAMETERS, BOUNDING_RANGES, method=method
+        )
+        self.surrogate_time = perf_counter() - t0
+        self.surrogate_T = result.params["Tgas"].value
+        self.surrogate_residual = min(self.log["exact"]["residual"])
+
+    def track_speedup(self, method, n_points):
+        """ Direct fit time / (surrogate build + surrogate and refinement fit time) """
+        return self.direct_time / (self.cache.build_time + self.surrogate_time)
+
+    track_speedup.unit = "x"
+
+    def track_break_even_fits(self, method, n_points):
+        """Fits on the same range for which building the surrogate pays off
+        (``nan`` if surrogate fits are not faster than direct ones)"""
+        gain = self.direct_time - self.surrogate_time
+        if gain <= 0:
+            return np.nan
+        return float(np.ceil(self.cache.build_time / gain))
+
+    track_break_even_fits.unit = "fits"
+
+    def track_build_time(self, method, n_points):
+        return self.cache.build_time
+
+    track_build_time.unit = "seconds"
+
+    def track_exact_evaluations(self, method, n_points):
+        """ Exact spectra calculated during the refinement (LRU misses) """
+        return self.cache.cache_info().misses
+
+    track_exact_evaluations.unit = "evaluations"
+
+    def track_error_bound(self, method, n_points):
+        return self.cache.error_bound
+
+    track_error_bound.unit = "relative"
+
+    def track_temperature_error(self, method, n_points):
+        """ Difference with the temperature of the direct fit """
+        return abs(self.surrogate_T - self.direct_T)
+
+    track_temperature_error.unit = "K"
+
+    def track_residual_loss(self, method, n_points):
+        """ Residual of the surrogate fit minus residual of the direct fit """
+        return self.surrogate_residual - self.direct_residual
+
+    track_residual_loss.unit = "L2"
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Temperature sweep on a fixed line list
+
+Same calculation as :py:meth:`~radis.lbl.factory.SpectrumFactory.eq_spectrum`,
+repeated on a vector of gas temperatures, but the steps that do not depend on
+temperature are done once for the whole sweep :
+
+- database checks and copy of the line database (``df0`` to ``df1``),
+- pressure shift of the line positions, and sorting of the lines,
+- wavenumber grids and lineshape range,
+- diluent mole fractions.
+
+Linestrengths, HWHM, pseudo-continuum and lineshape broadening (including the
+LDM lineshape grids, which depend on the line widths) are computed for each
+temperature. Absorption coefficients are returned as arrays : no Spectrum
+object is generated per temperature.
+
+Uses private methods of the factory : requires RADIS >= 0.10.1
+
+Examples
+--------
+::
+
+    sf = SpectrumFactory(...)
+    sf.load_databank(...)
+    wavenumber, abscoeff = TemperatureSweep(sf).sweep([500, 1000, 1500])
+
+"""
+
+import numpy as np
+
+from radis.phys.constants import k_b
+
+
+class TemperatureSweep:
+    """Equilibrium absorption coefficients of a factory at many temperatures
+
+    Parameters
+    ----------
+    sf: SpectrumFactory
+        factory with its line database loaded
+    mole_fraction, pressure, diluent:
+        as in :py:meth:`~radis.lbl.factory.SpectrumFactory.eq_spectrum`. If ``None``,
+        use the factory inputs.
+
+    See Also
+    --------
+    :py:meth:`~benchmarks.sweep.TemperatureSweep.sweep`
+    """
+
+    def __init__(self, sf, mole_fraction=None, pressure=None, diluent=None):
+        self.sf = sf
+        if mole_fraction is not None:
+            sf.input.mole_fraction = mole_fraction
+        if pressure is not None:
+            sf.input.pressure = pressure
+        self.diluent = diluent
+        self.lines = None  # shifted & sorted lines, once prepared
+
+    def _start(self, Tgas):
+        """ New profiler entries & temperature, as at the start of eq_spectrum """
+        sf = self.sf
+        sf.input.Tgas = Tgas
+        sf._reset_profiler(sf.verbose)
+        sf.profiler.start("spectrum_calculation", 1)
+        sf.profiler.start("spectrum_calc_before_obj", 2)
+
+    def prepare(self, Tgas):
+        """Compute the quantities that do not depend on temperature
+
+        Called automatically by :py:meth:`~benchmarks.sweep.TemperatureSweep.sweep`.
+        ``Tgas`` is only used for the checks of the wavenumber step against
+        the line widths.
+        """
+        sf = self.sf
+        self._start(Tgas)
+        sf._check_line_databank()
+        sf._reinitialize()  # copy of df0, done once for the whole sweep
+        sf.calc_linestrength_eq(Tgas)
+        sf._generate_diluent_molefraction(sf.input.mole_fraction, self.diluent)
+        sf._calc_broadening_HWHM()
+        sf.calc_lineshift()  # shiftwav & sorted lines : pressure only
+        sf._generate_wavenumber_arrays()
+        self.lines = sf.df1
+
+    def abscoeff(self, Tgas):
+        """Absorption coefficient at ``Tgas``
+
+        Returns
+        -------
+        wavenumber, abscoeff: numpy arrays
+            in cm-1, and cm-1
+        """
+        if self.lines is None:
+            self.prepare(Tgas)
+        sf = self.sf
+        self._start(Tgas)
+        sf.df1 = self.lines  # columns are overwritten in place ; cutoff creates a new DataFrame
+        sf.calc_linestrength_eq(Tgas)
+        sf._cutoff_linestrength()
+        sf._calc_broadening_HWHM()
+        I_continuum = sf.calculate_pseudo_continuum()
+        wavenumber, abscoeff_v = sf._calc_broadening()
+        abscoeff_v = sf._add_pseudo_continuum(abscoeff_v, I_continuum)
+
+        return wavenumber, abscoeff_v * self.density(Tgas)
+
+    def density(self, Tgas):
+        """ Number density of the absorbing molecule at ``Tgas`` (cm-3) """
+        sf = self.sf
+        return sf.input.mole_fraction * ((sf.input.pressure * 1e5) / (k_b * Tgas)) * 1e-6
+
+    def sweep(self, Tgas_list):
+        """Absorption coefficients for all temperatures of ``Tgas_list``
+
+        Returns
+        -------
+        wavenumber: numpy array
+            in cm-1
+        abscoeff: numpy array of shape (len(Tgas_list), len(wavenumber))
+            in cm-1
+        """
+        abscoeff = None
+        for i, Tgas in enumerate(Tgas_list):
+            wavenumber, k = self.abscoeff(Tgas)
+            if abscoeff is None:
+                abscoeff = np.empty((len(Tgas_list), len(k)))
+            abscoeff[i] = k
+        return wavenumber, abscoeff
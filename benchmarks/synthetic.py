@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic line databases for network-free benchmarks
+
+Generates deterministic, seeded CO2 line lists with the same columns as the
+HITEMP databank parsed by RADIS (``wav``, ``int``, ``El``, ``airbrd``,
+``selbrd``, ``Tdpair``, ``v1u``, ...), and writes them once in the HDF5
+format read by :py:meth:`~radis.lbl.loader.DatabankLoader.load_databank`
+(``format="hitemp-radisdb"``). Generated files are reused across asv runs.
+
+Environment variables :
+
+- ``RADIS_BENCHMARK_DATABANK`` : set to ``"synthetic"`` to run the HITEMP
+  benchmarks on a synthetic line list instead of the downloaded HITEMP.
+- ``RADIS_BENCHMARK_SYNTHETIC_LINES`` : number of lines of the synthetic
+  line list (default 1.5 million ; tested up to 50 million).
+- ``RADIS_BENCHMARK_CACHE`` : folder where generated files are stored
+  (default ``~/.radisdb/radis-benchmark``).
+
+"""
+
+import os
+from os.path import exists, expanduser, join
+
+import numpy as np
+import pandas as pd
+
+# Bump this when the generated line list changes, so that old files are not reused
+SYNTHETIC_FORMAT_VERSION = 2
+
+# Lines are generated (and written) by blocks of this size. Fixed so that the
+# line list only depends on the seed, not on memory available.
+BLOCK_SIZE = 1_000_000
+
+DEFAULT_LINES = 1_500_000
+
+_c2 = 1.4387770  # cm.K   second radiation constant hc/k
+_Tref = 296  # K
+
+# Fraction of lines with unassigned vibrational levels (v1u = -1). Such lines
+# exist in HITEMP and are removed before non-equilibrium calculations.
+_UNASSIGNED_FRACTION = 0.02
+
+
+def get_cache_folder():
+    """ Folder where synthetic databases (and other benchmark caches) are stored """
+    folder = expanduser(
+        os.environ.get("RADIS_BENCHMARK_CACHE", join("~", ".radisdb", "radis-benchmark"))
+    )
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def use_synthetic_databank():
+    """ Whether benchmarks should run on synthetic line lists (see ``RADIS_BENCHMARK_DATABANK``) """
+    return os.environ.get("RADIS_BENCHMARK_DATABANK", "").lower() == "synthetic"
+
+
+def get_synthetic_lines_count():
+    """ Number of lines of the default synthetic line list (see ``RADIS_BENCHMARK_SYNTHETIC_LINES``) """
+    return int(float(os.environ.get("RADIS_BENCHMARK_SYNTHETIC_LINES", DEFAULT_LINES)))
+
+
+def generate_lines(n_lines, wavenum_min, wavenum_max, seed=0):
+    """Generate a synthetic CO2 line list
+
+    Lines are sorted by wavenumber. The same ``(n_lines, wavenum_min,
+    wavenum_max, seed)`` always return the same lines.
+
+    Parameters
+    ----------
+    n_lines: int
+        number of lines
+    wavenum_min, wavenum_max: float
+        spectral range (cm-1)
+    seed: int
+        random seed
+
+    Returns
+    -------
+    df: pandas DataFrame
+        line list with HITEMP-like columns
+
+    See Also
+    --------
+    :py:func:`~benchmarks.synthetic.iter_line_blocks`
+    """
+    return pd.concat(
+        iter_line_blocks(n_lines, wavenum_min, wavenum_max, seed=seed),
+        ignore_index=True,
+    )
+
+
+def iter_line_blocks(n_lines, wavenum_min, wavenum_max, seed=0):
+    """Generate a synthetic CO2 line list by blocks of :py:data:`BLOCK_SIZE` lines
+
+    The spectral range is divided in contiguous sub-ranges, one per block, so
+    that the concatenation of all blocks is sorted by wavenumber. Used to write
+    line lists larger than memory.
+
+    Yields
+    ------
+    df: pandas DataFrame
+        block of lines
+
+    See Also
+    --------
+    :py:func:`~benchmarks.synthetic.generate_lines`
+    """
+    n_lines = int(n_lines)
+    n_blocks = max(1, -(-n_lines // BLOCK_SIZE))  # ceil
+    block_seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    edges = np.linspace(wavenum_min, wavenum_max, n_blocks + 1)
+    for i in range(n_blocks):
+        n = min(BLOCK_SIZE, n_lines - i * BLOCK_SIZE)
+        yield _generate_block(
+            n, edges[i], edges[i + 1], np.random.default_rng(block_seeds[i])
+        )
+
+
+def _generate_block(n, wmin, wmax, rng):
+    """ Generate ``n`` lines between ``wmin`` and ``wmax`` with random generator ``rng`` """
+
+    wav = np.sort(rng.uniform(wmin, wmax, n))
+
+    # Isotopes 1, 2, 3 (line counts, not abundances)
+    iso = rng.choice(np.array([1, 2, 3], dtype=np.int64), size=n, p=[0.6, 0.25, 0.15])
+
+    # Rotational quantum numbers ; branch P / Q / R stored as -1 / 0 / 1
+    jl = rng.integers(0, 120, n)
+    branch = rng.choice(np.array([-1, 0, 1], dtype=np.int64), size=n, p=[0.45, 0.1, 0.45])
+    branch[jl == 0] = 1  # no P or Q branch from J"=0
+    ju = jl + branch
+    gi = np.where(iso == 2, 2, 1)  # nuclear spin degeneracy of 13C (636)
+
+    # Vibrational levels : hot bands of the asymmetric stretch (v3 -> v3 + 1)
+    v1l = rng.integers(0, 4, n)
+    v2l = rng.integers(0, 6, n)
+    l2l = v2l  # as in the energy levels of levelsfmt="radis"
+    v3l = rng.integers(0, 4, n)
+    rl = rng.integers(1, v1l + 2)
+    v1u, v2u, l2u, v3u, ru = v1l, v2l, l2l, v3l + 1, rl
+    # CDSD convention : polyad P = 2 v1 + v2 + 3 v3, Wang symmetry, ranking index
+    polyl, polyu = 2 * v1l + v2l + 3 * v3l, 2 * v1u + v2u + 3 * v3u
+    wangl = wangu = 1 + v2l % 2
+
+    # Lower state energy : vibrational + rotational (B ~ 0.39 cm-1)
+    El = (
+        1285.4 * v1l + 667.4 * v2l + 2349.1 * v3l
+        + 0.39 * jl * (jl + 1)
+        + rng.exponential(200, n)
+    )
+
+    # Line intensity at 296 K (cm-1/(molecule.cm-2)) : strong cold band, many weak hot lines
+    S = 10 ** rng.normal(-19.5, 1.0, n) * np.exp(-_c2 * El / _Tref)
+    S = np.maximum(S, 1e-99)
+
+    A = 10 ** rng.normal(0, 0.5, n)  # Einstein coefficient (s-1)
+
+    airbrd = rng.uniform(0.05, 0.09, n)
+    selbrd = airbrd * rng.uniform(1.2, 1.4, n)
+    Tdpair = rng.uniform(0.6, 0.8, n)
+    Pshft = rng.normal(-0.002, 0.001, n)
+
+    df = pd.DataFrame(
+        {
+            "id": np.full(n, 2, dtype=np.int64),
+            "iso": iso,
+            "wav": wav,
+            "int": S,
+            "A": A,
+            "airbrd": airbrd,
+            "selbrd": selbrd,
+            "El": El,
+            "Tdpair": Tdpair,
+            "Pshft": Pshft,
+            "gp": (2 * ju + 1) * gi,
+            "gpp": (2 * jl + 1) * gi,
+            "v1u": v1u,
+            "v2u": v2u,
+            "l2u": l2u,
+            "v3u": v3u,
+            "ru": ru,
+            "v1l": v1l,
+            "v2l": v2l,
+            "l2l": l2l,
+            "v3l": v3l,
+            "rl": rl,
+            "polyu": polyu,
+            "wangu": wangu,
+            "ranku": ru,
+            "polyl": polyl,
+            "wangl": wangl,
+            "rankl": rl,
+            "branch": branch,
+            "jl": jl,
+            "ju": ju,
+        }
+    )
+
+    # Lines with unassigned upper vibrational levels, as in HITEMP
+    unassigned = rng.random(n) < _UNASSIGNED_FRACTION
+    for col in ["v1u", "v2u", "l2u", "v3u", "ru", "polyu", "wangu", "ranku"]:
+        df.loc[unassigned, col] = -1
+
+    return df
+
+
+def get_synthetic_databank(
+    n_lines=None, wavenum_min=2000, wavenum_max=2250, seed=0, verbose=True
+):
+    """Get the path of a synthetic CO2 line database ; generate it the first time
+
+    Parameters
+    ----------
+    n_lines: int
+        number of lines. If ``None``, use ``RADIS_BENCHMARK_SYNTHETIC_LINES``
+        (default 1.5 million).
+    wavenum_min, wavenum_max: float
+        spectral range (cm-1)
+    seed: int
+        random seed
+
+    Returns
+    -------
+    path: str
+        HDF5 file, to be loaded with ``format="hitemp-radisdb"``
+
+    Examples
+    --------
+    ::
+
+        sf = SpectrumFactory(2000, 2250, molecule="CO2", isotope="1,2,3")
+        sf.load_databank(path=get_synthetic_databank(),
+                         format="hitemp-radisdb",
+                         parfuncfmt="hapi",
+                         levelsfmt="radis")
+    """
+    if n_lines is None:
+        n_lines = get_synthetic_lines_count()
+    n_lines = int(n_lines)
+    fname = join(
+        get_cache_folder(),
+        "CO2-synthetic_{0:g}-{1:g}cm-1_{2}lines_seed{3}_v{4}.h5".format(
+            wavenum_min, wavenum_max, n_lines, seed, SYNTHETIC_FORMAT_VERSION
+        ),
+    )
+    if not exists(fname):
+        if verbose:
+            from radis.misc.printer import printm  # radis is not imported by this module
+
+            printm("Generating synthetic line database ({0} lines) : {1}".format(n_lines, fname))
+        write_databank(
+            iter_line_blocks(n_lines, wavenum_min, wavenum_max, seed=seed),
+            fname,
+            metadata={
+                "wavenum_min": wavenum_min,
+                "wavenum_max": wavenum_max,
+                "seed": seed,
+                "synthetic_format_version": SYNTHETIC_FORMAT_VERSION,
+            },
+        )
+    return fname
+
+
+def write_databank(blocks, fname, metadata=None):
+    """Write a line list in the HDF5 format read by RADIS (``"hitemp-radisdb"``)
+
+    The file is written under a temporary name and renamed at the end, so an
+    interrupted run never leaves a partial file that would be reused later.
+
+    Parameters
+    ----------
+    blocks: pandas DataFrame, or iterable of DataFrames
+        lines ; blocks are appended one after the other so that line lists
+        larger than memory can be written. Numeric attributes of a single
+        DataFrame (see ``df.attrs``) are written as constant columns.
+    fname: str
+        output file
+    metadata: dict
+        stored with the table, in addition to the molecule and number of lines
+    """
+    if metadata is None:
+        metadata = {}
+    if isinstance(blocks, pd.DataFrame):
+        # columns that RADIS stored as attributes, because they are constant
+        # (ex: ``id``), are written back as columns
+        constants = {
+            k: v for (k, v) in blocks.attrs.items() if np.isscalar(v) and not isinstance(v, str)
+        }
+        blocks = [blocks.assign(**constants)]
+
+    ftmp = fname + ".tmp"
+    if exists(ftmp):
+        os.remove(ftmp)
+
+    total_lines = 0
+    with pd.HDFStore(ftmp, mode="w", complevel=0) as store:
+        for df in blocks:
+            # "wav" and "iso" are queried by RADIS when loading
+            store.append("df", df, format="table", data_columns=["wav", "iso"], index=False)
+            total_lines += len(df)
+        store.create_table_index("df", columns=["wav"], optlevel=6, kind="medium")
+        store.get_storer("df").attrs.metadata = {
+            "molecule": "CO2",
+            "total_lines": total_lines,
+            **metadata,
+        }
+    os.replace(ftmp, fname)
+
+    return fname
+
+
+def synthetic_factory(n_lines=None, wavenum_min=2000, wavenum_max=2250, seed=0, **kwargs):
+    """Return a :py:class:`~radis.lbl.factory.SpectrumFactory` loaded with a synthetic CO2 line list
+
+    Parameters
+    ----------
+    n_lines: int
+        number of lines. If ``None``, use ``RADIS_BENCHMARK_SYNTHETIC_LINES``.
+    wavenum_min, wavenum_max: float
+        spectral range (cm-1) of the line list and of the factory
+    seed: int
+        random seed
+    **kwargs:
+        forwarded to :py:class:`~radis.lbl.factory.SpectrumFactory`
+
+    Returns
+    -------
+    sf: SpectrumFactory
+        with lines in ``sf.df0``
+    """
+    from .compat import IfSupported, build_factory
+
+    kwargs.setdefault("molecule", "CO2")
+    kwargs.setdefault("isotope", "1,2,3")
+    kwargs.setdefault("verbose", 0)
+
+    return build_factory(
+        dict(
+            kwargs,
+            wavenum_min=wavenum_min,
+            wavenum_max=wavenum_max,
+            path=get_synthetic_databank(n_lines, wavenum_min, wavenum_max, seed=seed, verbose=False),
+            dbformat="hitemp-radisdb",
+            parfuncfmt=IfSupported("hapi"),  # removed in recent RADIS versions
+            levelsfmt="radis",
+            load_columns=IfSupported("noneq"),  # keep vibrational levels (recent RADIS versions)
+            load_energies=IfSupported(True),  # needed for non-equilibrium (recent RADIS versions)
+        )
+    )
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmarks under concurrent load
+
+``time_*`` benchmarks measure the latency of a single calculation. Here, many
+spectra are calculated at once by a pool of N workers (processes, or threads
+to expose GIL contention), and the benchmarks report the aggregate throughput
+(spectra per second), the parallel efficiency and the memory per worker.
+
+The line database is shared read-only by all workers : its columns are written
+once as ``.npy`` files, and memory-mapped (copy-on-write) by each worker.
+Workers build their :py:class:`~radis.lbl.factory.SpectrumFactory` once, from
+a small "header" databank with the same columns, then replace its lines with
+the memory-mapped ones. A job is then the calculation that
+:py:func:`~radis.lbl.calc.calc_spectrum` does once the lines are loaded.
+
+Loading the lines is shared, but each spectrum still copies them :
+``SpectrumFactory._reinitialize`` creates the scaled lines with
+``df1 = df0.copy()``, a private copy of the memory-mapped columns in every
+job (``track_copy_per_job``), kept by the worker until its next job.
+
+Runs on synthetic line lists (see :py:mod:`benchmarks.synthetic`).
+
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from os.path import join
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+from psutil import AccessDenied, Process
+
+from .compat import IfSupported, build_factory, require_synthetic
+from .synthetic import get_cache_folder, synthetic_factory, write_databank
+
+N_LINES = 200_000
+WAVENUM_MIN, WAVENUM_MAX = 2000, 2250  # cm-1
+JOBS_PER_WORKER = 4
+HEADER_LINES = 100  # lines of the databank used to build the factory of a worker
+
+FACTORY_KWARGS = {
+    "wavenum_min": WAVENUM_MIN,
+    "wavenum_max": WAVENUM_MAX,
+    "molecule": "CO2",
+    "isotope": "1,2,3",
+    "wstep": 0.01,
+    "truncation": 5,
+    "neighbour_lines": 5,
+    "cutoff": 0,
+    "verbose": 0,
+}
+SPECTRUM_KWARGS = {"pressure": 1, "mole_fraction": 0.1, "path_length": 1}
+T_IDENTICAL = 1500  # K
+T_VARIED = (700, 2500)  # K
+
+
+def _n_workers_list():
+    """ 1, 2, 4, ... up to the number of CPUs, and the number of CPUs """
+    cpus = os.cpu_count() or 1
+    n_workers = [n for n in 2 ** np.arange(8) if n <= cpus]
+    return sorted(set(int(n) for n in n_workers) | {cpus})
+
+
+# %% Shared line database
+
+
+def write_shared_lines(df, folder):
+    """Write the columns of ``df`` as ``.npy`` files, to be memory-mapped by workers
+
+    Returns
+    -------
+    folder: str
+    """
+    os.makedirs(folder, exist_ok=True)
+    for column in df.columns:
+        np.save(join(folder, "{0}.npy".format(column)), df[column].to_numpy())
+    with open(join(folder, "columns.json"), "w") as f:
+        json.dump(list(df.columns), f)
+    return folder
+
+
+def load_shared_lines(folder):
+    """Lines written by :py:func:`~benchmarks.throughput.write_shared_lines`, memory-mapped
+
+    Columns are mapped copy-on-write : pages are shared by all processes until
+    one of them writes to it. Each column is kept as its own block (no copy
+    when building the DataFrame, pandas >= 1.3).
+    """
+    with open(join(folder, "columns.json")) as f:
+        columns = json.load(f)
+    return pd.DataFrame(
+        {c: np.load(join(folder, "{0}.npy".format(c)), mmap_mode="c") for c in columns},
+        copy=False,
+    )
+
+
+# %% Workers
+
+_worker = threading.local()  # one factory per worker thread (or process)
+
+
+def shared_factory(header_path, shared_folder, **factory_kwargs):
+    """Factory whose lines are the memory-mapped shared lines
+
+    The factory is built from the small header databank (same columns), then
+    its lines are replaced. See
+    :py:func:`~benchmarks.throughput.prepare_shared_databank`. If
+    ``shared_folder`` is ``None``, the lines of the header are kept.
+
+    Returns
+    -------
+    sf: SpectrumFactory
+    """
+    sf = build_factory(
+        dict(
+            factory_kwargs,
+            path=header_path,
+            dbformat="hitemp-radisdb",
+            parfuncfmt=IfSupported("hapi"),  # removed in recent RADIS versions
+            load_columns=IfSupported("equilibrium"),  # no energy levels : ~1 GB less per worker
+        )
+    )
+    if shared_folder is None:
+        return sf
+    attrs = sf.df0.attrs
+    df = load_shared_lines(shared_folder)
+    df.attrs = {k: v for (k, v) in attrs.items() if k not in df.columns}
+    sf.df0 = df
+    return sf
+
+
+def _init_worker(header_path, shared_folder):
+    """ Build the factory of a worker, with the shared lines """
+    _worker.sf = shared_factory(header_path, shared_folder, **FACTORY_KWARGS)
+
+
+def _job(Tgas, report_memory=False):
+    """Calculate one spectrum in the current worker
+
+    Returns
+    -------
+    pid, unique memory (bytes, or ``None``)
+    """
+    s = _worker.sf.eq_spectrum(Tgas, **SPECTRUM_KWARGS)
+    s.get("abscoeff")
+    if not report_memory:
+        return os.getpid(), None
+    process = Process()
+    try:
+        memory = process.memory_full_info().uss  # not counting shared pages
+    except AccessDenied:
+        memory = process.memory_info().rss
+    return os.getpid(), memory
+
+
+def _copied_bytes():
+    """ Size of the copy of the lines made by each spectrum of the current worker (``df1 = df0.copy()``) """
+    return int(_worker.sf.df0.memory_usage(index=False).sum())
+
+
+class WorkerPool:
+    """Pool of ``n_workers`` processes or threads, each with its own factory
+
+    Parameters
+    ----------
+    kind: ``"process"`` or ``"thread"``
+    n_workers: int
+    header_path, shared_folder: str
+        see :py:func:`~benchmarks.throughput.prepare_shared_databank`
+    """
+
+    def __init__(self, kind, n_workers, header_path, shared_folder):
+        kwargs = {"initializer": _init_worker, "initargs": (header_path, shared_folder)}
+        if kind == "process":
+            # fork is unsafe once numba functions ran in the parent process
+            Executor = ProcessPoolExecutor
+            kwargs["mp_context"] = multiprocessing.get_context("spawn")
+        else:
+            Executor = ThreadPoolExecutor
+        self.kind = kind
+        self.n_workers = n_workers
+        self.executor = Executor(n_workers, **kwargs)
+        # start all workers, and compile numba functions in each of them
+        self.run([T_IDENTICAL] * n_workers)
+
+    def run(self, temperatures, report_memory=False):
+        """ Calculate one spectrum per temperature ; returns the job results """
+        futures = [self.executor.submit(_job, T, report_memory) for T in temperatures]
+        wait(futures)
+        return [f.result() for f in futures]
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def prepare_shared_databank(n_lines=N_LINES, wavenum_min=WAVENUM_MIN, wavenum_max=WAVENUM_MAX):
+    """Write the shared synthetic line database (once), and its header databank
+
+    Returns
+    -------
+    header_path, shared_folder: str
+    """
+    folder = join(
+        get_cache_folder(),
+        "throughput_{0:g}-{1:g}cm-1_{2}lines".format(wavenum_min, wavenum_max, n_lines),
+    )
+    header_path = folder + "_header.h5"
+    if not os.path.exists(join(folder, "columns.json")):
+        sf = synthetic_factory(n_lines, wavenum_min, wavenum_max)
+        write_databank(sf.df0.iloc[:HEADER_LINES], header_path)
+        write_shared_lines(sf.df0, folder)
+    return header_path, folder
+
+
+def get_temperatures(jobs, n_jobs):
+    """ Gas temperatures of ``n_jobs`` identical or varied jobs """
+    if jobs == "identical":
+        return [T_IDENTICAL] * n_jobs
+    return list(np.linspace(*T_VARIED, n_jobs))
+
+
+# %% Benchmarks
+
+
+class CO2_Throughput:
+    """
+    Aggregate throughput of equilibrium spectra calculated concurrently by
+    ``n_workers`` processes or threads, sharing a memory-mapped line database
+    (200k lines). Each worker calculates :py:data:`JOBS_PER_WORKER` spectra.
+    """
+
+    params = (["process", "thread"], _n_workers_list(), ["identical", "varied"])
+    param_names = ["pool", "n_workers", "jobs"]
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 1800
+
+    def setup_cache(self):
+        """Write the shared line database, and measure the single-worker throughput
+
+        The single-worker throughput of each pool is the reference of the
+        parallel efficiency.
+        """
+        require_synthetic()
+        header_path, shared_folder = prepare_shared_databank()
+        reference = {}
+        for kind in self.params[0]:
+            for jobs in self.params[2]:
+                pool = WorkerPool(kind, 1, header_path, shared_folder)
+                temperatures = get_temperatures(jobs, JOBS_PER_WORKER)
+                t0 = perf_counter()
+                pool.run(temperatures)
+                reference[kind, jobs] = len(temperatures) / (perf_counter() - t0)
+                pool.close()
+        return {
+            "header_path": header_path,
+            "shared_folder": shared_folder,
+            "reference": reference,
+        }
+
+    def setup(self, cache, pool, n_workers, jobs):
+        require_synthetic()
+        self.rss_before = Process().memory_info().rss
+        self.pool = WorkerPool(pool, n_workers, cache["header_path"], cache["shared_folder"])
+        self.temperatures = get_temperatures(jobs, JOBS_PER_WORKER * n_workers)
+
+    def teardown(self, cache, pool, n_workers, jobs):
+        self.pool.close()
+
+    def _throughput(self):
+        t0 = perf_counter()
+        self.pool.run(self.temperatures)
+        return len(self.temperatures) / (perf_counter() - t0)
+
+    def track_spectra_per_second(self, cache, pool, n_workers, jobs):
+        return self._throughput()
+
+    track_spectra_per_second.unit = "spectra/s"
+
+    def track_parallel_efficiency(self, cache, pool, n_workers, jobs):
+        """ Throughput, relative to ``n_workers`` times the throughput of a single worker """
+        return self._throughput() / (n_workers * cache["reference"][pool, jobs])
+
+    track_parallel_efficiency.unit = "fraction"
+
+    def track_memory_per_worker(self, cache, pool, n_workers, jobs):
+        """Memory of a worker, not counting the shared lines, but counting the
+        copy of the lines that each spectrum makes (see ``track_copy_per_job``)
+
+        Processes : unique memory (USS) of each worker, averaged. Threads :
+        increase of the process memory (RSS), divided by the number of workers.
+        """
+        results = self.pool.run(self.temperatures, report_memory=True)
+        if pool == "thread":
+            return (Process().memory_info().rss - self.rss_before) / n_workers
+        memory = {}
+        for pid, uss in results:
+            memory[pid] = max(memory.get(pid, 0), uss)
+        return float(np.mean(list(memory.values())))
+
+    track_memory_per_worker.unit = "bytes"
+
+    def track_copy_per_job(self, cache, pool, n_workers, jobs):
+        """ Private copy of the shared lines made by every spectrum, in each worker """
+        return self.pool.executor.submit(_copied_bytes).result()
+
+    track_copy_per_job.unit = "bytes"
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the hot paths of two RADIS versions : self time per function
+
+Reads the collapsed stacks written by the ``*_Profile`` benchmarks (see
+``benchmarks/cpuprofile.py``) for two commits, and lists, for each profiled
+benchmark, the functions whose self time (time spent in the function
+itself, not in its callees) changed most, with their inclusive time (in the
+function or its callees). Where ``tools/compare_results.py`` reports that
+a benchmark regressed, this tells where the time went.
+
+Usage ::
+
+    RADIS_BENCHMARK_PROFILE=1 asv run HASHFILE:tested_radis_versions.txt --bench _Profile
+    python tools/compare_profiles.py 0.9.29 0.10.2
+    python tools/compare_profiles.py 0.9.29 0.10.2 --bench CO2_HITEMP.time_eq_spectrum --top 30
+    python tools/compare_profiles.py 0.9.29 0.10.2 --diff-folded diff.folded
+    flamegraph.pl diff.folded > diff.svg
+
+Versions are commit hashes (or prefixes) of the profiles folder, or tags and
+branches of the RADIS repository (resolved with ``git ls-remote``). Profiles
+are single runs : small changes are noise.
+
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from os.path import join
+
+from compare_results import resolve_commit
+from run_radis_versions import ROOT, load_asv_conf
+
+TOP = 20  # functions listed per benchmark
+MIN_CHANGE = 0.005  # s ; smaller changes of self time are not listed
+
+# %% Reading profiles
+
+
+def get_profile_folder():
+    """ Same default as ``benchmarks.cpuprofile.get_profile_folder`` """
+    return os.environ.get("RADIS_BENCHMARK_PROFILE_DIR", join(ROOT, "profiles"))
+
+
+def find_commit(ref, folder, repo):
+    """Profile folder of ``ref`` (folders are named after the first 8 characters of the commit)"""
+    folders = [d for d in os.listdir(folder) if os.path.isdir(join(folder, d))]
+    matches = sorted({d for d in folders if d.startswith(ref) or ref.startswith(d)})
+    if len(matches) == 1:
+        return matches[0]
+    if len(matches) > 1:
+        raise ValueError("Ambiguous commit {0} : {1}".format(ref, matches))
+    commit = resolve_commit(ref, [], repo)
+    matches = [d for d in folders if commit.startswith(d)]
+    if not matches:
+        raise ValueError("No profiles of {0} ({1}) in {2}".format(ref, commit[:8], folder))
+    return matches[0]
+
+
+def read_collapsed(fname):
+    """Collapsed stacks of a profile
+
+    Returns
+    -------
+    dict: {tuple of frame labels: time (s)}
+    """
+    stacks = {}
+    with open(fname) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            stack, weight = line.rsplit(" ", 1)
+            stacks[tuple(stack.split(";"))] = float(weight) * 1e-6
+    return stacks
+
+
+def function_times(stacks):
+    """Self and inclusive time (s) of each function
+
+    Returns
+    -------
+    self_time, inclusive_time: dict
+        {frame label: time}. A recursive function counts once per stack in
+        its inclusive time.
+    """
+    self_time = defaultdict(float)
+    inclusive_time = defaultdict(float)
+    for stack, weight in stacks.items():
+        self_time[stack[-1]] += weight
+        for label in set(stack):
+            inclusive_time[label] += weight
+    return self_time, inclusive_time
+
+
+# %% Comparison
+
+
+def compare_profiles(base, head, top=TOP, min_change=MIN_CHANGE):
+    """Functions whose self time changed most between two profiles of a benchmark
+
+    Parameters
+    ----------
+    base, head: dict
+        collapsed stacks, see :py:func:`read_collapsed`
+
+    Returns
+    -------
+    dict
+        ``total`` (base, head) profiled times, and ``functions`` : list of
+        dict with ``function``, ``self`` and ``inclusive`` (base, head) times,
+        and ``self_change`` (head - base), largest changes first
+    """
+    base_self, base_incl = function_times(base)
+    head_self, head_incl = function_times(head)
+    functions = []
+    for label in set(base_self) | set(head_self):
+        change = head_self.get(label, 0) - base_self.get(label, 0)
+        if abs(change) >= min_change:
+            functions.append(
+                {
+                    "function": label,
+                    "self": (base_self.get(label, 0), head_self.get(label, 0)),
+                    "inclusive": (base_incl.get(label, 0), head_incl.get(label, 0)),
+                    "self_change": change,
+                }
+            )
+    functions.sort(key=lambda entry: -abs(entry["self_change"]))
+    return {
+        "total": (sum(base.values()), sum(head.values())),
+        "functions": functions[:top],
+    }
+
+
+def diff_folded(base, head):
+    """Lines ``stack base_weight head_weight`` (microseconds) : the input of
+    ``flamegraph.pl`` for differential flame graphs"""
+    return [
+        "{0} {1} {2}".format(";".join(stack), int(round(base.get(stack, 0) * 1e6)), int(round(head.get(stack, 0) * 1e6)))
+        for stack in sorted(set(base) | set(head))
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("base", help="reference RADIS version (commit, tag or branch)")
+    parser.add_argument("head", help="compared RADIS version (commit, tag or branch)")
+    parser.add_argument("--env", default=None, help="asv environment name (default : all common ones)")
+    parser.add_argument("--bench", action="append", default=None, help="only benchmarks containing this")
+    parser.add_argument("--top", type=int, default=TOP, help="functions listed per benchmark")
+    parser.add_argument("--min-change", type=float, default=MIN_CHANGE, help="smallest change of self time listed (s)")
+    parser.add_argument("--folder", default=None, help="profiles folder (default : RADIS_BENCHMARK_PROFILE_DIR or profiles/)")
+    parser.add_argument("--repo", default=None, help="RADIS repository (default : the one of asv.conf.json)")
+    parser.add_argument("--report", default=None, help="write the JSON report in this file")
+    parser.add_argument("--diff-folded", default=None, help="write the stacks of both versions in this file (one benchmark)")
+    args = parser.parse_args(argv)
+
+    folder = args.folder or get_profile_folder()
+    repo = args.repo or load_asv_conf()["repo"]
+    base, head = find_commit(args.base, folder, repo), find_commit(args.head, folder, repo)
+    envs = sorted(
+        e
+        for e in os.listdir(join(folder, base))
+        if os.path.isdir(join(folder, head, e)) and args.env in (None, e)
+    )
+    if not envs:
+        raise ValueError("No profiles of {0} and {1} in a common environment".format(args.base, args.head))
+
+    report = {"base": {"ref": args.base, "commit": base}, "head": {"ref": args.head, "commit": head}, "environments": {}}
+    folded = []
+    for env in envs:
+        names = sorted(
+            fname[: -len(".collapsed")]
+            for fname in os.listdir(join(folder, base, env))
+            if fname.endswith(".collapsed")
+            and os.path.exists(join(folder, head, env, fname))
+            and (args.bench is None or any(b in fname for b in args.bench))
+        )
+        report["environments"][env] = {}
+        for name in names:
+            stacks = [read_collapsed(join(folder, c, env, name + ".collapsed")) for c in (base, head)]
+            comparison = compare_profiles(*stacks, top=args.top, min_change=args.min_change)
+            report["environments"][env][name] = comparison
+            folded += diff_folded(*stacks)
+
+            print("{0} : {1}  {2} -> {3}".format(env, name, args.base, args.head))
+            print("  total {0:9.3f} s -> {1:9.3f} s".format(*comparison["total"]))
+            for entry in comparison["functions"]:
+                print(
+                    "  {0:+9.3f} s  self {1:8.3f} -> {2:8.3f}  incl. {3:8.3f} -> {4:8.3f}  {5}".format(
+                        entry["self_change"], *entry["self"], *entry["inclusive"], entry["function"]
+                    )
+                )
+
+    if args.diff_folded is not None:
+        n_benchmarks = sum(len(c) for c in report["environments"].values())
+        if n_benchmarks != 1:
+            raise ValueError(
+                "--diff-folded needs exactly one benchmark (got {0}) : use --bench and --env".format(n_benchmarks)
+            )
+        with open(args.diff_folded, "w") as f:
+            f.write("\n".join(folded) + "\n")
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the asv results of two RADIS versions, and fail on regressions
+
+Timings of the large benchmarks are noisy (system load, chunk size, disk
+cache) : comparing single numbers flags random changes. For each benchmark
+(and each combination of its parameters) both versions are compared on
+their repeat samples :
+
+- ``time`` benchmarks : Mann-Whitney U test (one-sided, head slower than
+  base) and bootstrap confidence interval of the ratio of the medians.
+  A regression is both statistically significant (``--alpha``) and larger
+  than ``--factor``. Samples are only stored by ``asv run --record-samples`` ;
+  without them, the 99% confidence intervals computed by asv must not
+  overlap.
+- ``peakmem`` benchmarks (one value per run) : ratio larger than ``--factor``.
+- ``track`` benchmarks whose unit is in ``--track-units`` (default :
+  seconds), as ``time`` benchmarks ; others are reported, not compared.
+
+A benchmark that ran for the base version but fails for the head version
+is a regression too (unless ``--allow-failures``).
+
+The JSON report lists all comparisons and can be used by the release
+pipeline. Exit code is 1 if any regression is found.
+
+Usage ::
+
+    asv run HASHFILE:tested_radis_versions.txt --record-samples
+    python tools/compare_results.py 0.9.29 0.10.2 --report regressions.json
+    python tools/compare_results.py 1a2b3c4d develop --bench CO2_HITEMP --factor 1.2
+
+Versions are commit hashes (or prefixes) of the results folder, or tags and
+branches of the RADIS repository (resolved with ``git ls-remote``).
+
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+from os.path import join
+
+import numpy as np
+
+from run_radis_versions import ROOT, load_asv_conf
+
+ALPHA = 0.05  # significance level
+FACTOR = 1.10  # minimal slowdown reported as a regression
+N_BOOTSTRAP = 2000
+TRACK_UNITS = ["seconds"]
+
+# %% Reading asv results
+
+
+def list_results(results_dir, machine=None):
+    """Results files of all commits
+
+    Returns
+    -------
+    machine: str
+    files: dict
+        {(commit hash, environment name): path}
+    """
+    machines = sorted(
+        d for d in os.listdir(results_dir) if os.path.isfile(join(results_dir, d, "machine.json"))
+    )
+    if machine is None:
+        if len(machines) != 1:
+            raise ValueError(
+                "Choose a machine with --machine among {0}".format(machines or "(no results)")
+            )
+        machine = machines[0]
+    elif machine not in machines:
+        raise ValueError("No results for machine {0}. Got {1}".format(machine, machines))
+    files = {}
+    for fname in os.listdir(join(results_dir, machine)):
+        if not fname.endswith(".json") or fname == "machine.json":
+            continue
+        with open(join(results_dir, machine, fname)) as f:
+            content = json.load(f)
+        files[(content["commit_hash"], content["env_name"])] = join(results_dir, machine, fname)
+    return machine, files
+
+
+def resolve_commit(ref, commits, repo):
+    """Commit hash of ``ref`` : a hash prefix of the results, or a tag or branch of ``repo``"""
+    matches = sorted({c for c in commits if c.startswith(ref)})
+    if len(matches) == 1:
+        return matches[0]
+    if len(matches) > 1:
+        raise ValueError("Ambiguous commit {0} : {1}".format(ref, matches))
+    refs = ["refs/tags/{0}".format(ref), "refs/tags/{0}^{{}}".format(ref), "refs/heads/{0}".format(ref)]
+    out = subprocess.run(
+        ["git", "ls-remote", repo] + refs,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+    found = dict(reversed(line.split("\t")) for line in out.splitlines() if "\t" in line)
+    for r in [refs[1], refs[0], refs[2]]:  # annotated tags point to a tag object : peel it
+        if r in found:
+            return found[r]
+    raise ValueError("{0} is neither a commit of the results nor a tag or branch of {1}".format(ref, repo))
+
+
+def read_results(fname):
+    """Results of one commit & environment
+
+    Returns
+    -------
+    dict: {benchmark name: list of dict}
+        one dict per combination of parameters, with ``params`` (tuple of str),
+        ``result`` (float or ``None`` if failed), ``samples`` (list or ``None``),
+        ``ci`` ((low, high) or ``None``)
+    """
+    with open(fname) as f:
+        content = json.load(f)
+    columns = content.get("result_columns")
+    results = {}
+    for name, value in content["results"].items():
+        if columns is not None:  # asv >= 0.5
+            value = dict(zip(columns, value))
+        elif not isinstance(value, dict):  # asv < 0.5, not parametrized
+            value = {"result": value}
+        result = value.get("result")
+        params = value.get("params") or []
+        if not isinstance(result, list):
+            result = [result]
+        combinations = list(itertools.product(*params)) if params else [()]
+        samples = value.get("samples") or [None] * len(combinations)
+        if columns is not None:
+            low = value.get("stats_ci_99_a") or [None] * len(combinations)
+            high = value.get("stats_ci_99_b") or [None] * len(combinations)
+            ci = [(a, b) if a is not None and b is not None else None for a, b in zip(low, high)]
+        else:
+            ci = [tuple(st["ci_99"]) if st and st.get("ci_99") else None for st in value.get("stats") or []]
+            ci = ci or [None] * len(combinations)
+        results[name] = [
+            {
+                "params": tuple(p),
+                "result": r,
+                "samples": s,
+                "ci": c,
+            }
+            for p, r, s, c in zip(combinations, result, samples, ci)
+        ]
+    return results
+
+
+def read_benchmarks(results_dir):
+    """ Type and unit of the benchmarks (``benchmarks.json`` of asv) """
+    fname = join(results_dir, "benchmarks.json")
+    if not os.path.exists(fname):
+        return {}
+    with open(fname) as f:
+        return {k: v for (k, v) in json.load(f).items() if isinstance(v, dict)}
+
+
+def _skipped(result):
+    return result is not None and np.isnan(result)
+
+
+# %% Statistics
+
+
+def mann_whitney(base, head):
+    """ p-value of head samples being larger than base samples (one-sided) """
+    from scipy.stats import mannwhitneyu
+
+    return float(mannwhitneyu(head, base, alternative="greater").pvalue)
+
+
+def bootstrap_ratio(base, head, alpha=ALPHA, n=N_BOOTSTRAP, seed=0):
+    """ (low, high) : two-sided ``1 - alpha`` confidence interval of median(head) / median(base) """
+    rng = np.random.default_rng(seed)
+    base, head = np.asarray(base, dtype=float), np.asarray(head, dtype=float)
+    b = np.median(rng.choice(base, (n, len(base))), axis=1)
+    h = np.median(rng.choice(head, (n, len(head))), axis=1)
+    low, high = np.percentile(h / b, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(low), float(high)
+
+
+def compare(base, head, kind, alpha=ALPHA, factor=FACTOR):
+    """Compare the results of one benchmark (and combination of parameters)
+
+    Parameters
+    ----------
+    base, head: dict
+        see :py:func:`read_results`
+    kind: ``"time"`` or ``"peakmem"``
+        ``time`` : repeat samples are tested ; ``peakmem`` : single values
+
+    Returns
+    -------
+    dict: ``status`` (``"regression"``, ``"improvement"``, ``"unchanged"``,
+    ``"failed"``, ``"fixed"``, ``"skipped"``), ``ratio`` (head / base), and
+    the statistics used
+    """
+    # asv stores failed benchmarks as None, skipped ones as NaN
+    if _skipped(base["result"]) or _skipped(head["result"]):
+        return {"status": "skipped", "ratio": None}
+    if head["result"] is None:
+        return {"status": "skipped" if base["result"] is None else "failed", "ratio": None}
+    if base["result"] is None:
+        return {"status": "fixed", "ratio": None}
+    out = {"ratio": head["result"] / base["result"] if base["result"] > 0 else None}
+    big_change = bool(out["ratio"]) and max(out["ratio"], 1 / out["ratio"]) > factor
+
+    if kind == "peakmem":
+        out["test"] = "threshold"
+        slower, faster = big_change and out["ratio"] > 1, big_change and out["ratio"] < 1
+    elif base["samples"] and head["samples"] and min(len(base["samples"]), len(head["samples"])) >= 2:
+        out["test"] = "mann-whitney+bootstrap"
+        out["p_slower"] = mann_whitney(base["samples"], head["samples"])
+        out["p_faster"] = mann_whitney(head["samples"], base["samples"])
+        out["ci_ratio"] = bootstrap_ratio(base["samples"], head["samples"], alpha)
+        slower = big_change and out["p_slower"] < alpha and out["ci_ratio"][0] > 1
+        faster = big_change and out["p_faster"] < alpha and out["ci_ratio"][1] < 1
+    elif base["ci"] and head["ci"]:
+        out["test"] = "ci_99"
+        slower = big_change and head["ci"][0] > base["ci"][1]
+        faster = big_change and head["ci"][1] < base["ci"][0]
+    else:
+        out["test"] = "threshold"  # single samples (ex: repeat = 1)
+        slower, faster = big_change and out["ratio"] > 1, big_change and out["ratio"] < 1
+
+    out["status"] = "regression" if slower else "improvement" if faster else "unchanged"
+    return out
+
+
+def benchmark_kind(name, info, track_units=TRACK_UNITS):
+    """ ``"time"``, ``"peakmem"``, or ``None`` if not compared """
+    kind = info.get("type")
+    short = name.split(".")[-1]
+    if kind == "time" or (kind is None and short.startswith("time_")):
+        return "time"
+    if kind == "peakmemory" or (kind is None and short.startswith("peakmem_")):
+        return "peakmem"
+    if (kind == "track" or short.startswith("track_")) and info.get("unit") in track_units:
+        return "time"
+    return None
+
+
+def compare_results(
+    base_file, head_file, benchmarks=None, bench=None, alpha=ALPHA, factor=FACTOR, track_units=TRACK_UNITS
+):
+    """Compare two results files ; returns the list of comparisons
+
+    ``benchmarks`` : type and unit of the benchmarks (see :py:func:`read_benchmarks`)
+    """
+    if benchmarks is None:
+        benchmarks = {}
+    base, head = read_results(base_file), read_results(head_file)
+    comparisons = []
+    for name in sorted(set(base) | set(head)):
+        if bench is not None and not any(b in name for b in bench):
+            continue
+        kind = benchmark_kind(name, benchmarks.get(name, {}), track_units)
+        base_results = {r["params"]: r for r in base.get(name, [])}
+        head_results = {r["params"]: r for r in head.get(name, [])}
+        for params in sorted(set(base_results) | set(head_results)):
+            b, h = base_results.get(params), head_results.get(params)
+            entry = {
+                "name": name,
+                "params": list(params),
+                "kind": kind,
+                "unit": benchmarks.get(name, {}).get("unit"),
+                "base": b["result"] if b else None,
+                "head": h["result"] if h else None,
+            }
+            if b is None or h is None:
+                entry["status"] = "new" if b is None else "removed"
+            elif kind is None:
+                entry["status"] = "not compared"
+            else:
+                entry.update(compare(b, h, kind, alpha, factor))
+            comparisons.append(entry)
+    return comparisons
+
+
+# %% Command line
+
+
+def _label(entry):
+    if entry["params"]:
+        return "{0}({1})".format(entry["name"], ", ".join(entry["params"]))
+    return entry["name"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("base", help="reference RADIS version (commit, tag or branch)")
+    parser.add_argument("head", help="compared RADIS version (commit, tag or branch)")
+    parser.add_argument("--machine", default=None, help="asv machine name (default : the only one)")
+    parser.add_argument("--env", default=None, help="asv environment name (default : all common ones)")
+    parser.add_argument("--bench", action="append", default=None, help="only benchmarks containing this")
+    parser.add_argument("--alpha", type=float, default=ALPHA, help="significance level")
+    parser.add_argument("--factor", type=float, default=FACTOR, help="minimal ratio reported")
+    parser.add_argument(
+        "--track-units",
+        nargs="*",
+        default=TRACK_UNITS,
+        help="units of track_* benchmarks compared as timings (lower is better)",
+    )
+    parser.add_argument("--allow-failures", action="store_true", help="failures are not regressions")
+    parser.add_argument("--repo", default=None, help="RADIS repository (default : the one of asv.conf.json)")
+    parser.add_argument("--report", default=None, help="write the JSON report in this file")
+    args = parser.parse_args(argv)
+
+    conf = load_asv_conf()
+    results_dir = join(ROOT, conf.get("results_dir", "results"))
+    machine, files = list_results(results_dir, args.machine)
+    commits = {c for (c, _) in files}
+    repo = args.repo or conf["repo"]
+    base, head = resolve_commit(args.base, commits, repo), resolve_commit(args.head, commits, repo)
+    envs = sorted(
+        e for (c, e) in files if c == base and (head, e) in files and args.env in (None, e)
+    )
+    if not envs:
+        raise ValueError(
+            "No results of {0} ({1}) and {2} ({3}) in a common environment on {4}".format(
+                args.base, base[:8], args.head, head[:8], machine
+            )
+        )
+    benchmarks = read_benchmarks(results_dir)
+
+    blocking = {"regression"} if args.allow_failures else {"regression", "failed"}
+    report = {
+        "base": {"ref": args.base, "commit_hash": base},
+        "head": {"ref": args.head, "commit_hash": head},
+        "machine": machine,
+        "alpha": args.alpha,
+        "factor": args.factor,
+        "environments": {},
+    }
+    for env in envs:
+        comparisons = compare_results(
+            files[(base, env)],
+            files[(head, env)],
+            benchmarks,
+            args.bench,
+            args.alpha,
+            args.factor,
+            args.track_units,
+        )
+        report["environments"][env] = comparisons
+        print("{0} : {1} -> {2}".format(env, args.base, args.head))
+        for entry in comparisons:
+            if entry["status"] in ("regression", "improvement", "failed", "fixed"):
+                print(
+                    "  {0:12} {1:>6}  {2}".format(
+                        entry["status"],
+                        "{0:.2f}x".format(entry["ratio"]) if entry.get("ratio") else "",
+                        _label(entry),
+                    )
+                )
+
+    all_entries = [e for comparisons in report["environments"].values() for e in comparisons]
+    report["summary"] = {
+        status: sum(e["status"] == status for e in all_entries)
+        for status in sorted({e["status"] for e in all_entries})
+    }
+    report["regression"] = any(e["status"] in blocking for e in all_entries)
+    print("Summary : {0}".format(report["summary"]))
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=4)
+    return int(report["regression"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Run the benchmarks on several RADIS versions in parallel
+
+Replaces the sequential ``asv run <tag>`` loop. Each version is benchmarked by
+its own ``asv run`` process, with :
+
+- its own conda environments and results folder (no clash between parallel installs),
+- its own set of CPU cores (``--cpu-affinity``), so that timings do not interfere,
+- a number of parallel jobs capped by the available CPUs and memory,
+- existing results reused (``--skip-existing-successful``) : an interrupted sweep
+  resumes where it stopped.
+
+Results of all workers are then merged in the results folder of ``asv.conf.json``,
+ready for ``asv publish``.
+
+Usage ::
+
+    python tools/run_radis_versions.py                     # all versions of tested_radis_versions.txt
+    python tools/run_radis_versions.py 0.9.29 0.10.2 -j 2
+    python tools/run_radis_versions.py --mem-per-job 16 -- --bench CO2_HITEMP
+
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from os.path import abspath, dirname, exists, join
+from queue import Empty, Queue
+
+ROOT = dirname(dirname(abspath(__file__)))
+ASV_CONF = join(ROOT, "asv.conf.json")
+VERSIONS_FILE = join(ROOT, "tested_radis_versions.txt")
+WORK_DIR = join(ROOT, ".asv-parallel")
+
+
+def load_asv_conf(fname=ASV_CONF):
+    """ Read ``asv.conf.json`` (JSON with ``//`` comments and trailing commas) """
+    with open(fname) as f:
+        content = f.read()
+    # remove // comments, but not inside strings (URLs)
+    content = re.sub(
+        r'("(?:\\.|[^"\\])*")|//[^\n]*', lambda m: m.group(1) or "", content
+    )
+    content = re.sub(r",(\s*[}\]])", r"\1", content)
+    return json.loads(content)
+
+
+def read_versions(fname=VERSIONS_FILE):
+    """ RADIS versions (tags or commits) to benchmark, one per line """
+    with open(fname) as f:
+        return [l.strip() for l in f if l.strip() and not l.startswith("#")]
+
+
+def available_memory():
+    """ Available memory in bytes (Linux), or ``None`` if unknown """
+    try:
+        import psutil
+
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def available_cpus():
+    """ CPU cores this process may run on """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def plan_workers(n_versions, cpus, cores_per_job, mem_per_job, n_jobs=None):
+    """Number of parallel jobs, and the CPU cores of each job
+
+    Parameters
+    ----------
+    n_versions: int
+        number of versions to run
+    cpus: list of int
+        available CPU cores
+    cores_per_job: int
+        cores reserved per job
+    mem_per_job: float
+        memory reserved per job (bytes)
+    n_jobs: int, or ``None``
+        maximum number of jobs ; if ``None``, as many as CPUs and memory allow
+
+    Returns
+    -------
+    list of list of int: CPU cores of each worker
+    """
+    n = min(n_versions, len(cpus) // cores_per_job)
+    mem = available_memory()
+    if mem is not None:
+        n = min(n, int(mem // mem_per_job))
+    if n_jobs is not None:
+        n = min(n, n_jobs)
+    n = max(n, 1)
+    return [cpus[i * cores_per_job : (i + 1) * cores_per_job] or cpus for i in range(n)]
+
+
+def _cpu_list(cores):
+    """ asv / taskset CPU list, ex: ``0,1,2,3`` """
+    return ",".join(str(c) for c in cores)
+
+
+def write_worker_conf(conf, worker, results_dir):
+    """ asv config of one worker : own environments and results folder """
+    worker_conf = dict(conf)
+    worker_conf.update(
+        {
+            "env_dir": join(WORK_DIR, "env-{0}".format(worker)),
+            "results_dir": results_dir,
+            "html_dir": join(WORK_DIR, "html-{0}".format(worker)),
+            "benchmark_dir": join(ROOT, conf.get("benchmark_dir", "benchmarks")),
+            "repo": conf["repo"],
+        }
+    )
+    fconf = join(WORK_DIR, "asv-{0}.conf.json".format(worker))
+    with open(fconf, "w") as f:
+        json.dump(worker_conf, f, indent=4)
+    return fconf
+
+
+def seed_results(main_results, worker_results):
+    """ Copy existing results in the worker folder, so that asv skips benchmarks already done """
+    if exists(main_results):
+        shutil.copytree(main_results, worker_results, dirs_exist_ok=True)
+    else:
+        os.makedirs(worker_results, exist_ok=True)
+
+
+def merge_results(worker_results, main_results, since):
+    """Merge results of a worker into the main results folder
+
+    Only files written by the worker (modified after ``since``) are copied, so
+    that results of other workers are never overwritten by stale copies.
+    ``benchmarks.json`` files are merged key by key.
+
+    Returns
+    -------
+    list of str: merged files
+    """
+    merged = []
+    for dirpath, _, filenames in os.walk(worker_results):
+        for fname in filenames:
+            src = join(dirpath, fname)
+            if os.path.getmtime(src) < since:
+                continue
+            dst = join(main_results, os.path.relpath(src, worker_results))
+            os.makedirs(dirname(dst), exist_ok=True)
+            if fname == "benchmarks.json" and exists(dst):
+                with open(dst) as f:
+                    benchmarks = json.load(f)
+                with open(src) as f:
+                    benchmarks.update(json.load(f))
+                with open(dst, "w") as f:
+                    json.dump(benchmarks, f, indent=4, sort_keys=True)
+            else:
+                shutil.copy2(src, dst)
+            merged.append(dst)
+    return merged
+
+
+def run_version(version, fconf, cores, log, asv_args=(), machine=None):
+    """ Run ``asv run`` on one RADIS version, pinned on ``cores`` """
+    cmd = [
+        sys.executable,
+        "-m",
+        "asv",
+        "run",
+        "{0}^!".format(version),
+        "--config",
+        fconf,
+        "--cpu-affinity",
+        _cpu_list(cores),
+        "--skip-existing-successful",
+    ]
+    if machine is not None:
+        cmd += ["--machine", machine]
+    cmd += list(asv_args)
+
+    def pin():
+        # environment creation & installation also stay on the worker cores
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+
+    with open(log, "w") as f:
+        f.write(" ".join(cmd) + "\n")
+        f.flush()
+        return subprocess.call(
+            cmd,
+            cwd=ROOT,
+            stdout=f,
+            stderr=subprocess.STDOUT,
+            preexec_fn=pin if os.name == "posix" else None,
+        )
+
+
+def run_versions(
+    versions,
+    n_jobs=None,
+    cores_per_job=4,
+    mem_per_job=8e9,
+    asv_args=(),
+    machine=None,
+    verbose=True,
+):
+    """Benchmark ``versions`` in parallel, and merge all results
+
+    Returns
+    -------
+    dict: return code of ``asv run`` for each version
+    """
+    conf = load_asv_conf()
+    main_results = join(ROOT, conf.get("results_dir", "results"))
+    workers = plan_workers(len(versions), available_cpus(), cores_per_job, mem_per_job, n_jobs)
+    if verbose:
+        print(
+            "Running {0} versions with {1} parallel jobs ({2} cores each)".format(
+                len(versions), len(workers), cores_per_job
+            )
+        )
+
+    os.makedirs(join(WORK_DIR, "logs"), exist_ok=True)
+    queue = Queue()
+    for v in versions:
+        queue.put(v)
+    status = {}
+    merge_lock = threading.Lock()
+
+    def work(worker, cores):
+        worker_results = join(WORK_DIR, "results-{0}".format(worker))
+        fconf = write_worker_conf(conf, worker, worker_results)
+        while True:
+            try:
+                version = queue.get_nowait()
+            except Empty:
+                return
+            with merge_lock:
+                seed_results(main_results, worker_results)
+            t0 = time.time()
+            log = join(WORK_DIR, "logs", "{0}.log".format(version))
+            if verbose:
+                print("[worker {0}, cpus {1}] {2} : started".format(worker, _cpu_list(cores), version))
+            status[version] = run_version(version, fconf, cores, log, asv_args, machine)
+            with merge_lock:
+                merge_results(worker_results, main_results, since=t0)
+            if verbose:
+                print(
+                    "[worker {0}] {1} : {2} in {3:.0f}s (log : {4})".format(
+                        worker,
+                        version,
+                        "done" if status[version] == 0 else "failed ({0})".format(status[version]),
+                        time.time() - t0,
+                        log,
+                    )
+                )
+
+    threads = [
+        threading.Thread(target=work, args=(i, cores)) for (i, cores) in enumerate(workers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "versions",
+        nargs="*",
+        help="RADIS tags or commits. Default : all of tested_radis_versions.txt",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="max parallel jobs")
+    parser.add_argument("--cores-per-job", type=int, default=4)
+    parser.add_argument(
+        "--mem-per-job", type=float, default=8, help="memory reserved per job (GB)"
+    )
+    parser.add_argument("--machine", default=None, help="asv machine name")
+    parser.add_argument("asv_args", nargs=argparse.REMAINDER, help="after --, passed to asv run")
+    args = parser.parse_args(argv)
+
+    asv_args = args.asv_args[1:] if args.asv_args[:1] == ["--"] else args.asv_args
+    status = run_versions(
+        args.versions or read_versions(),
+        n_jobs=args.jobs,
+        cores_per_job=args.cores_per_job,
+        mem_per_job=args.mem_per_job * 1e9,
+        asv_args=asv_args,
+        machine=args.machine,
+    )
+    return int(any(code != 0 for code in status.values()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())